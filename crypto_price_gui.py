@@ -6,14 +6,55 @@
 
 import customtkinter as ctk
 import threading
+from functools import partial
 import sys
 import os
 import time
 from datetime import datetime
 from tkinter import messagebox, filedialog
 from src.core import CoinGeckoPriceFetcher
-from src.utils import validate_date_range, save_to_csv, calculate_statistics
-from src.constants import COIN_LIST, COIN_MAPPING
+from src.utils import validate_date_range, load_from_csv, is_price_csv
+from src.constants import COIN_LIST, COIN_MAPPING, VS_CURRENCIES
+from src.storage import PriceStore
+from src.scheduler import PRIORITY_INTERACTIVE, PRIORITY_BATCH, PRIORITY_PREFETCH
+from src.batch import run_batch
+from src.keypool import parse_api_keys
+from src.gaps import repair_gaps
+from src.cancel import CancellationToken
+from src.resilience import STATE_CLOSED
+from src.export import ExportManifest, export_result_set
+from src.groups import load_groups, save_groups
+from src.watch import PriceWatcher
+from src.registry import CoinRegistry
+from src.portfolio import load_holdings, fetch_portfolio, save_portfolio_csv
+from src.fx import BASE_CURRENCY, series_key, parse_series_key
+from src.profiling import Profiler
+from src.logs import configure_logging, get_logger
+from src.session import load_session, save_session, unsettled_window
+from gui_widgets import PriceChart, VirtualTable, CoinMultiSelect
+
+
+# 幣種下拉選單的特殊選項
+ALL_COINS_OPTION = "全部 - All Coins"
+SELECTED_COINS_OPTION = "已勾選 - Selected Coins"
+HEDGE_PERCENTILE = 0.95  # 啟用 hedged request 時，請求超過近期延遲的此百分位仍未回應即送出重複請求
+
+log = get_logger('gui')
+
+
+def format_price(value, currency=None):
+    """
+    價格顯示文字
+    :param value: 價格（None 顯示 N/A）
+    :param currency: 計價貨幣（None 表示只顯示數字；USD 加上 $，其他貨幣加上代碼）
+    :return: 顯示文字；極小的價格（如 BTC 計價的小幣）改以科學記號顯示
+    """
+    if value is None:
+        return "N/A"
+    text = f"{value:,.8f}" if value == 0 or abs(value) >= 1e-4 else f"{value:.6e}"
+    if currency is None:
+        return text
+    return f"${text}" if currency == BASE_CURRENCY else f"{text} {currency.upper()}"
 
 
 class CryptoPriceGUI(ctk.CTk):
@@ -32,11 +73,43 @@ class CryptoPriceGUI(ctk.CTk):
 
         # 資料儲存
         self.prices_data = []
-        self.is_querying = False
-        self.is_batch_query_cancelled = False
+        self.current_query = None  # 目前顯示結果的 (coin_id, from_date, to_date)
+        self.result_set = []  # 可匯出的結果集 [(coin_id, from_date, to_date), ...]
+        self.export_token = None  # 匯出進行中的取消權杖
+        self.watch_token = None  # 即時監看的取消權杖
+        self.price_store = PriceStore()  # 本地價格儲存（預先計算區間統計）
+        self.coin_registry = CoinRegistry()  # 完整幣種目錄（背景載入快取並同步）
+        self.is_querying = False  # 單一幣種查詢進行中
+        self.is_batch_running = False  # 批量查詢進行中
+        self.batch_token = None  # 批量查詢的取消權杖（終止後等待中的請求立即中止）
+        self.is_repairing = False  # 缺漏修補進行中
+        self.is_portfolio_running = False  # 投資組合估值進行中
+        self.profile_enabled = False  # 查詢時記錄效能分析（由勾選框在主執行緒更新，背景執行緒只讀取）
+        self.hedge_percentile = None  # hedged request 門檻（None 表示不啟用，由勾選框開啟）
+
+        # 工作階段（下次啟動時由磁碟立即顯示）：清空畫面不會丟棄已儲存的結果
+        self.session_settings = {}  # 最近一次查詢的輸入設定（在主執行緒取得）
+        self.session_results = []  # 要保存的結果集 [(key, from_date, to_date), ...]
+        self.session_current = None  # 要保存的目前顯示結果
+        self.fetched_at = {}  # (key, from_date, to_date) -> 取得時間（epoch 秒），用於判斷哪些日期需要重新驗證
+
+        # 所有查詢共用同一 fetcher（同一排程器與 key 池）：互動查詢可插隊，批量查詢讓出 API 額度
+        self._fetcher = None
+        self._fetcher_keys = None
+        self._fetcher_lock = threading.Lock()
 
         # 建立 UI
         self.setup_ui()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # 在背景讀取上次的工作階段並顯示，再重新驗證尚未結算的最近幾天
+        threading.Thread(target=self.restore_session, daemon=True).start()
+
+        # 幣種目錄在背景載入與同步，不延遲啟動
+        self.coin_registry.start_background_refresh(
+            lambda: self.get_fetcher(None),
+            on_done=self.on_registry_synced
+        )
 
     def setup_ui(self):
         """建立 UI 元件"""
@@ -69,8 +142,8 @@ class CryptoPriceGUI(ctk.CTk):
         coin_label = ctk.CTkLabel(input_frame, text="選擇幣種：", font=ctk.CTkFont(size=14))
         coin_label.pack(pady=(5, 5), padx=20, anchor="w")
 
-        # 建立幣種選項列表（最前面加入「全部」選項）
-        coin_options = ["全部 - All Coins"] + [f"{coin['symbol']} - {coin['name']}" for coin in COIN_LIST]
+        # 建立幣種選項列表（最前面加入「全部」與「已勾選」選項）
+        coin_options = [ALL_COINS_OPTION, SELECTED_COINS_OPTION] + [f"{coin['symbol']} - {coin['name']}" for coin in COIN_LIST]
 
         self.coin_combobox = ctk.CTkComboBox(
             input_frame,
@@ -82,6 +155,43 @@ class CryptoPriceGUI(ctk.CTk):
         self.coin_combobox.pack(pady=(0, 10), padx=20, anchor="w")
         self.coin_combobox.set("BTC - Bitcoin")  # 預設值
 
+        # 多選幣種與具名群組（選擇「已勾選」時並行查詢勾選的幣種）
+        group_container = ctk.CTkFrame(input_frame, fg_color="transparent")
+        group_container.pack(pady=(0, 5), padx=20, anchor="w")
+
+        self.coin_groups = load_groups()
+        self.group_combobox = ctk.CTkComboBox(
+            group_container,
+            values=sorted(self.coin_groups) or ["（尚無群組）"],
+            command=self.on_group_selected,
+            width=200,
+            state="readonly"
+        )
+        self.group_combobox.set("選擇已儲存的群組")
+        self.group_combobox.pack(side="left")
+
+        save_group_button = ctk.CTkButton(group_container, text="💾 儲存群組", width=100,
+                                          command=self.on_save_group_clicked)
+        save_group_button.pack(side="left", padx=(10, 0))
+
+        delete_group_button = ctk.CTkButton(group_container, text="🗑️ 刪除群組", width=100,
+                                            command=self.on_delete_group_clicked)
+        delete_group_button.pack(side="left", padx=(10, 0))
+
+        self.coin_multiselect = CoinMultiSelect(input_frame, COIN_LIST, height=120,
+                                                on_change=self.on_coin_selection_changed,
+                                                search=self.coin_registry.search,
+                                                fg_color="transparent")
+        self.coin_multiselect.pack(fill="x", pady=(0, 5), padx=20)
+
+        self.selection_label = ctk.CTkLabel(
+            input_frame,
+            text="已勾選 0 個幣種",
+            font=ctk.CTkFont(size=12),
+            text_color="gray"
+        )
+        self.selection_label.pack(pady=(0, 10), padx=20, anchor="w")
+
         # 日期區間
         date_label = ctk.CTkLabel(input_frame, text="日期區間：", font=ctk.CTkFont(size=14))
         date_label.pack(pady=(10, 5), padx=20, anchor="w")
@@ -117,6 +227,20 @@ class CryptoPriceGUI(ctk.CTk):
         )
         self.to_date_entry.pack(side="left")
 
+        # 計價貨幣（非 USD 以 USD 價格乘上每日匯率換算，整批共用同一份匯率）
+        currency_label = ctk.CTkLabel(date_container, text="計價：", font=ctk.CTkFont(size=14))
+        currency_label.pack(side="left", padx=(20, 5))
+
+        self.currency_combobox = ctk.CTkComboBox(
+            date_container,
+            values=[currency.upper() for currency in VS_CURRENCIES],
+            width=90,
+            height=35,
+            state="readonly"
+        )
+        self.currency_combobox.set(BASE_CURRENCY.upper())
+        self.currency_combobox.pack(side="left")
+
         # 預設結束日期為昨天
         default_to = (datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) -
                      __import__('datetime').timedelta(days=1)).strftime("%Y-%m-%d")
@@ -137,7 +261,7 @@ class CryptoPriceGUI(ctk.CTk):
 
         self.api_key_entry = ctk.CTkEntry(
             input_frame,
-            placeholder_text="CoinGecko Pro API Key",
+            placeholder_text="CoinGecko Pro API Key（多把以逗號分隔，可加 :配額）",
             width=400,
             height=35,
             show="*"
@@ -150,7 +274,25 @@ class CryptoPriceGUI(ctk.CTk):
             font=ctk.CTkFont(size=12),
             text_color="gray"
         )
-        api_hint.pack(pady=(0, 15), padx=20, anchor="w")
+        api_hint.pack(pady=(0, 10), padx=20, anchor="w")
+
+        # 效能分析（記錄各階段耗時，查詢結束後輸出 trace 與彙總表）
+        self.profile_checkbox = ctk.CTkCheckBox(
+            input_frame,
+            text="📊 效能分析（trace 輸出至 ./profile，可用 ui.perfetto.dev 開啟）",
+            command=lambda: setattr(self, 'profile_enabled', bool(self.profile_checkbox.get())),
+            font=ctk.CTkFont(size=12)
+        )
+        self.profile_checkbox.pack(pady=(0, 5), padx=20, anchor="w")
+
+        # hedged request（慢請求時送出重複請求，重複請求同樣計入流量控制與 key 額度）
+        self.hedge_checkbox = ctk.CTkCheckBox(
+            input_frame,
+            text=f"⚡ 慢請求時送出重複請求（超過近期延遲 p{HEDGE_PERCENTILE * 100:g}，會多消耗 API 額度）",
+            command=self.on_hedge_toggled,
+            font=ctk.CTkFont(size=12)
+        )
+        self.hedge_checkbox.pack(pady=(0, 15), padx=20, anchor="w")
 
         # 查詢按鈕
         self.query_button = ctk.CTkButton(
@@ -160,7 +302,19 @@ class CryptoPriceGUI(ctk.CTk):
             height=40,
             font=ctk.CTkFont(size=16, weight="bold")
         )
-        self.query_button.pack(pady=(0, 15), padx=20)
+        self.query_button.pack(pady=(0, 10), padx=20)
+
+        # 終止批量查詢按鈕（批量查詢進行中仍可發起單一幣種查詢）
+        self.cancel_button = ctk.CTkButton(
+            input_frame,
+            text="🛑 終止查詢",
+            command=self.on_cancel_batch_query,
+            height=35,
+            fg_color="#8B0000",
+            hover_color="#A52A2A",
+            state="disabled"
+        )
+        self.cancel_button.pack(pady=(0, 15), padx=20)
 
         # ==================== 查詢結果區域 ====================
         result_frame = ctk.CTkFrame(main_container)
@@ -188,11 +342,29 @@ class CryptoPriceGUI(ctk.CTk):
         )
         self.progress_label.pack(pady=(0, 15), padx=20)
 
-        # 結果顯示區（使用 Textbox）
+        # 價格走勢圖（依寬度降採樣繪製；滾輪縮放、拖曳平移、雙擊還原）
+        self.price_chart = PriceChart(result_frame, height=220)
+        self.price_chart.pack(fill="x", pady=(0, 15), padx=20)
+
+        # 結果表格（虛擬化：只繪製可見列；點擊表頭排序）
+        self.result_table = VirtualTable(
+            result_frame,
+            columns=[
+                ("幣種", 150, None),
+                ("日期", 190, None),
+                ("價格", 190, format_price),
+                ("狀態", 80, None),
+            ],
+            missing_column=2,
+            height=240
+        )
+        self.result_table.pack(fill="x", pady=(0, 15), padx=20)
+
+        # 查詢摘要與訊息
         self.result_text = ctk.CTkTextbox(
             result_frame,
             width=640,
-            height=200,
+            height=150,
             font=ctk.CTkFont(family="Monaco", size=12)
         )
         self.result_text.pack(pady=(0, 15), padx=20)
@@ -225,6 +397,15 @@ class CryptoPriceGUI(ctk.CTk):
         )
         self.export_button.pack(side="left", padx=5)
 
+        self.repair_button = ctk.CTkButton(
+            action_container,
+            text="🩹 修補缺漏",
+            command=self.on_repair_clicked,
+            width=140,
+            height=35
+        )
+        self.repair_button.pack(side="left", padx=5)
+
         self.clear_button = ctk.CTkButton(
             action_container,
             text="🗑️ 清空",
@@ -234,6 +415,79 @@ class CryptoPriceGUI(ctk.CTk):
         )
         self.clear_button.pack(side="left", padx=5)
 
+        # ==================== 即時監看區域 ====================
+        watch_frame = ctk.CTkFrame(main_container)
+        watch_frame.pack(fill="x", pady=(10, 0))
+
+        watch_title = ctk.CTkLabel(
+            watch_frame,
+            text="即時監看（勾選的幣種，未勾選時為目前選擇的幣種）",
+            font=ctk.CTkFont(size=16, weight="bold")
+        )
+        watch_title.pack(pady=(10, 10), padx=20, anchor="w")
+
+        watch_controls = ctk.CTkFrame(watch_frame, fg_color="transparent")
+        watch_controls.pack(pady=(0, 10), padx=20, anchor="w")
+
+        ctk.CTkLabel(watch_controls, text="更新間隔（秒）：").pack(side="left")
+        self.watch_interval_entry = ctk.CTkEntry(watch_controls, width=80)
+        self.watch_interval_entry.insert(0, "30")
+        self.watch_interval_entry.pack(side="left", padx=(0, 10))
+
+        self.watch_button = ctk.CTkButton(
+            watch_controls,
+            text="👁 開始監看",
+            command=self.on_watch_clicked,
+            width=140
+        )
+        self.watch_button.pack(side="left")
+
+        # 只更新有變動的幣種
+        self.watch_table = VirtualTable(
+            watch_frame,
+            columns=[
+                ("幣種", 150, None),
+                ("更新時間", 120, None),
+                ("價格", 200, format_price),
+                ("變動", 120, lambda v: f"{v:+.4f}%" if v is not None else "---"),
+            ],
+            height=160
+        )
+        self.watch_table.pack(fill="x", pady=(0, 15), padx=20)
+
+        # ==================== 投資組合區域 ====================
+        portfolio_frame = ctk.CTkFrame(main_container)
+        portfolio_frame.pack(fill="x", pady=(10, 0))
+
+        portfolio_title = ctk.CTkLabel(
+            portfolio_frame,
+            text="投資組合估值（持倉檔：coin_id,quantity[,date]，使用上方日期區間）",
+            font=ctk.CTkFont(size=16, weight="bold")
+        )
+        portfolio_title.pack(pady=(10, 10), padx=20, anchor="w")
+
+        portfolio_controls = ctk.CTkFrame(portfolio_frame, fg_color="transparent")
+        portfolio_controls.pack(pady=(0, 15), padx=20, anchor="w")
+
+        self.holdings_entry = ctk.CTkEntry(
+            portfolio_controls,
+            width=300,
+            placeholder_text="持倉檔路徑（.csv 或 .json）"
+        )
+        self.holdings_entry.pack(side="left")
+
+        browse_button = ctk.CTkButton(portfolio_controls, text="📂 選擇", width=80,
+                                      command=self.on_browse_holdings_clicked)
+        browse_button.pack(side="left", padx=(10, 0))
+
+        self.portfolio_button = ctk.CTkButton(
+            portfolio_controls,
+            text="💼 計算估值",
+            command=self.on_portfolio_clicked,
+            width=120
+        )
+        self.portfolio_button.pack(side="left", padx=(10, 0))
+
         # ==================== 狀態列 ====================
         self.status_label = ctk.CTkLabel(
             main_container,
@@ -268,6 +522,26 @@ class CryptoPriceGUI(ctk.CTk):
 
         return card
 
+    def on_hedge_toggled(self):
+        """hedged request 勾選框變更：立即套用到共用的 fetcher（之後送出的請求生效）"""
+        self.hedge_percentile = HEDGE_PERCENTILE if self.hedge_checkbox.get() else None
+        with self._fetcher_lock:
+            if self._fetcher is not None:
+                self._fetcher.hedge_percentile = self.hedge_percentile
+
+    def get_fetcher(self, api_key_text):
+        """
+        取得共用的 fetcher（API key 變更時重新建立）
+        :param api_key_text: API key 輸入字串
+        :return: CoinGeckoPriceFetcher
+        """
+        keys = parse_api_keys(api_key_text)
+        with self._fetcher_lock:
+            if self._fetcher is None or keys != self._fetcher_keys:
+                self._fetcher = CoinGeckoPriceFetcher(api_key=keys or None, hedge_percentile=self.hedge_percentile)
+                self._fetcher_keys = keys
+            return self._fetcher
+
     def on_query_clicked(self):
         """查詢按鈕點擊事件"""
         if self.is_querying:
@@ -285,24 +559,38 @@ class CryptoPriceGUI(ctk.CTk):
             messagebox.showerror("錯誤", "請輸入日期區間")
             return
 
-        # 驗證日期範圍
+        # 驗證日期範圍與 API key 格式
         try:
             validate_date_range(from_date, to_date)
+            parse_api_keys(api_key)
         except ValueError as e:
             messagebox.showerror("錯誤", str(e))
             return
+        self.session_settings = self.get_session_settings()
 
-        # 檢查是否選擇批量查詢
-        if selected_coin == "全部 - All Coins":
-            # 批量查詢所有幣種
+        # 檢查是否選擇批量查詢（全部或已勾選的幣種）
+        if selected_coin in (ALL_COINS_OPTION, SELECTED_COINS_OPTION):
+            if self.is_batch_running:
+                messagebox.showwarning("警告", "批量查詢進行中，請稍候或先終止查詢")
+                return
+
+            if selected_coin == ALL_COINS_OPTION:
+                coin_ids = [coin['id'] for coin in COIN_LIST]
+            else:
+                coin_ids = self.coin_multiselect.get_selected()
+                if not coin_ids:
+                    messagebox.showerror("錯誤", "請先勾選要查詢的幣種")
+                    return
+
+            # 並行查詢選擇的幣種
             thread = threading.Thread(
                 target=self.perform_batch_query,
-                args=(from_date, to_date, api_key),
+                args=(coin_ids, from_date, to_date, api_key, self.get_vs_currency()),
                 daemon=True
             )
             thread.start()
         else:
-            # 單一幣種查詢
+            # 單一幣種查詢（批量查詢進行中也可執行，排程器會讓它優先發送）
             coin_id = COIN_MAPPING.get(selected_coin, None)
             if not coin_id:
                 messagebox.showerror("錯誤", "請選擇幣種")
@@ -310,33 +598,294 @@ class CryptoPriceGUI(ctk.CTk):
 
             thread = threading.Thread(
                 target=self.perform_query,
-                args=(coin_id, from_date, to_date, api_key),
+                args=(coin_id, from_date, to_date, api_key, self.get_vs_currency()),
                 daemon=True
             )
             thread.start()
 
-    def perform_query(self, coin_id, from_date, to_date, api_key):
+    def on_watch_clicked(self):
+        """開始/停止即時監看"""
+        if self.watch_token is not None:
+            self.watch_token.cancel()
+            return
+
+        coin_ids = self.coin_multiselect.get_selected()
+        if not coin_ids:
+            selected_coin = self.coin_combobox.get()
+            if selected_coin == ALL_COINS_OPTION:
+                coin_ids = [coin['id'] for coin in COIN_LIST]
+            elif COIN_MAPPING.get(selected_coin):
+                coin_ids = [COIN_MAPPING[selected_coin]]
+        if not coin_ids:
+            messagebox.showerror("錯誤", "請選擇或勾選要監看的幣種")
+            return
+
+        api_key = self.api_key_entry.get().strip() or None
+        try:
+            interval = float(self.watch_interval_entry.get().strip())
+        except ValueError:
+            messagebox.showerror("錯誤", "更新間隔必須是數字")
+            return
+        try:
+            watcher = PriceWatcher(self.get_fetcher(api_key), coin_ids, interval=interval,
+                                   vs_currency=self.get_vs_currency())
+        except ValueError as e:
+            messagebox.showerror("錯誤", str(e))
+            return
+
+        self.watch_token = token = CancellationToken()
+        self.watch_button.configure(text="⏹ 停止監看")
+        thread = threading.Thread(target=self.perform_watch, args=(watcher, token), daemon=True)
+        thread.start()
+
+    def perform_watch(self, watcher, token):
+        """即時監看迴圈（在背景執行緒）；共用 fetcher，輪詢間保持連線與流量控制狀態"""
+        rows = {}  # coin_id -> 表格列索引
+
+        def on_changes(changes):
+            now = datetime.now().strftime("%H:%M:%S")
+            new_rows = []
+            updates = {}
+            for change in changes:
+                coin_id = change['coin_id']
+                row = (f"{self.coin_registry.symbol(coin_id)} ({coin_id})", now, change['price'], change['change_pct'])
+                if coin_id in rows:
+                    updates[rows[coin_id]] = row
+                else:
+                    rows[coin_id] = len(rows)
+                    new_rows.append(row)
+
+            def apply():
+                if new_rows:
+                    self.watch_table.append_rows(new_rows)
+                if updates:
+                    self.watch_table.update_rows(updates)
+                self.update_status(f"監看更新 {now}：{len(changes)} 個幣種價格變動")
+            self.after(0, apply)
+
+        self.after(0, lambda: self.watch_table.clear())
+        self.after(0, lambda n=len(watcher.coin_ids), i=watcher.interval:
+                  self.update_status(f"開始監看 {n} 個幣種（每 {i:g} 秒）..."))
+        try:
+            watcher.run(on_changes, cancellation_check=token)
+        except Exception as e:
+            self.after(0, lambda err=str(e): messagebox.showerror("錯誤", f"監看時發生錯誤：{err}"))
+        finally:
+            self.watch_token = None
+            self.after(0, lambda: self.watch_button.configure(text="👁 開始監看"))
+            self.after(0, lambda: self.update_status("已停止監看"))
+
+    def on_browse_holdings_clicked(self):
+        """選擇持倉檔"""
+        path = filedialog.askopenfilename(
+            title="選擇持倉檔",
+            filetypes=[("CSV files", "*.csv"), ("JSON files", "*.json"), ("All files", "*.*")]
+        )
+        if path:
+            self.holdings_entry.delete(0, "end")
+            self.holdings_entry.insert(0, path)
+
+    def on_portfolio_clicked(self):
+        """計算估值按鈕點擊事件"""
+        if self.is_portfolio_running:
+            messagebox.showwarning("警告", "投資組合估值進行中，請稍候...")
+            return
+
+        holdings_path = self.holdings_entry.get().strip()
+        from_date = self.from_date_entry.get().strip()
+        to_date = self.to_date_entry.get().strip()
+        api_key = self.api_key_entry.get().strip() or None
+
+        if not holdings_path:
+            messagebox.showerror("錯誤", "請選擇持倉檔")
+            return
+        if not from_date or not to_date:
+            messagebox.showerror("錯誤", "請輸入開始日期和結束日期")
+            return
+
+        try:
+            validate_date_range(from_date, to_date)
+            parse_api_keys(api_key)
+            holdings = load_holdings(holdings_path)
+        except ValueError as e:
+            messagebox.showerror("錯誤", str(e))
+            return
+
+        thread = threading.Thread(target=self.perform_portfolio,
+                                  args=(holdings, from_date, to_date, api_key, self.get_vs_currency()),
+                                  daemon=True)
+        thread.start()
+
+    def perform_portfolio(self, holdings, from_date, to_date, api_key, vs_currency=BASE_CURRENCY):
+        """並行查詢持倉幣種並計算每日市值與損益（在背景執行緒）"""
+        self.is_portfolio_running = True
+        self.after(0, lambda: self.portfolio_button.configure(state="disabled", text="計算中..."))
+        self.after(0, self.disable_export)
+        self.after(0, lambda: self.result_text.delete("1.0", "end"))
+        self.after(0, lambda: self.result_table.clear())
+        self.after(0, lambda: self.progress_bar.set(0))
+        self.after(0, lambda n=len(holdings): self.update_status(f"投資組合估值：查詢 {n} 個幣種..."))
+
+        try:
+            fetcher = self.get_fetcher(api_key)
+            total = len(holdings)
+            completed = 0
+
+            def on_coin_done(coin_id, prices, elapsed, error):
+                nonlocal completed
+                completed += 1
+                if prices:
+                    self.price_store.update(series_key(coin_id, vs_currency), prices)
+                self.after(0, lambda p=completed / total: self.progress_bar.set(p))
+                self.after(0, lambda i=completed, c=coin_id:
+                          self.progress_label.configure(text=f"已完成 {c} ({i}/{total})"))
+
+            valuation, prices_by_coin = fetch_portfolio(fetcher, holdings, from_date, to_date,
+                                                        on_result=on_coin_done, priority=PRIORITY_BATCH,
+                                                        vs_currency=vs_currency)
+            summary = valuation.summary()
+
+            # 與批量查詢的價格 CSV 分開存放（修補缺漏只掃描 ./csv_file 中的價格 CSV）
+            output_dir = "./csv_file/portfolio"
+            os.makedirs(output_dir, exist_ok=True)
+            output_file = save_portfolio_csv(valuation, os.path.join(output_dir, f"portfolio_{from_date}_{to_date}.csv"))
+
+            # 總市值走勢圖
+            series = [{'date': row['date'], 'price': row['value']} for row in valuation.to_rows()]
+            self.after(0, lambda: self.price_chart.set_series(series, title="投資組合市值"))
+
+            # 各幣種期末市值、權重與損益
+            rows = []
+            for coin_id, coin in summary['coins'].items():
+                status = "✗ 失敗" if not prices_by_coin.get(coin_id) else (
+                    f"{coin['weight'] * 100:.1f}%" if coin['weight'] is not None else "---")
+                rows.append((f"{self.coin_registry.symbol(coin_id)} ({coin_id})", f"{from_date} ~ {to_date}",
+                             coin['value'] if prices_by_coin.get(coin_id) else None, status))
+            self.after(0, lambda: self.result_table.set_rows(rows))
+
+            text = f"{'='*60}\n投資組合估值 {from_date} ~ {to_date}\n{'='*60}\n"
+            text += f"期初市值：{format_price(summary['start_value'], vs_currency)}\n"
+            text += f"期末市值：{format_price(summary['end_value'], vs_currency)}\n"
+            return_pct = f"（{summary['return_pct']:+.2f}%）" if summary['return_pct'] is not None else ""
+            text += f"損益：{format_price(summary['pnl'], vs_currency)}{return_pct}\n\n各幣種損益：\n"
+            for coin_id, coin in summary['coins'].items():
+                text += f"  - {coin_id}: 數量 {coin['quantity']:g}，損益 {format_price(coin['pnl'], vs_currency)}\n"
+            failed = [coin_id for coin_id, prices in prices_by_coin.items() if not prices]
+            if failed:
+                text += f"\n⚠️  查詢失敗（以 0 計值）：{', '.join(failed)}\n"
+            text += f"\n已儲存至：{output_file}\n"
+            self.after(0, lambda: self.result_text.insert("end", text))
+
+            # 查詢成功的幣種成為可匯出的結果集
+            self.result_set = [(series_key(coin_id, vs_currency), from_date, to_date)
+                               for coin_id, prices in prices_by_coin.items() if prices]
+            self.current_query = None
+            if self.result_set:
+                self.after(0, lambda: self.export_button.configure(state="normal"))
+            self.after(0, lambda: self.update_status(
+                f"投資組合估值完成！期末市值 {format_price(summary['end_value'], vs_currency)}"))
+
+        except Exception as e:
+            self.after(0, lambda err=str(e): messagebox.showerror("錯誤", f"投資組合估值時發生錯誤：{err}"))
+            self.after(0, lambda: self.update_status("投資組合估值失敗"))
+
+        finally:
+            self.is_portfolio_running = False
+            self.after(0, lambda: self.portfolio_button.configure(state="normal", text="💼 計算估值"))
+            self.after(0, lambda: self.progress_bar.set(1.0))
+
+    def on_registry_synced(self, diff):
+        """幣種目錄背景同步完成（在背景執行緒）"""
+        if diff is not None:
+            self.after(0, lambda: self.update_status(f"幣種目錄已同步：共 {len(self.coin_registry)} 個幣種"))
+
+    def on_coin_selection_changed(self, coin_ids):
+        """多選清單變動：更新計數，有勾選時切換到「已勾選」查詢"""
+        self.selection_label.configure(text=f"已勾選 {len(coin_ids)} 個幣種")
+        if coin_ids:
+            self.coin_combobox.set(SELECTED_COINS_OPTION)
+
+    def on_group_selected(self, name):
+        """選擇已儲存的群組：套用其幣種勾選"""
+        if name in self.coin_groups:
+            self.coin_multiselect.set_selected(self.coin_groups[name])
+            self.update_status(f"已套用群組「{name}」（{len(self.coin_groups[name])} 個幣種）")
+
+    def on_save_group_clicked(self):
+        """將目前勾選的幣種儲存為具名群組"""
+        coin_ids = self.coin_multiselect.get_selected()
+        if not coin_ids:
+            messagebox.showwarning("警告", "請先勾選要加入群組的幣種")
+            return
+
+        name = ctk.CTkInputDialog(text="群組名稱：", title="儲存群組").get_input()
+        name = (name or "").strip()
+        if not name:
+            return
+
+        groups = dict(self.coin_groups, **{name: coin_ids})
+        try:
+            save_groups(groups)
+        except Exception as e:
+            messagebox.showerror("錯誤", f"儲存群組失敗：{e}")
+            return
+        self.coin_groups = groups
+        self.group_combobox.configure(values=sorted(groups))
+        self.group_combobox.set(name)
+        self.update_status(f"已儲存群組「{name}」（{len(coin_ids)} 個幣種）")
+
+    def on_delete_group_clicked(self):
+        """刪除目前選擇的群組"""
+        name = self.group_combobox.get()
+        if name not in self.coin_groups:
+            messagebox.showwarning("警告", "請先選擇要刪除的群組")
+            return
+        if not messagebox.askyesno("確認", f"確定要刪除群組「{name}」？"):
+            return
+
+        groups = {k: v for k, v in self.coin_groups.items() if k != name}
+        try:
+            save_groups(groups)
+        except Exception as e:
+            messagebox.showerror("錯誤", f"刪除群組失敗：{e}")
+            return
+        self.coin_groups = groups
+        self.group_combobox.configure(values=sorted(groups) or ["（尚無群組）"])
+        self.group_combobox.set("選擇已儲存的群組")
+        self.update_status(f"已刪除群組「{name}」")
+
+    def perform_query(self, coin_id, from_date, to_date, api_key, vs_currency=BASE_CURRENCY):
         """執行查詢（在背景執行緒）"""
         self.is_querying = True
+        profiler = self.start_profiling()
+
+        # 更新 UI（在主執行緒）
+        # 批量查詢進行中時，進度條與結果區由批量查詢使用
+        during_batch = self.is_batch_running
 
         # 更新 UI（在主執行緒）
         self.after(0, lambda: self.query_button.configure(state="disabled", text="查詢中..."))
-        self.after(0, lambda: self.export_button.configure(state="disabled"))
-        self.after(0, lambda: self.result_text.delete("1.0", "end"))
-        self.after(0, lambda: self.progress_bar.set(0))
+        if not during_batch:
+            self.after(0, self.disable_export)
+            self.after(0, lambda: self.result_text.delete("1.0", "end"))
+            self.after(0, lambda: self.result_table.clear())
+            self.after(0, lambda: self.progress_bar.set(0))
+            self.after(0, lambda: self.price_chart.set_series([], title=coin_id))
         self.after(0, lambda: self.update_status(f"正在查詢 {coin_id}..."))
 
         try:
-            # 建立 fetcher
-            fetcher = CoinGeckoPriceFetcher(api_key=api_key)
+            # 取得共用 fetcher（共用排程器與 key 池）
+            fetcher = self.get_fetcher(api_key)
 
-            # 查詢價格
+            # 查詢價格（互動優先等級）
             prices = fetcher.get_range_prices(
                 coin_id,
                 from_date,
                 to_date,
                 debug=False,
-                progress_callback=self.update_progress
+                progress_callback=None if during_batch else partial(self.update_progress, currency=vs_currency),
+                priority=PRIORITY_INTERACTIVE,
+                vs_currency=vs_currency
             )
 
             if not prices:
@@ -345,11 +894,24 @@ class CryptoPriceGUI(ctk.CTk):
                 return
 
             # 儲存資料
+            # 非 USD 的結果以 coin_id@貨幣 為鍵值儲存與匯出
+            key = series_key(coin_id, vs_currency)
+            # 顯示與匯出合併後的資料（本次缺漏的日期沿用已儲存的價格，與區間統計一致）
+            prices = self.price_store.update(key, prices)
             self.prices_data = prices
+            self.current_query = self.session_current = (key, from_date, to_date)
+            self.fetched_at[self.current_query] = time.time()
+            if not during_batch:
+                self.result_set = [self.current_query]
+                self.session_results = [self.current_query]
+            elif self.current_query not in self.session_results:
+                self.session_results.append(self.current_query)
+            self.save_session()
 
             # 顯示結果
-            self.after(0, lambda: self.display_results(prices, coin_id, from_date, to_date))
-            self.after(0, lambda: self.export_button.configure(state="normal"))
+            self.after(0, lambda: self.display_results(prices, key, from_date, to_date, clear=not during_batch))
+            if not during_batch:
+                self.after(0, lambda: self.export_button.configure(state="normal"))
             self.after(0, lambda: self.update_status(f"查詢完成！取得 {len(prices)} 天的資料"))
 
         except Exception as e:
@@ -358,115 +920,137 @@ class CryptoPriceGUI(ctk.CTk):
 
         finally:
             self.is_querying = False
+            self.finish_profiling(profiler)
             self.after(0, lambda: self.query_button.configure(state="normal", text="🔍 開始查詢"))
 
     def on_cancel_batch_query(self):
         """終止批量查詢"""
-        self.is_batch_query_cancelled = True
-        self.after(0, lambda: self.query_button.configure(text="正在終止...", state="disabled"))
+        if self.batch_token is not None:
+            self.batch_token.cancel()
+        self.after(0, lambda: self.cancel_button.configure(text="正在終止...", state="disabled"))
         self.after(0, lambda: self.update_status("正在終止批量查詢..."))
 
-    def perform_batch_query(self, from_date, to_date, api_key):
-        """批量查詢所有幣種（在背景執行緒）"""
-        self.is_querying = True
-        self.is_batch_query_cancelled = False  # 重置終止標誌
+    def perform_batch_query(self, coin_ids, from_date, to_date, api_key, vs_currency=BASE_CURRENCY):
+        """批量查詢多個幣種（在背景執行緒），每個幣種完成即顯示結果與耗時"""
+        self.is_batch_running = True
+        token = self.batch_token = CancellationToken()
+        profiler = self.start_profiling()
 
         # 更新 UI
-        self.after(0, lambda: self.query_button.configure(state="normal", text="🛑 終止查詢", command=self.on_cancel_batch_query))
-        self.after(0, lambda: self.export_button.configure(state="disabled"))
+        self.after(0, lambda: self.cancel_button.configure(state="normal", text="🛑 終止查詢"))
+        self.after(0, self.disable_export)
         self.after(0, lambda: self.result_text.delete("1.0", "end"))
+        self.after(0, lambda: self.result_table.clear())
         self.after(0, lambda: self.progress_bar.set(0))
 
         # 創建輸出目錄
         output_dir = "./csv_file"
         try:
             os.makedirs(output_dir, exist_ok=True)
+            manifest = ExportManifest(output_dir)  # 內容未變動的 CSV 不重寫
         except Exception as e:
             self.after(0, lambda: messagebox.showerror("錯誤", f"無法創建目錄 {output_dir}：{e}"))
-            self.is_querying = False
-            self.after(0, lambda: self.query_button.configure(state="normal", text="🔍 開始查詢"))
+            self.is_batch_running = False
+            self.finish_profiling(profiler)
+            self.after(0, lambda: self.cancel_button.configure(state="disabled", text="🛑 終止查詢"))
             return
 
         # 初始化統計
-        total_coins = len(COIN_LIST)
+        total_coins = len(coin_ids)
         success_count = 0
         failed_coins = []
+        exported = []
 
         self.after(0, lambda: self.update_status(f"開始批量查詢 {total_coins} 個幣種..."))
 
         try:
-            # 建立 fetcher
-            fetcher = CoinGeckoPriceFetcher(api_key=api_key)
+            # 取得共用 fetcher（併發數與請求間隔由排程器控制，請求分散到各 API key）
+            fetcher = self.get_fetcher(api_key)
+
+            completed = 0
+
+            def on_coin_done(coin_id, prices, elapsed, error):
+                """單一幣種完成（依完成順序回調）"""
+                nonlocal completed, success_count
+                if token.cancelled:
+                    return
 
-            # 遍歷所有幣種
-            for index, coin in enumerate(COIN_LIST, start=1):
-                # 檢查是否被取消
-                if self.is_batch_query_cancelled:
-                    self.after(0, lambda: self.result_text.insert("end", f"\n⚠️  批量查詢已被使用者終止\n"))
-                    break
+                completed += 1
+                coin_symbol = self.coin_registry.symbol(coin_id)
+                key = series_key(coin_id, vs_currency)
 
-                coin_id = coin['id']
-                coin_symbol = coin['symbol']
+                def add_row(avg, status):
+                    row = (f"{coin_symbol} ({key})", f"{from_date} ~ {to_date}", avg, status)
+                    self.after(0, lambda: self.result_table.append_rows([row]))
 
-                # 更新進度
-                progress = index / total_coins
+                # 更新進度與目前的自適應併發上限
+                limit = fetcher.scheduler.max_concurrent
+                progress = completed / total_coins
                 self.after(0, lambda p=progress: self.progress_bar.set(p))
-                self.after(0, lambda i=index, t=total_coins, s=coin_symbol:
-                          self.progress_label.configure(text=f"正在查詢 {s} ({i}/{t})..."))
-                self.after(0, lambda i=index, t=total_coins, s=coin_symbol:
-                          self.update_status(f"查詢 {s} ({i}/{t})..."))
+                self.after(0, lambda i=completed, t=total_coins, s=coin_symbol, lim=limit:
+                          self.progress_label.configure(text=f"已完成 {s} ({i}/{t})｜目前併發上限 {lim}"))
+                self.after(0, lambda i=completed, t=total_coins:
+                          self.update_status(f"批量查詢中 ({i}/{t})..."))
 
-                try:
-                    # 查詢價格（傳遞取消檢查函數）
-                    prices = fetcher.get_range_prices(
-                        coin_id,
-                        from_date,
-                        to_date,
-                        debug=False,
-                        progress_callback=None,  # 批量查詢時不顯示單個幣種的進度
-                        cancellation_check=lambda: self.is_batch_query_cancelled
-                    )
-
-                    # 檢查查詢後是否被取消
-                    if self.is_batch_query_cancelled:
-                        self.after(0, lambda: self.result_text.insert("end", f"\n⚠️  批量查詢已被使用者終止\n"))
-                        break
-
-                    if prices:
-                        # 保存 CSV
-                        output_file = os.path.join(output_dir, f"{coin_id}_{from_date}_{to_date}.csv")
-                        save_to_csv(prices, coin_id, from_date, to_date, output_file=output_file)
-                        success_count += 1
-
-                        # 計算平均價格
-                        stats = calculate_statistics(prices)
-                        if stats['avg'] is not None:
-                            # 在結果區域顯示平均價格
-                            self.after(0, lambda s=coin_symbol, cid=coin_id, avg=stats['avg']:
-                                      self.result_text.insert("end", f"✓ {s} ({cid}) - 平均價格: ${avg:.8f}\n"))
-                        else:
-                            # 無有效價格數據
-                            self.after(0, lambda s=coin_symbol, cid=coin_id:
-                                      self.result_text.insert("end", f"✗ {s} ({cid}) - NaN\n"))
-                    else:
-                        failed_coins.append(f"{coin_symbol} ({coin_id})")
-                        self.after(0, lambda s=coin_symbol, cid=coin_id:
-                                  self.result_text.insert("end", f"✗ {s} ({cid}) - NaN\n"))
+                if error is not None:
+                    failed_coins.append(f"{coin_symbol} ({coin_id}): {str(error)}")
+                    add_row(None, "✗ 失敗")
+                    return
+
+                if not prices:
+                    failed_coins.append(f"{coin_symbol} ({coin_id})")
+                    add_row(None, "✗ 失敗")
+                    return
 
+                try:
+                    # 寫入本地儲存，統計資訊直接由預先計算的索引取得（CSV 寫入合併後的資料，與統計一致）
+                    prices = self.price_store.update(key, prices)
+                    stats = self.price_store.range_statistics(key, from_date, to_date)
+
+                    # 保存 CSV（與上次內容相同時略過）
+                    manifest.export(prices, key, from_date, to_date, stats=stats, currency=vs_currency)
+                    success_count += 1
+                    exported.append((key, from_date, to_date))
+                    self.fetched_at[(key, from_date, to_date)] = time.time()
                 except Exception as e:
                     failed_coins.append(f"{coin_symbol} ({coin_id}): {str(e)}")
-                    self.after(0, lambda s=coin_symbol, cid=coin_id:
-                              self.result_text.insert("end", f"✗ {s} ({cid}) - NaN\n"))
+                    add_row(None, "✗ 失敗")
+                    return
+
+                # 在結果表格顯示平均價格（無有效價格數據時為 N/A）
+                add_row(stats['avg'], f"✓ {elapsed:.1f}s" if stats['avg'] is not None else "✗ 無資料")
 
-                # 每次查詢後延遲 0.5 秒，避免 API 限制
-                if index < total_coins:  # 最後一個不需要延遲
-                    time.sleep(0.5)
+            # 並行查詢所有幣種（實際併發數由排程器依 429/延遲回饋動態調整）
+            run_batch(
+                fetcher,
+                coin_ids,
+                from_date,
+                to_date,
+                on_result=on_coin_done,
+                cancellation_check=token,
+                priority=PRIORITY_BATCH,
+                vs_currency=vs_currency
+            )
+
+            # 記錄各檔案的內容雜湊，供下次比對
+            manifest.save()
+
+            # 成功的幣種成為可匯出的結果集
+            self.result_set = exported
+            if exported:
+                self.session_results = list(exported)
+                self.session_current = None
+                self.save_session()
+                self.after(0, lambda: self.export_button.configure(state="normal"))
+
+            if token.cancelled:
+                self.after(0, lambda: self.result_text.insert("end", f"\n⚠️  批量查詢已被使用者終止\n"))
 
             # 顯示統計摘要
             failed_count = len(failed_coins)
             summary = f"\n{'='*60}\n"
 
-            if self.is_batch_query_cancelled:
+            if token.cancelled:
                 summary += f"批量查詢已終止\n"
             else:
                 summary += f"批量查詢完成\n"
@@ -475,15 +1059,32 @@ class CryptoPriceGUI(ctk.CTk):
             summary += f"成功：{success_count} 個幣種\n"
             summary += f"失敗：{failed_count} 個幣種\n"
             summary += f"輸出目錄：{output_dir}\n"
+            summary += f"變動檔案：{len(manifest.changed)} 個（內容未變動略過 {len(manifest.unchanged)} 個）\n"
+            for filename in manifest.changed:
+                summary += f"  * {filename}\n"
 
             if failed_coins:
                 summary += f"\n失敗清單：\n"
                 for failed in failed_coins:
                     summary += f"  - {failed}\n"
 
+            # 上游持續故障時斷路器開啟，剩餘幣種已快速失敗
+            open_endpoints = [name for name, breaker in fetcher.breakers.items() if breaker.state != STATE_CLOSED]
+            if open_endpoints:
+                summary += f"\n⚠️  API 暫時無法使用（斷路器開啟：{', '.join(open_endpoints)}），請稍後再試\n"
+
+            # 每把 API key 的使用情況
+            key_usage = fetcher.get_key_usage()
+            if key_usage:
+                summary += f"\nAPI key 使用情況：\n"
+                for usage in key_usage:
+                    quota = usage['quota'] if usage['quota'] is not None else '∞'
+                    summary += (f"  - {usage['key']} [{usage['status']}] 請求 {usage['used']}/{quota}，"
+                                f"成功 {usage['succeeded']}，429 {usage['throttled']} 次，錯誤 {usage['errors']} 次\n")
+
             self.after(0, lambda s=summary: self.result_text.insert("end", s))
 
-            if self.is_batch_query_cancelled:
+            if token.cancelled:
                 self.after(0, lambda sc=success_count, tc=total_coins:
                           self.update_status(f"批量查詢已終止！已完成 {sc}/{tc} 個幣種"))
                 # 顯示終止提示
@@ -501,27 +1102,129 @@ class CryptoPriceGUI(ctk.CTk):
             self.after(0, lambda: self.update_status("批量查詢失敗"))
 
         finally:
-            self.is_querying = False
-            self.after(0, lambda: self.query_button.configure(state="normal", text="🔍 開始查詢", command=self.on_query_clicked))
+            self.is_batch_running = False
+            self.finish_profiling(profiler)
+            self.after(0, lambda: self.cancel_button.configure(state="disabled", text="🛑 終止查詢"))
             self.after(0, lambda: self.progress_bar.set(1.0))
 
-    def update_progress(self, current, total, date, price, success):
+    def on_repair_clicked(self):
+        """修補缺漏按鈕點擊事件"""
+        if self.is_repairing:
+            messagebox.showwarning("警告", "缺漏修補進行中，請稍候...")
+            return
+
+        api_key = self.api_key_entry.get().strip() or None
+        try:
+            parse_api_keys(api_key)
+        except ValueError as e:
+            messagebox.showerror("錯誤", str(e))
+            return
+
+        thread = threading.Thread(target=self.perform_repair, args=(api_key,), daemon=True)
+        thread.start()
+
+    def perform_repair(self, api_key):
+        """修補目前結果與批量輸出 CSV 中缺少的日期（在背景執行緒），只重新查詢缺漏區間"""
+        self.is_repairing = True
+        self.after(0, lambda: self.repair_button.configure(state="disabled", text="修補中..."))
+        self.after(0, lambda: self.update_status("正在檢查缺漏日期..."))
+
+        total_filled = 0
+        total_windows = 0
+        report = []
+
+        try:
+            fetcher = self.get_fetcher(api_key)
+
+            # 目前顯示的查詢結果
+            if self.prices_data and self.current_query:
+                key, from_date, to_date = self.current_query
+                coin_id, vs_currency = parse_series_key(key)
+                prices, filled, windows = repair_gaps(fetcher, coin_id, self.prices_data,
+                                                      priority=PRIORITY_INTERACTIVE, vs_currency=vs_currency)
+                if windows:
+                    total_filled += len(filled)
+                    total_windows += len(windows)
+                    report.append(f"{key}：補上 {len(filled)} 天（查詢 {len(windows)} 個區間）")
+                if filled:
+                    prices = self.price_store.update(key, prices)
+                    self.prices_data = prices
+                    self.after(0, lambda p=prices, c=key, f=from_date, t=to_date:
+                              self.display_results(p, c, f, t))
+
+            # 批量查詢輸出的 CSV（檔名格式 {coin_id}_{from_date}_{to_date}.csv，非 USD 為 {coin_id}@{貨幣}_...）
+            output_dir = "./csv_file"
+            filenames = sorted(os.listdir(output_dir)) if os.path.isdir(output_dir) else []
+            manifest = ExportManifest(output_dir) if filenames else None
+            for filename in filenames:
+                parts = filename[:-len(".csv")].rsplit('_', 2) if filename.endswith(".csv") else []
+                if len(parts) != 3:
+                    continue
+                path = os.path.join(output_dir, filename)
+                if not is_price_csv(path):
+                    continue  # 其他格式的 CSV（如舊版存放於此的投資組合估值）
+                key, from_date, to_date = parts
+                coin_id, vs_currency = parse_series_key(key)
+                try:
+                    prices, filled, windows = repair_gaps(fetcher, coin_id, load_from_csv(path),
+                                                          priority=PRIORITY_BATCH, vs_currency=vs_currency)
+                    if filled:
+                        prices = self.price_store.update(key, prices)
+                        stats = self.price_store.range_statistics(key, from_date, to_date)
+                        manifest.export(prices, key, from_date, to_date, filename=filename, stats=stats,
+                                        currency=vs_currency)
+                except Exception as e:
+                    report.append(f"{filename}：{e}")
+                    continue
+                if windows:
+                    total_filled += len(filled)
+                    total_windows += len(windows)
+                    report.append(f"{filename}：補上 {len(filled)} 天（查詢 {len(windows)} 個區間）")
+            if manifest is not None:
+                manifest.save()
+            if total_filled:
+                self.save_session()
+
+            if not report:
+                self.after(0, lambda: self.update_status("沒有需要修補的缺漏日期"))
+                return
+
+            summary = f"\n{'='*60}\n缺漏修補完成：共補上 {total_filled} 天，查詢 {total_windows} 個區間\n"
+            summary += "".join(f"  - {line}\n" for line in report)
+            self.after(0, lambda s=summary: self.result_text.insert("end", s))
+            self.after(0, lambda f=total_filled, w=total_windows:
+                      self.update_status(f"缺漏修補完成！補上 {f} 天（{w} 個區間）"))
+
+        except Exception as e:
+            self.after(0, lambda err=str(e): messagebox.showerror("錯誤", f"修補缺漏時發生錯誤：{err}"))
+            self.after(0, lambda: self.update_status("缺漏修補失敗"))
+
+        finally:
+            self.is_repairing = False
+            self.after(0, lambda: self.repair_button.configure(state="normal", text="🩹 修補缺漏"))
+
+    def update_progress(self, current, total, date, price, success, currency=BASE_CURRENCY):
         """更新進度（回調函數）"""
         progress = current / total
         self.after(0, lambda: self.progress_bar.set(progress))
 
         if success:
-            status = f"✓ ${price:,.8f}"
+            status = f"✓ {format_price(price, currency)}"
         else:
             status = "✗ 無資料"
 
         progress_text = f"{date}: {status} ({current}/{total})"
         self.after(0, lambda: self.progress_label.configure(text=progress_text))
 
-    def display_results(self, prices, coin_id, from_date, to_date):
+        # 走勢圖隨資料逐步更新（同一 UI 週期內的多筆資料合併重繪）
+        if success:
+            self.after(0, lambda: self.price_chart.append([{'date': date, 'price': price}]))
+
+    def display_results(self, prices, coin_id, from_date, to_date, clear=True):
         """顯示查詢結果"""
-        # 清空結果
-        self.result_text.delete("1.0", "end")
+        # 清空結果（批量查詢進行中則附加在後面）
+        if clear:
+            self.result_text.delete("1.0", "end")
 
         # 顯示標題
         self.result_text.insert("end", "=" * 60 + "\n")
@@ -529,31 +1232,28 @@ class CryptoPriceGUI(ctk.CTk):
         self.result_text.insert("end", f"日期：{from_date} ~ {to_date}\n")
         self.result_text.insert("end", "=" * 60 + "\n\n")
 
-        # 顯示每日價格
-        self.result_text.insert("end", f"{'日期':<15} {'價格 (USD)':<20} {'狀態':<10}\n")
-        self.result_text.insert("end", "-" * 60 + "\n")
-
-        for price_data in prices:
-            date = price_data['date']
-            price = price_data['price']
-            if price is not None:
-                self.result_text.insert("end", f"{date:<15} ${price:>18,.8f}       ✓\n")
-            else:
-                self.result_text.insert("end", f"{date:<15} {'N/A':>18}       ✗\n")
+        # 每日價格顯示在表格中（只繪製可見列，可排序與篩選缺漏）
+        rows = [(coin_id, p['date'], p['price'], "✓" if p['price'] is not None else "✗") for p in prices]
+        if clear:
+            self.result_table.set_rows(rows)
+        else:
+            self.result_table.append_rows(rows)
 
-        self.result_text.insert("end", "-" * 60 + "\n")
+        # 走勢圖顯示完整結果
+        self.price_chart.set_series(prices, title=coin_id)
 
-        # 計算並顯示統計資訊
-        stats = calculate_statistics(prices)
+        # 顯示統計資訊（由本地儲存的前綴和/稀疏表取得，不重新掃描）
+        stats = self.price_store.range_statistics(coin_id, from_date, to_date)
+        _, currency = parse_series_key(coin_id)
 
         if stats['avg'] is not None:
-            self.avg_label.value_label.configure(text=f"${stats['avg']:,.8f}")
-            self.max_label.value_label.configure(text=f"${stats['max']:,.8f}")
-            self.min_label.value_label.configure(text=f"${stats['min']:,.8f}")
+            self.avg_label.value_label.configure(text=format_price(stats['avg'], currency))
+            self.max_label.value_label.configure(text=format_price(stats['max'], currency))
+            self.min_label.value_label.configure(text=format_price(stats['min'], currency))
 
-            self.result_text.insert("end", f"\n平均價格：${stats['avg']:,.8f}\n")
-            self.result_text.insert("end", f"最高價格：${stats['max']:,.8f}\n")
-            self.result_text.insert("end", f"最低價格：${stats['min']:,.8f}\n")
+            self.result_text.insert("end", f"\n平均價格：{format_price(stats['avg'], currency)}\n")
+            self.result_text.insert("end", f"最高價格：{format_price(stats['max'], currency)}\n")
+            self.result_text.insert("end", f"最低價格：{format_price(stats['min'], currency)}\n")
             self.result_text.insert("end", f"有效資料：{stats['valid_count']} / {stats['total_count']} 天\n")
         else:
             self.avg_label.value_label.configure(text="N/A")
@@ -562,53 +1262,241 @@ class CryptoPriceGUI(ctk.CTk):
             self.result_text.insert("end", "\n無有效資料\n")
 
     def on_export_clicked(self):
-        """匯出 CSV 按鈕點擊事件"""
-        if not self.prices_data:
+        """匯出 CSV 按鈕點擊事件（匯出進行中則取消匯出）"""
+        if self.export_token is not None:
+            self.export_token.cancel()
+            self.update_status("正在取消匯出...")
+            return
+
+        # 匯出內容與區間取自已查詢的結果集，而非目前的輸入欄位
+        entries = list(self.result_set)
+        if not entries:
             messagebox.showwarning("警告", "沒有資料可匯出")
             return
 
-        # 取得參數
-        selected_coin = self.coin_combobox.get()
-        coin_id = COIN_MAPPING.get(selected_coin, "unknown")
-        from_date = self.from_date_entry.get().strip()
-        to_date = self.to_date_entry.get().strip()
+        if len(entries) == 1:
+            coin_id, from_date, to_date = entries[0]
 
-        # 預設檔名
-        default_filename = f"{coin_id}_{from_date}_{to_date}_prices.csv"
+            # 開啟儲存對話框（預設檔名）
+            filename = filedialog.asksaveasfilename(
+                defaultextension=".csv",
+                initialfile=f"{coin_id}_{from_date}_{to_date}_prices.csv",
+                filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+            )
+            if not filename:
+                return
+            target = {'output_file': filename}
+        else:
+            # 多幣種結果匯出到目錄（每個幣種一個檔案）
+            directory = filedialog.askdirectory(title=f"選擇匯出目錄（{len(entries)} 個幣種）")
+            if not directory:
+                return
+            target = {'directory': directory}
 
-        # 開啟儲存對話框
-        filename = filedialog.asksaveasfilename(
-            defaultextension=".csv",
-            initialfile=default_filename,
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
-        )
+        self.export_token = token = CancellationToken()
+        self.export_button.configure(text="🛑 取消匯出")
+        thread = threading.Thread(target=self.perform_export, args=(entries, target, token), daemon=True)
+        thread.start()
 
-        if filename:
-            try:
-                output_file = save_to_csv(
-                    self.prices_data,
-                    coin_id,
-                    from_date,
-                    to_date,
-                    output_file=filename
-                )
-                messagebox.showinfo("成功", f"資料已匯出至：\n{output_file}")
-                self.update_status(f"已匯出：{output_file}")
-            except Exception as e:
-                messagebox.showerror("錯誤", f"匯出失敗：{e}")
+    def perform_export(self, entries, target, token):
+        """執行匯出（在背景執行緒）"""
+        def on_progress(current, total, coin_id):
+            self.after(0, lambda: self.update_status(f"匯出中 {coin_id} ({current}/{total})..."))
+
+        try:
+            result = export_result_set(self.price_store, entries, progress_callback=on_progress,
+                                       cancellation_check=token, **target)
+
+            written, unchanged = result['written'], result['unchanged']
+            location = target.get('output_file') or target.get('directory')
+            if result['cancelled']:
+                message = f"匯出已取消！已寫入 {len(written)} 個檔案"
+                self.after(0, lambda m=message: messagebox.showwarning("已取消", m))
+            else:
+                message = f"資料已匯出至：\n{location}\n寫入 {len(written)} 個檔案"
+                if unchanged:
+                    message += f"，內容未變動略過 {len(unchanged)} 個"
+                if result['skipped']:
+                    message += f"\n無資料：{', '.join(result['skipped'])}"
+                self.after(0, lambda m=message: messagebox.showinfo("成功", m))
+            self.after(0, lambda n=len(written), loc=location: self.update_status(f"已匯出 {n} 個檔案：{loc}"))
+
+        except Exception as e:
+            self.after(0, lambda err=str(e): messagebox.showerror("錯誤", f"匯出失敗：{err}"))
+            self.after(0, lambda: self.update_status("匯出失敗"))
+
+        finally:
+            self.export_token = None
+            self.after(0, lambda: self.export_button.configure(
+                text="📥 匯出 CSV", state="normal" if self.result_set else "disabled"))
 
     def on_clear_clicked(self):
-        """清空按鈕點擊事件"""
+        """清空按鈕點擊事件（只清空畫面，已儲存的工作階段保留到下次查詢）"""
         self.result_text.delete("1.0", "end")
+        self.result_table.clear()
         self.prices_data = []
+        self.current_query = None
+        self.result_set = []
+        self.price_chart.clear()
         self.progress_bar.set(0)
         self.progress_label.configure(text="")
         self.avg_label.value_label.configure(text="---")
         self.max_label.value_label.configure(text="---")
         self.min_label.value_label.configure(text="---")
-        self.export_button.configure(state="disabled")
+        self.disable_export()
         self.update_status("已清空")
 
+    def disable_export(self):
+        """停用匯出按鈕（匯出進行中時保留，以便取消）"""
+        if self.export_token is None:
+            self.export_button.configure(state="disabled")
+
+    def start_profiling(self):
+        """
+        勾選效能分析時開始記錄（已有查詢在記錄時，本次查詢併入同一份紀錄）
+        :return: Profiler，未啟用或併入其他紀錄時回傳 None
+        """
+        if not self.profile_enabled:
+            return None
+        try:
+            return Profiler().start()
+        except RuntimeError:
+            return None
+
+    def finish_profiling(self, profiler):
+        """停止記錄，將 trace 存到 ./profile 並在結果區顯示各階段彙總"""
+        if profiler is None:
+            return
+        profiler.stop()
+        output_dir = "./profile"
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            path = profiler.save_trace(os.path.join(output_dir, f"trace_{datetime.now():%Y%m%d_%H%M%S}.json"))
+            text = f"\n效能分析 trace：{path}\n{profiler.format_summary()}\n"
+        except Exception as e:
+            text = f"\n錯誤：無法儲存效能分析結果：{e}\n"
+        self.after(0, lambda: self.result_text.insert("end", text))
+
+    def get_session_settings(self):
+        """目前的輸入設定（在主執行緒呼叫；API key 不保存）"""
+        return {
+            'coin': self.coin_combobox.get(),
+            'selected': self.coin_multiselect.get_selected(),
+            'from_date': self.from_date_entry.get().strip(),
+            'to_date': self.to_date_entry.get().strip(),
+            'vs_currency': self.get_vs_currency(),
+        }
+
+    def save_session(self):
+        """將輸入設定與最近的結果集寫入工作階段檔案（可在背景執行緒呼叫）"""
+        results = [{'key': key, 'from_date': from_date, 'to_date': to_date,
+                    'fetched_at': self.fetched_at[(key, from_date, to_date)]}
+                   for key, from_date, to_date in self.session_results
+                   if (key, from_date, to_date) in self.fetched_at]
+        try:
+            save_session(self.session_settings, results, self.price_store, self.session_current)
+        except OSError as e:
+            log.warning("無法儲存工作階段：%s", e)
+
+    def restore_session(self):
+        """讀取上次的工作階段並立即顯示，再於背景重新查詢取得時尚未結算的日期（在背景執行緒）"""
+        session = load_session()
+        if session is None:
+            return
+
+        entries = []
+        for entry in session['results']:
+            query = (entry['key'], entry['from_date'], entry['to_date'])
+            self.price_store.update(entry['key'], entry['prices'])
+            self.fetched_at[query] = entry['fetched_at']
+            entries.append(query)
+        current = session['current'] if session['current'] in entries else None
+        if not self.session_results:  # 載入完成前已有新的查詢結果時以新結果為準
+            self.session_settings = session['settings']
+            self.session_results = entries
+            self.session_current = current
+        self.after(0, lambda: self.apply_session(session['settings'], entries, current))
+
+        # 只重新驗證尚未結算的最近幾天（預取優先等級：使用者的查詢與批量查詢皆優先）
+        stale = [(query, unsettled_window(entry)) for query, entry in zip(entries, session['results'])]
+        stale = [(query, window) for query, window in stale if window is not None]
+        if not stale:
+            return
+        self.after(0, lambda: self.update_status(f"已載入上次的查詢結果，正在更新 {len(stale)} 筆最近的價格..."))
+        fetcher = self.get_fetcher(None)
+        updated = 0
+        for query, (from_date, to_date) in stale:
+            key = query[0]
+            coin_id, vs_currency = parse_series_key(key)
+            try:
+                prices = fetcher.get_range_prices(coin_id, from_date, to_date, priority=PRIORITY_PREFETCH,
+                                                  vs_currency=vs_currency)
+            except Exception as e:
+                log.warning("重新驗證 %s 失敗：%s", key, e)
+                continue
+            if not any(p['price'] is not None for p in prices):
+                continue
+            self.price_store.update(key, prices)
+            self.fetched_at[query] = time.time()
+            updated += 1
+            if query == self.current_query:
+                self.prices_data = self.price_store.to_list(*query)
+                self.after(0, lambda p=self.prices_data, q=query: self.display_results(p, *q))
+
+        if self.current_query is None and self.result_set == entries:
+            self.after(0, lambda: self.show_saved_results(entries))
+        self.save_session()
+        self.after(0, lambda: self.update_status(f"已更新 {updated}/{len(stale)} 筆最近的價格"))
+
+    def apply_session(self, settings, entries, current):
+        """在畫面套用上次的設定與結果（在主執行緒；已開始新查詢時只保留資料，不覆蓋畫面）"""
+        if self.is_querying or self.is_batch_running or self.current_query is not None:
+            return
+
+        if settings.get('selected'):
+            self.coin_multiselect.set_selected(settings['selected'])
+        if settings.get('coin') in self.coin_combobox.cget('values'):
+            self.coin_combobox.set(settings['coin'])
+        for entry, value in ((self.from_date_entry, settings.get('from_date')),
+                             (self.to_date_entry, settings.get('to_date'))):
+            if value:
+                entry.delete(0, "end")
+                entry.insert(0, value)
+        if settings.get('vs_currency') in VS_CURRENCIES:
+            self.currency_combobox.set(settings['vs_currency'].upper())
+
+        if not entries:
+            return
+        self.result_set = list(entries)
+        self.export_button.configure(state="normal")
+        if current is not None:
+            self.current_query = current
+            self.prices_data = self.price_store.to_list(*current)
+            self.display_results(self.prices_data, *current)
+        else:
+            self.show_saved_results(entries)
+        self.update_status(f"已載入上次的查詢結果（{len(entries)} 筆）")
+
+    def show_saved_results(self, entries):
+        """以本地儲存的統計顯示多幣種結果（格式與批量查詢的結果列相同）"""
+        rows = []
+        for key, from_date, to_date in entries:
+            stats = self.price_store.range_statistics(key, from_date, to_date)
+            symbol = self.coin_registry.symbol(parse_series_key(key)[0])
+            status = "✓ 已儲存" if stats['avg'] is not None else "✗ 無資料"
+            rows.append((f"{symbol} ({key})", f"{from_date} ~ {to_date}", stats['avg'], status))
+        self.result_table.set_rows(rows)
+
+    def on_close(self):
+        """關閉視窗：保存輸入設定與結果後結束"""
+        self.session_settings = self.get_session_settings()
+        self.save_session()
+        self.destroy()
+
+    def get_vs_currency(self):
+        """目前選擇的計價貨幣（小寫）"""
+        return self.currency_combobox.get().lower()
+
     def update_status(self, message):
         """更新狀態列"""
         self.status_label.configure(text=f"📡 {message}")
@@ -616,6 +1504,7 @@ class CryptoPriceGUI(ctk.CTk):
 
 def main():
     """主程式"""
+    configure_logging()
     app = CryptoPriceGUI()
     app.mainloop()
 
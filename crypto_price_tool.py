@@ -4,236 +4,51 @@
 取得指定幣種在指定日期區間內每日的價格，並計算平均價格
 """
 
-import requests
-import csv
 import argparse
+import json
+import multiprocessing
+import os
 import sys
-import time
-from datetime import datetime, timedelta
-
-
-class CoinGeckoPriceFetcher:
-    """CoinGecko API 價格查詢類別"""
-
-    BASE_URL = "https://api.coingecko.com/api/v3"
-
-    def __init__(self, api_key=None):
-        """
-        初始化
-        :param api_key: CoinGecko API key（可選）
-        """
-        self.api_key = api_key
-        self.session = requests.Session()
-        # headers = {
-        #     'User-Agent': 'Mozilla/5.0 (Crypto Price Tool)'
-        # }
-        # if api_key:
-        #     headers['x-cg-pro-api-key'] = api_key
-        # self.session.headers.update(headers)
-
-    def _date_to_timestamp(self, date_str):
-        """
-        將 YYYY-MM-DD 轉換為 UNIX timestamp (秒)，使用 UTC 時區
-        :param date_str: 日期字串，格式：YYYY-MM-DD
-        :return: UNIX timestamp (秒)
-        """
-        from datetime import timezone
-        # 將日期視為 UTC 00:00:00
-        dt = datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-        return int(dt.timestamp())
-
-    def _timestamp_to_date(self, timestamp_ms):
-        """
-        將 UNIX timestamp (毫秒) 轉換為 YYYY-MM-DD，使用 UTC 時區
-        :param timestamp_ms: UNIX timestamp (毫秒)
-        :return: 日期字串，格式：YYYY-MM-DD
-        """
-        from datetime import timezone
-        # 使用 UTC 時區轉換，避免受系統時區影響
-        dt = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
-        return dt.strftime("%Y-%m-%d")
-
-    def get_range_prices_api(self, coin_id, from_date, to_date, max_retries=3, debug=False):
-        """
-        使用 market_chart/range API 取得日期區間內的價格
-        :param coin_id: CoinGecko 的幣種 ID（如 bitcoin）
-        :param from_date: 開始日期，格式：YYYY-MM-DD
-        :param to_date: 結束日期，格式：YYYY-MM-DD
-        :param max_retries: 最大重試次數
-        :param debug: 是否顯示詳細 debug 資訊
-        :return: 價格資料字典 {date: price} 或 None
-        """
-        try:
-            from datetime import timezone, timedelta
-            # from_date 需要往前推一天，因為該日數據來自前一天的 16:00 UTC
-            from_dt = datetime.strptime(from_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-            from_dt = from_dt - timedelta(days=1)  # 往前推一天
-            from_ts = int(from_dt.timestamp())
-
-            # to_date 要延伸到當天的 23:59:59，確保包含當天 16:00 的數據
-            to_dt = datetime.strptime(to_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-            to_dt = to_dt.replace(hour=23, minute=59, second=59)
-            to_ts = int(to_dt.timestamp())
-        except ValueError as e:
-            print(f"錯誤：日期格式不正確：{e}", file=sys.stderr)
-            return None
-
-        url = f"{self.BASE_URL}/coins/{coin_id}/market_chart/range"
-        params = {
-            'vs_currency': 'usd',
-            'from': from_ts,
-            'to': to_ts
-        }
-
-        # 如果有 API key，添加到參數中（並啟用 daily interval）
-        if self.api_key:
-            params['x_cg_pro_api_key'] = self.api_key
-            params['interval'] = 'daily'  # daily interval 是付費功能
-
-        for attempt in range(max_retries):
-            try:
-                response = self.session.get(url, params=params, timeout=30)
-
-                if response.status_code == 404:
-                    print(f"錯誤：找不到幣種 '{coin_id}'", file=sys.stderr)
-                    return None
-                elif response.status_code == 429:
-                    wait_time = 5
-                    print(f"警告：API 請求過於頻繁 (429)，等待 {wait_time} 秒...", file=sys.stderr)
-                    print(f"響應內容：{response.text}", file=sys.stderr)
-                    time.sleep(wait_time)
-                    continue
-                elif response.status_code == 401:
-                    print(f"錯誤：API 認證失敗 (401)", file=sys.stderr)
-                    print(f"響應內容：{response.text}", file=sys.stderr)
-                    return None
-
-                response.raise_for_status()
-                data = response.json()
-
-                # 解析 prices 陣列
-                if 'prices' not in data:
-                    print("錯誤：API 返回資料格式不正確", file=sys.stderr)
-                    return None
-
-                prices_array = data['prices']
-                if not prices_array:
-                    print("警告：API 返回空資料", file=sys.stderr)
-                    return {}
-
-                # 將 timestamp 按日期分組（處理同日多筆數據）
-                # 注意：CoinGecko 的邏輯是 UTC 16:00 的價格算作次日
-                from collections import defaultdict
-                from datetime import timedelta
-                daily_prices = defaultdict(list)
-
-                for timestamp_ms, price in prices_array:
-                    dt = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
-
-                    # 如果時間 >= 16:00，算作次日的數據
-                    if dt.hour >= 16:
-                        dt = dt + timedelta(days=1)
-
-                    date_str = dt.strftime("%Y-%m-%d")
-                    daily_prices[date_str].append((timestamp_ms, price))  # 保存 timestamp 和 price
-
-                # 每日取最接近 UTC 16:00 的價格（CoinGecko 標準每日結算時間）
-                # 注意：歸類到某日的數據實際上來自前一天的 16:xx
-                result = {}
-                for date_str in sorted(daily_prices.keys()):
-                    price_data = daily_prices[date_str]  # [(timestamp_ms, price), ...]
-
-                    # 計算前一天 UTC 16:00 的時間戳（毫秒）
-                    # 因為歸類到 date_str 的數據實際上是前一天 >= 16:00 的數據
-                    target_dt = datetime.strptime(date_str, "%Y-%m-%d").replace(
-                        hour=16, minute=0, second=0, microsecond=0, tzinfo=timezone.utc
-                    )
-                    target_dt = target_dt - timedelta(days=1)  # 前一天的 16:00
-                    target_ts_ms = int(target_dt.timestamp() * 1000)
-
-                    # 找到最接近前一天 UTC 16:00 的數據點
-                    closest = min(price_data, key=lambda x: abs(x[0] - target_ts_ms))
-
-                    if debug:
-                        # 顯示詳細的時間資訊
-                        closest_dt = datetime.fromtimestamp(closest[0] / 1000, tz=timezone.utc)
-                        time_diff = abs(closest[0] - target_ts_ms) / 1000 / 60  # 分鐘
-                        print(f"  {date_str}: 目標前日 UTC 16:00, 實際選擇 {closest_dt.strftime('%Y-%m-%d %H:%M:%S')} UTC (差距 {time_diff:.1f} 分鐘)", file=sys.stderr)
-
-                    result[date_str] = round(closest[1])  # 四捨五入到整數
-
-                return result
-
-            except requests.exceptions.RequestException as e:
-                if attempt == max_retries - 1:
-                    print(f"錯誤：請求資料時發生錯誤：{e}", file=sys.stderr)
-                    return None
-                time.sleep(2)  # 錯誤後等待 2 秒再重試
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    print(f"錯誤：處理資料時發生錯誤：{e}", file=sys.stderr)
-                    return None
-                time.sleep(2)
-
-        return None
-
-    def get_range_prices(self, coin_id, from_date, to_date, debug=False):
-        """
-        取得日期區間內所有日期的價格
-        :param coin_id: CoinGecko 的幣種 ID
-        :param from_date: 開始日期（YYYY-MM-DD）
-        :param to_date: 結束日期（YYYY-MM-DD）
-        :param debug: 是否顯示詳細 debug 資訊
-        :return: 價格資料列表
-        """
-        # 轉換為 datetime 物件
-        start_dt = datetime.strptime(from_date, "%Y-%m-%d")
-        end_dt = datetime.strptime(to_date, "%Y-%m-%d")
-
-        # 計算天數
-        delta = end_dt - start_dt
-        num_days = delta.days + 1  # 包含結束日期
-
-        print(f"開始取得 {coin_id} 從 {from_date} 到 {to_date} 的價格資料...")
-        print(f"共需查詢 {num_days} 天，請稍候...")
-        print("-" * 50)
-
-        # 使用新 API 一次取得所有資料
-        price_dict = self.get_range_prices_api(coin_id, from_date, to_date, debug=debug)
-
-        if price_dict is None:
-            return []
-
-        # 建立完整的日期列表，補充缺失的日期
-        prices = []
-        current_dt = start_dt
-
-        for i in range(num_days):
-            date_str = current_dt.strftime("%Y-%m-%d")
-            price = price_dict.get(date_str, None)
-
-            if price is not None:
-                prices.append({
-                    'date': date_str,
-                    'price': price
-                })
-                print(f"{date_str}: ✓ ${price:,}")
-            else:
-                prices.append({
-                    'date': date_str,
-                    'price': None
-                })
-                print(f"{date_str}: ✗ 無資料")
+from datetime import datetime
+from functools import partial
+
+from src.core import CoinGeckoPriceFetcher
+from src.cancel import CancellationToken
+from src.watch import PriceWatcher
+from src.portfolio import load_holdings, fetch_portfolio, save_portfolio_csv
+from src.jobs import stream_jobs
+from src.jobqueue import JobQueue, run_worker, default_worker_id, DEFAULT_WINDOW_DAYS
+from src.registry import CoinRegistry
+from src.profiling import Profiler
+from src.logs import configure_logging
+from src.fx import BASE_CURRENCY, series_key
+from src.utils import save_to_csv as write_csv, calculate_statistics
+from src.bars import GRANULARITIES, save_bars_csv
+from src.settlement import DEFAULT_POLICY, POLICIES
+
+
+def round_price(price, decimals=None):
+    """依小數位數四捨五入價格（decimals 為 None 時不處理；None 價格原樣回傳）"""
+    if price is None or decimals is None:
+        return price
+    return round(price, decimals)
+
+
+def round_prices(prices, decimals=None):
+    """四捨五入價格資料列表中的每日價格（decimals 為 None 時原樣回傳）"""
+    if decimals is None:
+        return prices
+    return [dict(p, price=round_price(p['price'], decimals)) for p in prices]
 
-            current_dt += timedelta(days=1)
 
-        print("-" * 50)
-        print(f"查詢完成！取得 {len([p for p in prices if p['price'] is not None])} / {num_days} 天的資料")
+def price_statistics(prices, decimals=None):
+    """計算四捨五入後價格的統計資訊（平均價格同樣四捨五入）"""
+    stats = calculate_statistics(round_prices(prices, decimals))
+    stats['avg'] = round_price(stats['avg'], decimals)
+    return stats
 
-        return prices
 
-
-def save_to_csv(prices, coin_id, from_date, to_date, output_file=None):
+def save_to_csv(prices, coin_id, from_date, to_date, output_file=None, currency=BASE_CURRENCY, decimals=None):
     """
     將價格資料儲存為 CSV 檔案
     :param prices: 價格資料列表
@@ -241,51 +56,46 @@ def save_to_csv(prices, coin_id, from_date, to_date, output_file=None):
     :param from_date: 開始日期
     :param to_date: 結束日期
     :param output_file: 輸出檔案名稱（可選）
+    :param currency: 計價貨幣
+    :param decimals: 每日價格與平均價格的小數位數（None 表示不四捨五入）
     """
     if not prices:
         print("錯誤：沒有價格資料可以輸出", file=sys.stderr)
         return
 
-    # 計算平均價格（排除 None）
-    valid_prices = [p['price'] for p in prices if p['price'] is not None]
-    if valid_prices:
-        avg_price = round(sum(valid_prices) / len(valid_prices))
-    else:
-        avg_price = None
-
-    # 如果沒有指定輸出檔案名稱，自動產生
-    if output_file is None:
-        output_file = f"{coin_id}_{from_date}_{to_date}_prices.csv"
+    prices = round_prices(prices, decimals)
+    stats = price_statistics(prices, decimals)
+    avg_price = stats['avg']
 
     try:
-        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['Date', 'Price (USD)']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            writer.writeheader()
-
-            # 寫入每日價格
-            for price_data in prices:
-                writer.writerow({
-                    'Date': price_data['date'],
-                    'Price (USD)': price_data['price'] if price_data['price'] is not None else 'N/A'
-                })
-
-            # 寫入平均價格
-            writer.writerow({
-                'Date': 'Average',
-                'Price (USD)': avg_price if avg_price is not None else 'N/A'
-            })
+        output_file = write_csv(prices, series_key(coin_id, currency), from_date, to_date, output_file=output_file,
+                                stats=stats, currency=currency)
 
         print("\n" + "=" * 50)
         print(f"成功！資料已儲存至：{output_file}")
         print(f"共 {len(prices)} 天的資料")
-        print(f"有效資料：{len(valid_prices)} 天")
-        print(f"平均價格：{avg_price if avg_price is not None else 'N/A'}")
+        print(f"有效資料：{stats['valid_count']} 天")
+        print(f"平均價格：{avg_price if avg_price is not None else 'N/A'} {currency.upper()}")
         print("=" * 50)
 
     except Exception as e:
-        print(f"錯誤：儲存 CSV 檔案時發生錯誤：{e}", file=sys.stderr)
+        print(f"錯誤：{e}", file=sys.stderr)
+
+
+def format_amount(value, currency=BASE_CURRENCY, signed=False):
+    """金額顯示：USD 為 $1,234.56，其他貨幣以有效位數顯示並加上貨幣代碼（BTC 計價金額可能遠小於 0.01）"""
+    sign = '+' if signed else ''
+    if currency == BASE_CURRENCY:
+        return f"${value:{sign},.2f}"
+    return f"{value:{sign},.8g} {currency.upper()}"
+
+
+def print_progress(current, total, date, price, success, currency=BASE_CURRENCY, decimals=None):
+    """逐日顯示查詢結果（get_range_prices 的進度回調）"""
+    if success:
+        print(f"{date}: ✓ {round_price(price, decimals):,} {currency.upper()}")
+    else:
+        print(f"{date}: ✗ 無資料")
 
 
 def validate_date(date_str, date_name):
@@ -330,6 +140,44 @@ def parse_arguments():
   # 使用自訂 API key
   python crypto_price_tool.py bitcoin --from 2024-01-01 --to 2024-01-31 --api-key YOUR_API_KEY
 
+  # 最多等待 60 秒
+  python crypto_price_tool.py bitcoin --from 2024-01-01 --to 2024-01-31 --timeout 60
+
+  # 監看多個幣種的目前價格，每 30 秒更新一次，只輸出有變動的價格（Ctrl+C 結束）
+  python crypto_price_tool.py bitcoin,ethereum,solana --watch --interval 30
+
+  # 依持倉檔（coin_id,quantity[,date]）計算投資組合每日市值與損益
+  python crypto_price_tool.py --portfolio holdings.csv --from 2025-01-01 --to 2025-01-31
+
+  # 從 stdin 讀取多筆查詢工作（每行 "coin_id from to" 或 JSON），每完成一筆即輸出一行 JSON
+  printf 'bitcoin 2025-01-01 2025-01-31\nethereum 2025-02-01 2025-02-10\n' | python crypto_price_tool.py --jobs -
+
+  # 也可以用代號或名稱查詢（同代號有多個幣種時會列出候選）
+  python crypto_price_tool.py BTC --from 2025-01-01 --to 2025-01-31
+
+  # 同步完整的幣種目錄到本地快取（coin_registry.json）
+  python crypto_price_tool.py --sync-coins
+
+  # 同時輸出 USD、EUR、TWD 與 BTC 計價的價格（只查詢一次 USD 價格，其他貨幣以每日匯率換算）
+  python crypto_price_tool.py bitcoin --from 2025-01-01 --to 2025-01-31 --vs-currency usd,eur,twd,btc
+
+  # 同一次下載另外輸出每小時 OHLC K 線（{coin_id}_{from}_{to}_hourly_bars.csv）
+  python crypto_price_tool.py bitcoin --from 2025-01-01 --to 2025-01-07 --granularity hourly
+
+  # 直接取得原生 OHLC K 線（/coins/{id}/ohlc；有 API key 時使用 ohlc/range，可搭配 --granularity hourly）
+  python crypto_price_tool.py bitcoin --from 2025-01-01 --to 2025-01-31 --ohlc
+
+  # 大範圍回補：切成 (幣種, 90 天) 工作單元放入共享佇列，再由多個工作行程（可在多台機器上）處理
+  python crypto_price_tool.py bitcoin,ethereum,solana --from 2023-01-01 --to 2025-12-31 --queue /shared/backfill.db
+  python crypto_price_tool.py --queue /shared/backfill.db --work --workers 4 -k YOUR_API_KEY
+  python crypto_price_tool.py --queue /shared/backfill.db --export-dir ./backfill
+
+  # 效能分析：記錄各階段耗時，輸出 Chrome/Perfetto trace（profile_trace.json）與彙總表，並以 cProfile 分析
+  python crypto_price_tool.py bitcoin --from 2025-01-01 --to 2025-01-31 --profile --cprofile
+
+  # 單一幣種以 NDJSON 輸出到 stdout（不寫 CSV）
+  python crypto_price_tool.py bitcoin --from 2025-01-01 --to 2025-01-31 --ndjson
+
 常見幣種 ID：
   bitcoin, ethereum, tether, binancecoin, ripple, cardano, dogecoin, solana,
   polkadot, litecoin, shiba-inu, avalanche-2
@@ -340,26 +188,152 @@ def parse_arguments():
 
     parser.add_argument(
         'coin_id',
-        help='CoinGecko 幣種 ID（如：bitcoin, ethereum, tether）'
+        nargs='?',
+        help='CoinGecko 幣種 ID、代號或名稱（如：bitcoin, BTC, Ethereum）；監看模式可用逗號分隔多個幣種'
     )
 
     parser.add_argument(
         '--from',
         dest='from_date',
-        required=True,
         help='開始日期，格式：YYYY-MM-DD（如：2024-01-01）'
     )
 
     parser.add_argument(
         '--to',
         dest='to_date',
-        required=True,
         help='結束日期，格式：YYYY-MM-DD（如：2024-01-31）'
     )
 
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='監看模式：定期查詢目前價格，只輸出有變動的幣種（不需 --from/--to）',
+        default=False
+    )
+
+    parser.add_argument(
+        '--interval',
+        type=float,
+        help='監看模式的輪詢間隔（秒，預設：30）',
+        default=30.0
+    )
+
+    parser.add_argument(
+        '--portfolio',
+        metavar='HOLDINGS',
+        help='投資組合模式：持倉檔（CSV 欄位 coin_id,quantity[,date] 或 JSON），計算每日市值、各幣種貢獻與損益',
+        default=None
+    )
+
+    parser.add_argument(
+        '--vs-currency',
+        dest='vs_currency',
+        help='計價貨幣，可用逗號分隔多個（如：usd,eur,twd,btc；預設：usd）。'
+             '非 USD 由 USD 價格乘上每日匯率換算，每多一種貨幣只多查詢一次匯率',
+        default=BASE_CURRENCY
+    )
+
+    parser.add_argument(
+        '--settlement',
+        help='每日結算規則，可用逗號分隔多個（' + '；'.join(f"{name}：{policy.description}" for name, policy in POLICIES.items())
+             + f'；預設：{DEFAULT_POLICY.name}）。多個規則共用同一份下載，每種規則輸出一個 CSV',
+        default=DEFAULT_POLICY.name
+    )
+
+    parser.add_argument(
+        '--granularity',
+        choices=list(GRANULARITIES),
+        help='另外輸出 OHLC K 線（raw / hourly / 4h / daily），與每日價格共用同一次下載；'
+             '盤中取樣間隔由 API 依區間長度決定（90 天內每小時）',
+        default=None
+    )
+
+    parser.add_argument(
+        '--decimals',
+        type=int,
+        help='每日價格與平均價格四捨五入的小數位數（套用於畫面、CSV 與 NDJSON 輸出；預設不四捨五入）',
+        default=None
+    )
+
+    parser.add_argument(
+        '--ohlc',
+        action='store_true',
+        help='改用原生 OHLC endpoint 取得 K 線（輸出 {coin_id}_{from}_{to}_ohlc.csv）；'
+             '有 API key 時使用 ohlc/range，K 線長度可用 --granularity daily/hourly 指定',
+        default=False
+    )
+
+    parser.add_argument(
+        '--jobs',
+        metavar='FILE',
+        help='串流模式：從工作檔讀取查詢工作（- 表示 stdin；每行 "coin_id from to" 或 '
+             '{"coin_id", "from", "to"} JSON），每完成一筆即輸出一行 JSON 到 stdout',
+        default=None
+    )
+
+    parser.add_argument(
+        '--ndjson',
+        action='store_true',
+        help='以 NDJSON 輸出結果到 stdout 而非寫入 CSV（--jobs 模式一律為 NDJSON）',
+        default=False
+    )
+
+    parser.add_argument(
+        '--queue',
+        metavar='DB',
+        help='共享工作佇列（SQLite 檔案，多台機器共用時放在共享儲存）：指定幣種與 --from/--to 時將其切成工作單元加入佇列',
+        default=None
+    )
+
+    parser.add_argument(
+        '--window-days',
+        dest='window_days',
+        type=int,
+        help=f'佇列模式每個工作單元的天數（預設：{DEFAULT_WINDOW_DAYS}）',
+        default=DEFAULT_WINDOW_DAYS
+    )
+
+    parser.add_argument(
+        '--work',
+        action='store_true',
+        help='佇列模式：以租約領取並處理工作單元，直到佇列處理完畢（行程當機時其單元於租約到期後由其他行程接手）',
+        default=False
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='佇列模式：在本機啟動的工作行程數（預設：1）',
+        default=1
+    )
+
+    parser.add_argument(
+        '--export-dir',
+        dest='export_dir',
+        help='佇列模式：將已完成的結果合併匯出為每個幣種一個 CSV',
+        default=None
+    )
+
+    parser.add_argument(
+        '--retry-failed',
+        dest='retry_failed',
+        action='store_true',
+        help='佇列模式：將失敗的工作單元重新放回佇列',
+        default=False
+    )
+
+    parser.add_argument(
+        '--sync-coins',
+        dest='sync_coins',
+        action='store_true',
+        help='從 CoinGecko 同步完整的幣種目錄到本地快取（供代號/名稱解析）',
+        default=False
+    )
+
     parser.add_argument(
         '-o', '--output',
-        help='輸出檔案名稱（預設：{coin_id}_{from}_{to}_prices.csv）',
+        help='輸出檔案名稱（預設：{coin_id}_{from}_{to}_prices.csv，非 USD 為 {coin_id}@{貨幣}_...；'
+             '多種計價貨幣時在檔名後加上 _{貨幣}；投資組合模式為 portfolio_{from}_{to}.csv）',
         default=None
     )
 
@@ -370,6 +344,40 @@ def parse_arguments():
         default=None
     )
 
+    parser.add_argument(
+        '--hedge-percentile',
+        dest='hedge_percentile',
+        type=float,
+        help='hedged request：請求超過近期延遲的此百分位（0~1，如 0.95）仍未回應時送出一個重複請求，'
+             '先回應者勝出（重複請求同樣計入流量控制與 key 額度；預設不啟用）',
+        default=None
+    )
+
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        help='查詢期限（秒），含排隊、重試與退避等待；逾時立即中止（監看模式為總監看時間，'
+             '串流模式為每筆工作的期限；預設不限）',
+        default=None
+    )
+
+    parser.add_argument(
+        '--profile',
+        metavar='TRACE',
+        nargs='?',
+        const='profile_trace.json',
+        help='效能分析：記錄每個幣種、每次嘗試的各階段耗時（排隊、HTTP、退避、JSON 解析、結算價分組、CSV 寫入），'
+             '輸出 Chrome/Perfetto trace JSON（預設：profile_trace.json）並在結束時顯示彙總表',
+        default=None
+    )
+
+    parser.add_argument(
+        '--cprofile',
+        action='store_true',
+        help='效能分析時同時以 cProfile 分析所有執行緒（含查詢工作執行緒；輸出合併的 {trace}.pstats 並顯示耗時最多的函數）',
+        default=False
+    )
+
     parser.add_argument(
         '--debug',
         action='store_true',
@@ -377,18 +385,444 @@ def parse_arguments():
         default=False
     )
 
-    return parser.parse_args()
+    parser.add_argument(
+        '--log-level',
+        choices=['debug', 'info', 'warning', 'error'],
+        help='日誌等級（預設：warning；--debug 時至少為 info，debug 另外輸出 429 響應內容等細節）',
+        default=None
+    )
+
+    parser.add_argument(
+        '--log-format',
+        choices=['text', 'json'],
+        help='日誌格式：text（人類可讀）或 json（每行一筆 JSON，含幣種等上下文欄位；預設：text）',
+        default='text'
+    )
+
+    args = parser.parse_args()
+    if args.log_level is None:
+        args.log_level = 'info' if args.debug else 'warning'
+    args.vs_currencies = list(dict.fromkeys(c.strip().lower() for c in args.vs_currency.split(',') if c.strip()))
+    if not args.vs_currencies:
+        parser.error("請指定計價貨幣")
+    if len(args.vs_currencies) > 1 and (args.watch or args.portfolio or args.jobs):
+        parser.error("監看、投資組合與串流模式只能指定一種計價貨幣")
+    args.settlements = list(dict.fromkeys(p.strip().lower() for p in args.settlement.split(',') if p.strip()))
+    unknown = [name for name in args.settlements if name not in POLICIES]
+    if not args.settlements or unknown:
+        parser.error(f"不支援的結算規則：{', '.join(unknown)}（可用：{', '.join(POLICIES)}）")
+    if args.settlements != [DEFAULT_POLICY.name]:
+        if args.watch or args.portfolio or args.jobs or args.queue or args.ohlc:
+            parser.error("--settlement 只能用於單一幣種的每日價格查詢")
+        if len(args.vs_currencies) > 1:
+            parser.error("--settlement 只能搭配一種計價貨幣")
+        if args.granularity and len(args.settlements) > 1:
+            parser.error("--granularity 只能搭配一種結算規則")
+    if args.granularity and (args.watch or args.portfolio or args.jobs):
+        parser.error("--granularity 只能用於單一幣種的歷史價格查詢")
+    if args.ohlc and (args.watch or args.portfolio or args.jobs):
+        parser.error("--ohlc 只能用於單一幣種的歷史價格查詢")
+    if args.ohlc and args.granularity not in (None, 'daily', 'hourly'):
+        parser.error("--ohlc 的 K 線長度只能是 daily 或 hourly")
+    if args.granularity and not args.ohlc and len(args.vs_currencies) > 1:
+        parser.error("--granularity 只能搭配一種計價貨幣")
+    if args.hedge_percentile is not None and not 0 < args.hedge_percentile < 1:
+        parser.error("--hedge-percentile 必須介於 0 與 1 之間")
+    if args.decimals is not None and args.decimals < 0:
+        parser.error("--decimals 不能小於 0")
+    if args.queue:
+        if (args.watch or args.portfolio or args.jobs or args.granularity or args.ohlc or args.ndjson
+                or len(args.vs_currencies) > 1):
+            parser.error("佇列模式只能搭配幣種、--from/--to 與一種計價貨幣")
+        if args.coin_id and (not args.from_date or not args.to_date):
+            parser.error("加入佇列需要 --from 與 --to")
+        if args.workers < 1 or args.window_days < 1:
+            parser.error("--workers 與 --window-days 必須大於 0")
+        return args
+    if args.jobs or (args.sync_coins and not args.coin_id and not args.portfolio):
+        return args
+    if not args.coin_id and not args.portfolio:
+        parser.error("請指定幣種 ID（或使用 --portfolio 指定持倉檔、--jobs 指定工作檔）")
+    if not args.watch and (not args.from_date or not args.to_date):
+        parser.error("查詢歷史價格需要 --from 與 --to（或使用 --watch 監看目前價格）")
+    return args
+
+
+def sync_coins(registry, api_key):
+    """同步幣種目錄並顯示變動"""
+    print("同步幣種目錄...", file=sys.stderr)
+    diff = registry.refresh(CoinGeckoPriceFetcher(api_key=api_key))
+    if diff is None:
+        raise Exception("無法取得幣種目錄")
+    print(f"幣種目錄已同步：共 {len(registry)} 個幣種（新增 {len(diff['added'])}、"
+          f"移除 {len(diff['removed'])}、變動 {len(diff['updated'])}）", file=sys.stderr)
+
+
+def run_watch(args):
+    """監看模式：輪詢目前價格並輸出變動（同一 fetcher 在輪詢間保持連線與流量控制狀態）"""
+    coin_ids = args.coin_id.split(',')
+    fetcher = CoinGeckoPriceFetcher(api_key=args.api_key, hedge_percentile=args.hedge_percentile)
+    watcher = PriceWatcher(fetcher, coin_ids, interval=args.interval, vs_currency=args.vs_currencies[0])
+
+    print(f"監看 {len(coin_ids)} 個幣種，每 {args.interval:g} 秒更新（Ctrl+C 結束）")
+    print("-" * 50)
+
+    def print_changes(changes):
+        now = datetime.now().strftime("%H:%M:%S")
+        for change in changes:
+            line = f"{now} {change['coin_id']}: {change['price']:,} {args.vs_currencies[0].upper()}"
+            if change['change_pct'] is not None:
+                line += f" ({change['change_pct']:+.4f}%)"
+            print(line, flush=True)
+
+    token = CancellationToken(timeout=args.timeout)
+    watcher.run(print_changes, cancellation_check=token)
+
+
+def write_record(record, decimals=None):
+    """
+    輸出一行 JSON 紀錄並立即 flush，讓下游可即時處理
+    :param record: 結果紀錄（含 prices 時依 decimals 四捨五入每日價格並重算 stats）
+    :param decimals: 小數位數（None 表示不四捨五入）
+    """
+    if decimals is not None and record.get('prices'):
+        record = dict(record, prices=round_prices(record['prices'], decimals))
+        if 'stats' in record:
+            record['stats'] = price_statistics(record['prices'], decimals)
+    sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+def run_jobs(args):
+    """串流模式：逐行讀取查詢工作並行處理，每完成一筆輸出一行 JSON（摘要輸出到 stderr）"""
+    fetcher = CoinGeckoPriceFetcher(api_key=args.api_key, hedge_percentile=args.hedge_percentile)
+    token = CancellationToken()
+    emit = partial(write_record, decimals=args.decimals)
+
+    if args.jobs == '-':
+        counts = stream_jobs(fetcher, sys.stdin, emit, cancellation_check=token, job_timeout=args.timeout,
+                             vs_currency=args.vs_currencies[0])
+    else:
+        try:
+            job_file = open(args.jobs, 'r', encoding='utf-8')
+        except OSError as e:
+            raise ValueError(f"無法讀取工作檔：{e}")
+        with job_file:
+            counts = stream_jobs(fetcher, job_file, emit, cancellation_check=token, job_timeout=args.timeout,
+                                 vs_currency=args.vs_currencies[0])
+
+    print(f"完成 {counts['total']} 筆工作：成功 {counts['succeeded']}，失敗 {counts['failed']}", file=sys.stderr)
+    if counts['failed']:
+        sys.exit(1)
+
+
+def queue_worker(queue_path, api_key, log_level='warning', log_format='text', hedge_percentile=None):
+    """佇列工作行程（--workers 大於 1 時在子行程中執行）"""
+    configure_logging(log_level, log_format)
+    worker_id = default_worker_id()
+    queue = JobQueue(queue_path)
+    fetcher = CoinGeckoPriceFetcher(api_key=api_key, hedge_percentile=hedge_percentile)
+
+    def print_unit(unit, ok, error):
+        status = "✓" if ok else f"✗ {error}"
+        print(f"[{worker_id}] {unit['coin_id']} {unit['from_date']} ~ {unit['to_date']}: {status}", flush=True)
+
+    try:
+        counts = run_worker(fetcher, queue, worker_id=worker_id, on_unit=print_unit)
+    except KeyboardInterrupt:
+        return
+    print(f"[{worker_id}] 結束：完成 {counts['done']}，失敗 {counts['failed']}，重試 {counts['retried']}", flush=True)
+
+
+def run_queue(args):
+    """佇列模式：加入工作單元、處理佇列、匯出結果（依指定的選項依序執行）並顯示進度"""
+    queue = JobQueue(args.queue)
+
+    if args.coin_id:
+        coin_ids = args.coin_id.split(',')
+        added = queue.enqueue(coin_ids, args.from_date, args.to_date, window_days=args.window_days,
+                              vs_currency=args.vs_currencies[0])
+        print(f"已加入 {added} 個工作單元（{len(coin_ids)} 個幣種，每單元 {args.window_days} 天）")
+    if args.retry_failed:
+        print(f"已重新放回 {queue.retry_failed()} 個失敗的工作單元")
+
+    if args.work:
+        if args.workers == 1:
+            queue_worker(args.queue, args.api_key, args.log_level, args.log_format, args.hedge_percentile)
+        else:
+            # 每個工作行程有自己的 fetcher、連線與流量控制；多台機器上各自執行同一指令即可加入處理
+            processes = [multiprocessing.Process(target=queue_worker,
+                                                   args=(args.queue, args.api_key, args.log_level, args.log_format,
+                                                         args.hedge_percentile))
+                         for _ in range(args.workers)]
+            for process in processes:
+                process.start()
+            try:
+                for process in processes:
+                    process.join()
+            except KeyboardInterrupt:
+                for process in processes:
+                    process.join()
+                raise
+
+    if args.export_dir:
+        manifest = queue.export(args.export_dir)
+        print(f"已匯出至 {args.export_dir}：寫入 {len(manifest.changed)} 個檔案，{len(manifest.unchanged)} 個未變動")
+
+    progress = queue.progress()
+    print(f"佇列：共 {progress['total']} 個單元，完成 {progress['done']}，待處理 {progress['pending']}，"
+          f"處理中 {progress['leased']}（{progress['workers']} 個工作行程），失敗 {progress['failed']}")
+    for failure in queue.failures()[:10]:
+        print(f"  ✗ {failure['coin_id']} {failure['from_date']} ~ {failure['to_date']}：{failure['error']}")
+    if progress['failed']:
+        sys.exit(1)
+
+
+def run_portfolio(args, from_date, to_date):
+    """投資組合模式：並行查詢持倉幣種並輸出每日市值與損益"""
+    holdings = load_holdings(args.portfolio)
+    print(f"持倉幣種：{', '.join(sorted(holdings))}")
+    print("-" * 50)
+
+    def print_coin(coin_id, prices, elapsed, error):
+        if error is not None or not prices:
+            print(f"{coin_id}: ✗ 查詢失敗" + (f"（{error}）" if error is not None else ""))
+        else:
+            print(f"{coin_id}: ✓ {len(prices)} 天（{elapsed:.1f}s）")
+
+    fetcher = CoinGeckoPriceFetcher(api_key=args.api_key, hedge_percentile=args.hedge_percentile)
+    token = CancellationToken(timeout=args.timeout)
+    valuation, prices_by_coin = fetch_portfolio(fetcher, holdings, from_date, to_date,
+                                                on_result=print_coin, cancellation_check=token,
+                                                vs_currency=args.vs_currencies[0])
+    if not any(prices_by_coin.values()):
+        print("\n錯誤：無法取得任何價格資料", file=sys.stderr)
+        sys.exit(1)
+
+    output_file = save_portfolio_csv(valuation, args.output or f"portfolio_{from_date}_{to_date}.csv")
+    summary = valuation.summary()
+
+    print("\n" + "=" * 50)
+    print(f"成功！資料已儲存至：{output_file}")
+    print(f"期初市值：{format_amount(summary['start_value'], valuation.currency)}")
+    print(f"期末市值：{format_amount(summary['end_value'], valuation.currency)}")
+    return_pct = f"（{summary['return_pct']:+.2f}%）" if summary['return_pct'] is not None else ""
+    print(f"損益：{format_amount(summary['pnl'], valuation.currency, signed=True)}{return_pct}")
+    print("-" * 50)
+    for coin_id, coin in summary['coins'].items():
+        weight = f"{coin['weight'] * 100:.2f}%" if coin['weight'] is not None else "N/A"
+        print(f"{coin_id}: 數量 {coin['quantity']:g}，市值 {format_amount(coin['value'], valuation.currency)}（{weight}），"
+              f"損益 {format_amount(coin['pnl'], valuation.currency, signed=True)}")
+    if any(valuation.missing):
+        print(f"⚠️  有 {sum(1 for m in valuation.missing if m)} 天部分幣種無價格（以 0 計值）")
+    print("=" * 50)
+
+
+def run_ohlc(args, fetcher):
+    """原生 OHLC 模式：每種計價貨幣直接查詢一次 K 線（OHLC endpoint 支援各計價貨幣，不需換算）"""
+    failed = False
+    for currency in args.vs_currencies:
+        candles = fetcher.get_ohlc(args.coin_id, args.from_date, args.to_date, interval=args.granularity or 'daily',
+                                   vs_currency=currency, timeout=args.timeout)
+        stats = candles.statistics() if candles else None
+
+        if args.ndjson:
+            record = {'coin_id': args.coin_id, 'from': args.from_date, 'to': args.to_date, 'vs_currency': currency,
+                      'ok': bool(candles)}
+            if candles:
+                record.update(source=candles.source, granularity=candles.granularity, candles=candles.bars,
+                              stats=stats)
+            else:
+                record['error'] = "無法取得任何 K 線資料"
+            write_record(record)
+            failed = failed or not candles
+            continue
+
+        if not candles:
+            print(f"錯誤：無法取得 {currency.upper()} K 線資料", file=sys.stderr)
+            failed = True
+            continue
+
+        output_file = args.output
+        if output_file and len(args.vs_currencies) > 1:
+            root, ext = os.path.splitext(output_file)
+            output_file = f"{root}_{currency}{ext}"
+        output_file = candles.save(output_file or
+                                   f"{series_key(args.coin_id, currency)}_{args.from_date}_{args.to_date}_ohlc.csv")
+
+        print("=" * 50)
+        print(f"成功！K 線已儲存至：{output_file}")
+        print(f"來源：{candles.source}，K 線長度：{candles.granularity}，共 {stats['count']} 根")
+        change = f"（{stats['change_pct']:+.2f}%）" if stats['change_pct'] is not None else ""
+        print(f"開盤 {format_amount(stats['open'], currency)} → 收盤 {format_amount(stats['close'], currency)}{change}")
+        print(f"最高 {format_amount(stats['high'], currency)}，最低 {format_amount(stats['low'], currency)}")
+        print("=" * 50)
+
+    if failed:
+        sys.exit(1)
+
+
+def run_settlement(args, fetcher, num_days):
+    """結算規則模式：同一次下載依各規則分組，每種規則輸出一個 CSV（或一行 NDJSON），多個規則時並列比較"""
+    currency = args.vs_currencies[0]
+    results = fetcher.get_range_prices_by_policy(args.coin_id, args.from_date, args.to_date, args.settlements,
+                                                 debug=args.debug, timeout=args.timeout, vs_currency=currency)
+
+    if args.ndjson:
+        for name, prices in results.items():
+            record = {'coin_id': args.coin_id, 'from': args.from_date, 'to': args.to_date, 'vs_currency': currency,
+                      'settlement': name, 'ok': bool(prices)}
+            if prices:
+                record.update(prices=prices, stats=calculate_statistics(prices))
+            else:
+                record['error'] = "無法取得任何價格資料"
+            write_record(record, args.decimals)
+        if not all(results.values()):
+            sys.exit(1)
+        return
+
+    if not any(results.values()):
+        print("\n錯誤：無法取得任何價格資料", file=sys.stderr)
+        sys.exit(1)
+
+    if len(results) > 1:
+        # 各規則並列比較（無資料顯示 N/A）
+        names = list(results)
+        columns = {name: {p['date']: p['price'] for p in prices} for name, prices in results.items()}
+        dates = sorted(set().union(*columns.values()))
+        places = 8 if args.decimals is None else args.decimals
+        print(f"{'Date':<12}" + "".join(f"{name:>22}" for name in names) + f"  ({currency.upper()})")
+        for date_str in dates:
+            cells = [columns[name].get(date_str) for name in names]
+            print(f"{date_str:<12}" + "".join(f"{'N/A' if c is None else f'{c:,.{places}f}':>22}" for c in cells))
+
+    for name, prices in results.items():
+        output_file = args.output
+        if output_file:
+            root, ext = os.path.splitext(output_file)
+            output_file = f"{root}_{name}{ext}"
+        else:
+            output_file = f"{series_key(args.coin_id, currency)}_{args.from_date}_{args.to_date}_{name}_prices.csv"
+        print(f"\n{name}：{POLICIES[name].description}")
+        save_to_csv(prices, args.coin_id, args.from_date, args.to_date, output_file, currency=currency,
+                    decimals=args.decimals)
+
+
+def run_series(args, fetcher, num_days):
+    """每日價格加上 OHLC K 線：同一次下載同時輸出兩者（CSV 或一行 NDJSON；每日價格與日 K 依同一結算規則）"""
+    currency = args.vs_currencies[0]
+    policy = args.settlements[0]
+    # 非預設結算規則時檔名加上規則名稱（與 run_settlement 相同）
+    suffix = '' if policy == DEFAULT_POLICY.name else f"_{policy}"
+    if not args.ndjson:
+        print(f"開始取得 {args.coin_id} 從 {args.from_date} 到 {args.to_date} 的價格與 {args.granularity} K 線...")
+        print("-" * 50)
+    prices, bars = fetcher.get_range_series(args.coin_id, args.from_date, args.to_date, args.granularity,
+                                            debug=args.debug,
+                                            progress_callback=None if args.ndjson else partial(
+                                                print_progress, currency=currency, decimals=args.decimals),
+                                            timeout=args.timeout, vs_currency=currency, policy=policy)
+
+    if args.ndjson:
+        record = {'coin_id': args.coin_id, 'from': args.from_date, 'to': args.to_date, 'vs_currency': currency,
+                  'granularity': args.granularity, 'settlement': policy, 'ok': bool(prices)}
+        if prices:
+            record.update(prices=prices, stats=calculate_statistics(prices), bars=bars)
+        else:
+            record['error'] = "無法取得任何價格資料"
+        write_record(record, args.decimals)
+        if not prices:
+            sys.exit(1)
+        return
+
+    if not prices:
+        print("\n錯誤：無法取得任何價格資料", file=sys.stderr)
+        sys.exit(1)
+    print("-" * 50)
+    print(f"查詢完成！取得 {len([p for p in prices if p['price'] is not None])} / {num_days} 天的資料，"
+          f"{len(bars)} 根 K 線")
+
+    if args.output:
+        root, ext = os.path.splitext(args.output)
+        output_file = f"{root}{suffix}{ext}"
+        bars_file = f"{root}{suffix}_{args.granularity}_bars{ext or '.csv'}"
+    else:
+        stem = f"{series_key(args.coin_id, currency)}_{args.from_date}_{args.to_date}{suffix}"
+        output_file = f"{stem}_prices.csv" if suffix else None
+        bars_file = f"{stem}_{args.granularity}_bars.csv"
+    save_to_csv(prices, args.coin_id, args.from_date, args.to_date, output_file, currency=currency,
+                decimals=args.decimals)
+    try:
+        print(f"K 線已儲存至：{save_bars_csv(bars, bars_file, currency)}")
+    except Exception as e:
+        print(f"錯誤：{e}", file=sys.stderr)
+
+
+def finish_profile(profiler, args):
+    """停止效能分析並輸出 trace、彙總表與 cProfile 統計（輸出到 stderr，不影響 NDJSON）"""
+    profiler.stop()
+    trace_file = args.profile or 'profile_trace.json'
+    try:
+        profiler.save_trace(trace_file)
+        print(f"\n效能分析 trace 已儲存至：{trace_file}（以 chrome://tracing 或 ui.perfetto.dev 開啟）", file=sys.stderr)
+        print(profiler.format_summary(), file=sys.stderr)
+        if args.cprofile:
+            stats_file = profiler.save_cprofile(f"{os.path.splitext(trace_file)[0]}.pstats")
+            print(f"\ncProfile 統計已儲存至：{stats_file}", file=sys.stderr)
+            print(profiler.format_cprofile(), file=sys.stderr)
+    except Exception as e:
+        print(f"錯誤：無法儲存效能分析結果：{e}", file=sys.stderr)
 
 
 def main():
     """主程式"""
     args = parse_arguments()
+    configure_logging(args.log_level, args.log_format)
+    if not (args.profile or args.cprofile):
+        run(args)
+        return
+
+    # 佇列的多行程模式只分析本行程（子行程不記錄）
+    profiler = Profiler(use_cprofile=args.cprofile).start()
+    try:
+        run(args)
+    finally:
+        finish_profile(profiler, args)
 
+
+def run(args):
+    """依參數執行對應的模式"""
     try:
+        # 幣種代號/名稱解析（讀取本地目錄快取；沒有快取時以內建常用幣種為準，未知的字串原樣當作 ID）
+        registry = CoinRegistry()
+        registry.load()
+        if args.sync_coins:
+            sync_coins(registry, args.api_key)
+        if args.coin_id:
+            args.coin_id = ','.join(registry.resolve(c) for c in args.coin_id.split(',') if c.strip())
+        elif not args.jobs and not args.portfolio and not args.queue:
+            return
+
+        if args.queue:
+            run_queue(args)
+            return
+        if args.watch:
+            run_watch(args)
+            return
+        if args.jobs:
+            run_jobs(args)
+            return
+
         # 驗證日期
         from_dt = validate_date(args.from_date, "開始日期")
         to_dt = validate_date(args.to_date, "結束日期")
 
+        if args.portfolio:
+            if from_dt > to_dt:
+                raise ValueError("開始日期不能晚於結束日期")
+            run_portfolio(args, args.from_date, args.to_date)
+            return
+
         # 驗證 from < to
         if from_dt >= to_dt:
             raise ValueError("開始日期必須早於結束日期（至少要有 2 天的區間）")
@@ -398,27 +832,71 @@ def main():
         if delta.days >= 100:
             raise ValueError(f"日期區間不能超過 100 天（目前：{delta.days + 1} 天）")
 
+        fetcher = CoinGeckoPriceFetcher(api_key=args.api_key, hedge_percentile=args.hedge_percentile)
+        currencies = args.vs_currencies
+
+        if args.ohlc:
+            run_ohlc(args, fetcher)
+            return
+        if args.granularity:
+            run_series(args, fetcher, delta.days + 1)
+            return
+        if args.settlements != [DEFAULT_POLICY.name]:
+            run_settlement(args, fetcher, delta.days + 1)
+            return
+
+        if args.ndjson:
+            # NDJSON：stdout 每種計價貨幣輸出一行結果紀錄，方便接在管線中
+            results = fetcher.get_range_prices_multi(args.coin_id, args.from_date, args.to_date, currencies,
+                                                     debug=args.debug, timeout=args.timeout)
+            for currency, prices in results.items():
+                record = {'coin_id': args.coin_id, 'from': args.from_date, 'to': args.to_date,
+                          'vs_currency': currency, 'ok': bool(prices)}
+                if prices:
+                    record.update(prices=prices, stats=calculate_statistics(prices))
+                else:
+                    record['error'] = "無法取得任何價格資料"
+                write_record(record, args.decimals)
+            if not all(results.values()):
+                sys.exit(1)
+            return
+
         print("=" * 50)
         print("虛擬幣價格查詢工具")
         print("=" * 50)
         print(f"幣種 ID：{args.coin_id}")
         print(f"日期區間：{args.from_date} ~ {args.to_date}")
         print(f"查詢天數：{delta.days + 1} 天")
+        print(f"計價貨幣：{', '.join(c.upper() for c in currencies)}")
         print("=" * 50)
         print()
 
-        # 建立 fetcher
-        fetcher = CoinGeckoPriceFetcher(api_key=args.api_key)
+        # 取得價格資料（只查詢一次 USD 價格，其他計價貨幣以每日匯率換算）
+        print(f"開始取得 {args.coin_id} 從 {args.from_date} 到 {args.to_date} 的價格資料...")
+        print(f"共需查詢 {delta.days + 1} 天，請稍候...")
+        print("-" * 50)
+        results = fetcher.get_range_prices_multi(args.coin_id, args.from_date, args.to_date, currencies,
+                                                 debug=args.debug,
+                                                 progress_callback=partial(print_progress, decimals=args.decimals),
+                                                 timeout=args.timeout)
+        prices = results[currencies[0]]
 
-        # 取得價格資料
-        prices = fetcher.get_range_prices(args.coin_id, args.from_date, args.to_date, debug=args.debug)
+        if prices:
+            print("-" * 50)
+            print(f"查詢完成！取得 {len([p for p in prices if p['price'] is not None])} / {delta.days + 1} 天的資料")
 
-        if not prices:
+        if not any(results.values()):
             print("\n錯誤：無法取得任何價格資料", file=sys.stderr)
             sys.exit(1)
 
-        # 儲存為 CSV
-        save_to_csv(prices, args.coin_id, args.from_date, args.to_date, args.output)
+        # 儲存為 CSV（每種計價貨幣一個檔案）
+        for currency, prices in results.items():
+            output_file = args.output
+            if output_file and len(currencies) > 1:
+                root, ext = os.path.splitext(output_file)
+                output_file = f"{root}_{currency}{ext}"
+            save_to_csv(prices, args.coin_id, args.from_date, args.to_date, output_file, currency=currency,
+                        decimals=args.decimals)
 
     except ValueError as e:
         print(f"錯誤：{e}", file=sys.stderr)
@@ -0,0 +1,519 @@
+"""
+虛擬幣價格查詢工具 - GUI 元件
+"""
+
+import customtkinter as ctk
+from datetime import date, datetime
+
+from src.downsample import MultiResolutionSeries
+
+
+def _date_to_x(date_str):
+    """將 YYYY-MM-DD（或含時間的 YYYY-MM-DD HH:MM）轉為以日為單位的座標"""
+    if len(date_str) > 10:
+        dt = datetime.strptime(date_str[:16], "%Y-%m-%d %H:%M")
+        return dt.toordinal() + (dt.hour * 60 + dt.minute) / 1440.0
+    return float(datetime.strptime(date_str, "%Y-%m-%d").toordinal())
+
+
+def _x_to_label(x):
+    """將座標轉回日期標籤"""
+    return date.fromordinal(int(x)).strftime("%Y-%m-%d")
+
+
+class PriceChart(ctk.CTkFrame):
+    """
+    價格走勢圖
+    依繪圖區像素寬度以 LTTB 降採樣後繪製，資料串流進來時合併重繪；
+    滾輪縮放、拖曳平移時只重新取樣可見視窗，雙擊恢復完整範圍
+    """
+
+    PADDING_LEFT = 90
+    PADDING_RIGHT = 15
+    PADDING_TOP = 25
+    PADDING_BOTTOM = 25
+    ZOOM_STEP = 1.25
+
+    def __init__(self, master, height=220, **kwargs):
+        super().__init__(master, **kwargs)
+
+        self.canvas = ctk.CTkCanvas(self, height=height, bg="#1e1e1e", highlightthickness=0)
+        self.canvas.pack(fill="both", expand=True)
+
+        self.series = MultiResolutionSeries()
+        self.title = ""
+        self.view = None  # 目前可見的 (x_min, x_max)；None 表示完整範圍
+        self._redraw_pending = False
+        self._drag_start = None
+
+        self.canvas.bind("<Configure>", lambda event: self.schedule_redraw())
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Button-4>", lambda event: self._zoom(event.x, 1 / self.ZOOM_STEP))
+        self.canvas.bind("<Button-5>", lambda event: self._zoom(event.x, self.ZOOM_STEP))
+        self.canvas.bind("<ButtonPress-1>", self._on_drag_start)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<Double-Button-1>", lambda event: self.reset_view())
+
+    # ==================== 資料 ====================
+
+    def set_series(self, prices, title=""):
+        """
+        設定要繪製的價格資料（取代現有資料並恢復完整範圍）
+        :param prices: 價格資料列表 [{date, price}, ...]（price 為 None 的日期略過）
+        :param title: 圖表標題
+        """
+        self.series = MultiResolutionSeries(
+            [(_date_to_x(p['date']), p['price']) for p in prices if p['price'] is not None]
+        )
+        self.title = title
+        self.view = None
+        self.schedule_redraw()
+
+    def append(self, prices):
+        """
+        附加串流進來的價格資料（同一 UI 週期內的多次附加只重繪一次）
+        :param prices: 價格資料列表 [{date, price}, ...]，日期需晚於現有資料
+        """
+        points = [(_date_to_x(p['date']), p['price']) for p in prices if p['price'] is not None]
+        if points:
+            self.series.extend(points)
+            self.schedule_redraw()
+
+    def clear(self):
+        """清空圖表"""
+        self.set_series([])
+
+    def reset_view(self):
+        """恢復完整範圍"""
+        self.view = None
+        self.schedule_redraw()
+
+    # ==================== 繪製 ====================
+
+    def schedule_redraw(self):
+        """排程重繪（合併同一 UI 週期內的多次請求）"""
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.after_idle(self._redraw)
+
+    def _plot_area(self):
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        return (self.PADDING_LEFT, self.PADDING_TOP,
+                max(self.PADDING_LEFT + 1, width - self.PADDING_RIGHT),
+                max(self.PADDING_TOP + 1, height - self.PADDING_BOTTOM))
+
+    def _visible_range(self):
+        bounds = self.series.bounds()
+        if bounds is None:
+            return None
+        x_min, x_max = self.view or bounds
+        if x_max <= x_min:
+            x_min, x_max = x_min - 0.5, x_max + 0.5  # 單一資料點
+        return x_min, x_max
+
+    def _redraw(self):
+        self._redraw_pending = False
+        self.canvas.delete("all")
+
+        left, top, right, bottom = self._plot_area()
+        visible = self._visible_range()
+        if visible is None:
+            self.canvas.create_text((left + right) / 2, (top + bottom) / 2, text="尚無資料", fill="gray")
+            return
+        x_min, x_max = visible
+
+        # 只取可見視窗並降採樣到繪圖區寬度（每像素一點）
+        points = self.series.window(x_min, x_max, int(right - left))
+        in_view = [y for x, y in points if x_min <= x <= x_max] or [y for _, y in points]
+        y_min, y_max = min(in_view), max(in_view)
+        if y_max <= y_min:
+            y_min, y_max = y_min * 0.99 - 1e-12, y_max * 1.01 + 1e-12
+
+        def to_canvas(x, y):
+            cx = left + (x - x_min) / (x_max - x_min) * (right - left)
+            cy = bottom - (y - y_min) / (y_max - y_min) * (bottom - top)
+            return cx, cy
+
+        coords = []
+        for x, y in points:
+            coords.extend(to_canvas(x, y))
+        if len(points) == 1:
+            cx, cy = coords
+            self.canvas.create_oval(cx - 2, cy - 2, cx + 2, cy + 2, fill="#1f6aa5", outline="")
+        else:
+            self.canvas.create_line(*coords, fill="#1f6aa5", width=2)
+
+        # 遮住延伸到視窗外的線段，再畫座標軸與標籤
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        self.canvas.create_rectangle(0, 0, left - 1, height, fill="#1e1e1e", outline="")
+        self.canvas.create_rectangle(right + 1, 0, width, height, fill="#1e1e1e", outline="")
+        self.canvas.create_rectangle(left, top, right, bottom, outline="#444444")
+        self.canvas.create_text(left - 5, top, text=f"${y_max:,.8g}", anchor="e", fill="gray")
+        self.canvas.create_text(left - 5, bottom, text=f"${y_min:,.8g}", anchor="e", fill="gray")
+        self.canvas.create_text(left, bottom + 12, text=_x_to_label(x_min), anchor="w", fill="gray")
+        self.canvas.create_text(right, bottom + 12, text=_x_to_label(x_max), anchor="e", fill="gray")
+        if self.title:
+            self.canvas.create_text(left, top - 12, text=self.title, anchor="w", fill="white")
+
+    # ==================== 縮放/平移 ====================
+
+    def _on_wheel(self, event):
+        self._zoom(event.x, 1 / self.ZOOM_STEP if event.delta > 0 else self.ZOOM_STEP)
+
+    def _zoom(self, canvas_x, factor):
+        """以滑鼠位置為中心縮放（factor < 1 放大）"""
+        visible = self._visible_range()
+        if visible is None:
+            return
+        x_min, x_max = visible
+        left, _, right, _ = self._plot_area()
+        ratio = min(1.0, max(0.0, (canvas_x - left) / (right - left)))
+        anchor = x_min + ratio * (x_max - x_min)
+        span = max(1.0, (x_max - x_min) * factor)  # 至少顯示一天
+        self._set_view(anchor - ratio * span, anchor - ratio * span + span)
+
+    def _on_drag_start(self, event):
+        self._drag_start = (event.x, self._visible_range())
+
+    def _on_drag(self, event):
+        if not self._drag_start or self._drag_start[1] is None:
+            return
+        start_x, (x_min, x_max) = self._drag_start
+        left, _, right, _ = self._plot_area()
+        shift = (start_x - event.x) / (right - left) * (x_max - x_min)
+        self._set_view(x_min + shift, x_max + shift)
+
+    def _set_view(self, x_min, x_max):
+        """設定可見範圍（限制在資料範圍內；涵蓋全部時恢復完整範圍）"""
+        lo, hi = self.series.bounds()
+        span = x_max - x_min
+        if span >= hi - lo:
+            self.view = None
+        else:
+            x_min = min(max(x_min, lo), hi - span)
+            self.view = (x_min, x_min + span)
+        self.schedule_redraw()
+
+
+class VirtualTable(ctk.CTkFrame):
+    """
+    虛擬化表格
+    資料以列陣列保存在記憶體中，畫面只建立可見列數的文字項目並重複使用；
+    排序與缺漏篩選只重新計算索引順序，不重建元件
+    """
+
+    FILTER_ALL = "全部"
+    FILTER_MISSING = "僅缺漏"
+    FILTER_VALID = "僅有效"
+
+    def __init__(self, master, columns, missing_column=None, height=240, row_height=20, **kwargs):
+        """
+        初始化
+        :param columns: 欄位定義 [(標題, 寬度, 格式化函數或 None), ...]
+        :param missing_column: 判斷缺漏的欄位索引（該欄為 None 視為缺漏；None 表示不提供篩選）
+        :param height: 表格高度（像素）
+        :param row_height: 列高（像素）
+        """
+        super().__init__(master, **kwargs)
+        self.columns = columns
+        self.missing_column = missing_column
+        self.row_height = row_height
+
+        self._rows = []  # 原始資料列（tuple）
+        self._view = []  # 目前顯示順序（篩選、排序後的列索引）
+        self._sort_column = None
+        self._sort_descending = False
+        self._filter = self.FILTER_ALL
+        self._first = 0  # 第一個可見列在 _view 中的位置
+        self._slots = []  # 可重複使用的文字項目 [[item_id, ...], ...]
+        self._view_dirty = False
+        self._redraw_pending = False
+
+        # 篩選
+        if missing_column is not None:
+            self.filter_button = ctk.CTkSegmentedButton(
+                self,
+                values=[self.FILTER_ALL, self.FILTER_MISSING, self.FILTER_VALID],
+                command=self.set_filter
+            )
+            self.filter_button.set(self.FILTER_ALL)
+            self.filter_button.pack(anchor="e", pady=(0, 5))
+
+        # 表頭（點擊排序）
+        self.header = ctk.CTkCanvas(self, height=row_height + 4, bg="#2b2b2b", highlightthickness=0)
+        self.header.pack(fill="x")
+        self.header.bind("<Button-1>", self._on_header_click)
+
+        body = ctk.CTkFrame(self, fg_color="transparent")
+        body.pack(fill="both", expand=True)
+        self.canvas = ctk.CTkCanvas(body, height=height, bg="#1e1e1e", highlightthickness=0)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar = ctk.CTkScrollbar(body, command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.canvas.bind("<Configure>", lambda event: self._rebuild_slots())
+        self.canvas.bind("<MouseWheel>", lambda event: self.scroll(-3 if event.delta > 0 else 3))
+        self.canvas.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll(3))
+
+    # ==================== 資料 ====================
+
+    def set_rows(self, rows):
+        """取代全部資料列"""
+        self._rows = list(rows)
+        self._first = 0
+        self._invalidate()
+
+    def append_rows(self, rows):
+        """附加資料列（同一 UI 週期內的多次附加只重新整理一次）"""
+        self._rows.extend(rows)
+        self._invalidate()
+
+    def update_rows(self, updates):
+        """
+        更新指定資料列（不重建元件）
+        :param updates: dict {列索引（依加入順序）: 新的資料列}
+        """
+        for index, row in updates.items():
+            self._rows[index] = row
+        self._invalidate()
+
+    def clear(self):
+        """清空表格"""
+        self.set_rows([])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def sort_by(self, column, descending=None):
+        """
+        依欄位排序（None 值固定排在最後）
+        :param column: 欄位索引
+        :param descending: 是否遞減（None 表示同欄位再次排序時反轉）
+        """
+        if descending is None:
+            descending = not self._sort_descending if self._sort_column == column else False
+        self._sort_column = column
+        self._sort_descending = descending
+        self._first = 0
+        self._invalidate()
+
+    def set_filter(self, mode):
+        """
+        設定缺漏篩選
+        :param mode: FILTER_ALL / FILTER_MISSING / FILTER_VALID
+        """
+        self._filter = mode
+        self._first = 0
+        self._invalidate()
+
+    def _invalidate(self):
+        self._view_dirty = True
+        self._schedule_redraw()
+
+    def _rebuild_view(self):
+        """依篩選與排序重新計算顯示順序（只處理索引，不複製資料列）"""
+        rows = self._rows
+        indices = range(len(rows))
+        if self.missing_column is not None and self._filter != self.FILTER_ALL:
+            want_missing = self._filter == self.FILTER_MISSING
+            indices = [i for i in indices if (rows[i][self.missing_column] is None) == want_missing]
+
+        if self._sort_column is None:
+            self._view = list(indices)
+        else:
+            column = self._sort_column
+            present = [i for i in indices if rows[i][column] is not None]
+            missing = [i for i in indices if rows[i][column] is None]
+            present.sort(key=lambda i: rows[i][column], reverse=self._sort_descending)
+            self._view = present + missing
+        self._view_dirty = False
+
+    # ==================== 捲動 ====================
+
+    def _visible_count(self):
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def scroll(self, delta_rows):
+        """捲動指定列數"""
+        self._first += delta_rows
+        self._schedule_redraw()
+
+    def _on_scrollbar(self, *args):
+        # 相容 Tk 捲軸協定：("moveto", fraction) 或 ("scroll", n, "units"/"pages")
+        if args[0] == "moveto":
+            self._first = int(float(args[1]) * len(self._view))
+        elif args[0] == "scroll":
+            step = int(args[1]) * (self._visible_count() if args[2] == "pages" else 1)
+            self._first += step
+        self._schedule_redraw()
+
+    # ==================== 繪製 ====================
+
+    def _schedule_redraw(self):
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.after_idle(self._redraw)
+
+    def _rebuild_slots(self):
+        """依可見列數建立文字項目（只在表格大小改變時執行）"""
+        self.canvas.delete("all")
+        self._slots = []
+        for slot in range(self._visible_count() + 1):
+            y = slot * self.row_height + self.row_height / 2
+            x = 5
+            items = []
+            for _, width, _ in self.columns:
+                items.append(self.canvas.create_text(x, y, text="", anchor="w", fill="white",
+                                                     font=("Monaco", 11)))
+                x += width
+            self._slots.append(items)
+        self._draw_header()
+        self._schedule_redraw()
+
+    def _draw_header(self):
+        self.header.delete("all")
+        x = 5
+        for index, (title, width, _) in enumerate(self.columns):
+            if index == self._sort_column:
+                title += " ▼" if self._sort_descending else " ▲"
+            self.header.create_text(x, (self.row_height + 4) / 2, text=title, anchor="w", fill="gray",
+                                    font=("Monaco", 11, "bold"))
+            x += width
+
+    def _on_header_click(self, event):
+        x = 5
+        for index, (_, width, _) in enumerate(self.columns):
+            if event.x < x + width:
+                self.sort_by(index)
+                return
+            x += width
+
+    def _redraw(self):
+        self._redraw_pending = False
+        if self._view_dirty:
+            self._rebuild_view()
+            self._draw_header()
+
+        visible = self._visible_count()
+        total = len(self._view)
+        self._first = max(0, min(self._first, total - visible))
+
+        # 只更新可見列的文字項目
+        for slot, items in enumerate(self._slots):
+            position = self._first + slot
+            row = self._rows[self._view[position]] if position < total else None
+            for column, item in enumerate(items):
+                if row is None:
+                    text = ""
+                else:
+                    value = row[column]
+                    formatter = self.columns[column][2]
+                    text = formatter(value) if formatter else ("N/A" if value is None else str(value))
+                self.canvas.itemconfigure(item, text=text)
+
+        if total:
+            self.scrollbar.set(self._first / total, min(1.0, (self._first + visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+
+class CoinMultiSelect(ctk.CTkFrame):
+    """幣種多選清單（可搜尋；勾選變動時回調）"""
+
+    SEARCH_LIMIT = 50  # 使用外部搜尋時最多顯示的筆數
+
+    def __init__(self, master, coins, height=140, on_change=None, search=None, **kwargs):
+        """
+        初始化
+        :param coins: 預設顯示的幣種列表 [{symbol, id, name}, ...]
+        :param height: 清單高度（像素）
+        :param on_change: 勾選變動時的回調 callback(selected_ids)
+        :param search: 搜尋函數 search(keyword, limit) -> [{symbol, id, name}, ...]（如 CoinRegistry.search）；
+                       未指定時只在預設列表中比對
+        """
+        super().__init__(master, **kwargs)
+        self.on_change = on_change
+        self.search = search
+        self._vars = {}  # coin_id -> BooleanVar
+        self._boxes = {}  # coin_id -> (搜尋用文字, CTkCheckBox)
+        self._default_ids = [coin['id'] for coin in coins]
+
+        self.search_entry = ctk.CTkEntry(self, placeholder_text="搜尋幣種（代號或名稱）")
+        self.search_entry.pack(fill="x", pady=(0, 5))
+        self.search_entry.bind("<KeyRelease>", lambda event: self._apply_search())
+
+        self.list_frame = ctk.CTkScrollableFrame(self, height=height)
+        self.list_frame.pack(fill="x")
+
+        for coin in coins:
+            self._add_coin(coin).pack(anchor="w", pady=1)
+
+    def _add_coin(self, coin):
+        """建立幣種的勾選框（已存在時直接回傳）"""
+        if coin['id'] in self._boxes:
+            return self._boxes[coin['id']][1]
+        var = ctk.BooleanVar(value=False)
+        box = ctk.CTkCheckBox(
+            self.list_frame,
+            text=f"{coin['symbol']} - {coin['name']}",
+            variable=var,
+            command=self._changed
+        )
+        self._vars[coin['id']] = var
+        self._boxes[coin['id']] = (f"{coin['symbol']} {coin['name']} {coin['id']}".lower(), box)
+        return box
+
+    def _apply_search(self):
+        """只顯示符合搜尋字串的幣種（已勾選者保持勾選）"""
+        keyword = self.search_entry.get().strip().lower()
+        for text, box in self._boxes.values():
+            box.pack_forget()
+
+        if not keyword:
+            # 預設列表，加上從搜尋結果勾選的其他幣種
+            shown = self._default_ids + [coin_id for coin_id, var in self._vars.items()
+                                         if var.get() and coin_id not in self._default_ids]
+        elif self.search:
+            shown = []
+            for coin in self.search(keyword, self.SEARCH_LIMIT):
+                self._add_coin(coin)
+                shown.append(coin['id'])
+        else:
+            shown = [coin_id for coin_id, (text, box) in self._boxes.items() if keyword in text]
+
+        # 銷毀不再顯示的搜尋結果（預設列表與已勾選者保留），勾選框數量不隨搜尋次數增加
+        keep = set(shown) | set(self._default_ids)
+        for coin_id in [c for c in self._boxes if c not in keep and not self._vars[c].get()]:
+            self._boxes.pop(coin_id)[1].destroy()
+            del self._vars[coin_id]
+
+        for coin_id in shown:
+            self._boxes[coin_id][1].pack(anchor="w", pady=1)
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change(self.get_selected())
+
+    def get_selected(self):
+        """取得已勾選的幣種 ID（依清單順序）"""
+        return [coin_id for coin_id, var in self._vars.items() if var.get()]
+
+    def set_selected(self, coin_ids):
+        """設定勾選的幣種（不在清單中的 ID 以搜尋函數查找，找不到時忽略）"""
+        selected = set(coin_ids)
+        if self.search:
+            for coin_id in selected - set(self._vars):
+                matches = self.search(coin_id, 1)
+                if matches and matches[0]['id'] == coin_id:
+                    self._add_coin(matches[0])
+        for coin_id, var in self._vars.items():
+            var.set(coin_id in selected)
+        self._apply_search()
+        self._changed()
+
+    def clear_selection(self):
+        """取消所有勾選"""
+        self.set_selected([])
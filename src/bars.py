@@ -0,0 +1,268 @@
+"""
+K 線聚合模組
+market_chart/range 的回應本身就含有盤中取樣點（免費方案：1 天內約 5 分鐘、90 天內每小時），
+以單次串流掃描將取樣點依時間桶聚合為 OHLC + 成交量 K 線，
+與每日結算價共用同一份回應，不必為盤中分析重複下載；
+只需要 K 線時則直接使用 /coins/{id}/ohlc 的原生 K 線（CandleSeries），資料量小得多
+"""
+
+import csv
+import io
+from datetime import date, datetime, timezone
+
+from src.settlement import get_policy
+from src.utils import atomic_write
+
+
+GRANULARITY_RAW = 'raw'  # 每個取樣點一根（不聚合）
+GRANULARITY_HOURLY = 'hourly'
+GRANULARITY_4H = '4h'
+GRANULARITY_DAILY = 'daily'  # 以結算規則的結算時刻為界，與每日結算價同一日期
+
+# 時間桶長度（毫秒）
+GRANULARITIES = {
+    GRANULARITY_RAW: 0,
+    GRANULARITY_HOURLY: 3600 * 1000,
+    GRANULARITY_4H: 4 * 3600 * 1000,
+    GRANULARITY_DAILY: 24 * 3600 * 1000,
+}
+
+def _label(start_ms, granularity, policy):
+    """K 線的時間標籤：日 K 為結算日期，其他為起始時間（UTC）"""
+    if granularity == GRANULARITY_DAILY:
+        return policy.settlement_date(start_ms)
+    dt = datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc)
+    return dt.strftime("%Y-%m-%d %H:%M:%S" if granularity == GRANULARITY_RAW else "%Y-%m-%d %H:%M")
+
+
+def _bar(start_ms, open_, high, low, close, volume, samples, granularity, policy):
+    return {
+        'time': _label(start_ms, granularity, policy),
+        'timestamp': start_ms,
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+        'samples': samples,
+    }
+
+
+def aggregate_bars(prices, volumes=None, granularity=GRANULARITY_HOURLY, policy=None):
+    """
+    將取樣點聚合為 K 線（產生器：每個時間桶結束即產生一根，不保留整份取樣）
+    成交量為 K 線收盤時的 24 小時滾動成交量（CoinGecko 只提供滾動成交量；日 K 即為當日成交量）
+    :param prices: [[timestamp_ms, price], ...]，依時間遞增排序（market_chart 的 prices）
+    :param volumes: [[timestamp_ms, volume], ...]（market_chart 的 total_volumes，可選）
+    :param granularity: raw / hourly / 4h / daily
+    :param policy: 日 K 的結算規則（以各日結算時刻為界，預設為前一天 UTC 16:00，見 src.settlement）
+    :return: 產生 {time, timestamp, open, high, low, close, volume, samples}
+    :raises ValueError: 不支援的粒度
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"不支援的 K 線粒度：{granularity}（可用：{', '.join(GRANULARITIES)}）")
+    policy = get_policy(policy)
+    size = GRANULARITIES[granularity]
+    daily = granularity == GRANULARITY_DAILY
+    volume_at = dict((timestamp, volume) for timestamp, volume in volumes or ())
+
+    bar = None  # [start, open, high, low, close, volume, samples]
+    bucket = None  # 目前時間桶（日 K 為結算日期序號，其他為起始時間）
+    for timestamp, price in prices:
+        if price is None:
+            continue
+        key = policy.day_number(timestamp) if daily else (timestamp // size * size if size else timestamp)
+        volume = volume_at.get(timestamp)
+        if bar is not None and bucket == key:
+            if price > bar[2]:
+                bar[2] = price
+            elif price < bar[3]:
+                bar[3] = price
+            bar[4] = price
+            if volume is not None:
+                bar[5] = volume
+            bar[6] += 1
+        else:
+            if bar is not None:
+                yield _bar(*bar, granularity, policy)
+            start = policy.settlement_ms(date.fromordinal(key).isoformat()) if daily else key
+            bar = [start, price, price, price, price, volume, 1]
+            bucket = key
+    if bar is not None:
+        yield _bar(*bar, granularity, policy)
+
+
+def bars_in_range(bars, from_date, to_date):
+    """
+    取出日期區間內的 K 線（依時間標籤的日期：日 K 為結算日期，盤中 K 線為起始時間的 UTC 日期）
+    :param bars: K 線列表
+    :param from_date: 開始日期（YYYY-MM-DD）
+    :param to_date: 結束日期（YYYY-MM-DD）
+    :return: K 線列表
+    """
+    return [bar for bar in bars if from_date <= bar['time'][:10] <= to_date]
+
+
+def convert_bars(bars, rates, policy=None):
+    """
+    以每日匯率換算 K 線（依各 K 線起始時間的結算日期取匯率）
+    :param bars: K 線列表（USD）
+    :param rates: dict {date: rate}（依同一結算規則結算的匯率）
+    :param policy: 結算規則（預設為前一天 UTC 16:00）
+    :return: 換算後的 K 線列表（沒有匯率的 K 線不列入）
+    """
+    policy = get_policy(policy)
+    converted = []
+    for bar in bars:
+        rate = rates.get(policy.settlement_date(bar['timestamp']))
+        if rate is None:
+            continue
+        item = dict(bar)
+        for field in ('open', 'high', 'low', 'close', 'volume'):
+            if item[field] is not None:
+                item[field] = float(f"{item[field] * rate:.10g}")
+        converted.append(item)
+    return converted
+
+
+def parse_ohlc(rows):
+    """
+    解析 /coins/{id}/ohlc 與 ohlc/range 的回應
+    API 的時間戳為 K 線收盤時間，轉為與 aggregate_bars 相同的起始時間（以相鄰 K 線的最小間隔推算長度）
+    :param rows: [[timestamp_ms, open, high, low, close], ...]
+    :return: (K 線列表（volume 與 samples 為 None）, K 線長度毫秒數或 None)
+    :raises ValueError: 回應格式錯誤
+    """
+    candles = []
+    for row in rows:
+        if not isinstance(row, (list, tuple)) or len(row) < 5:
+            raise ValueError(f"K 線資料格式不正確：{row!r}")
+        try:
+            candles.append((int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4])))
+        except (TypeError, ValueError):
+            raise ValueError(f"K 線資料格式不正確：{row!r}")
+    candles.sort()
+
+    gaps = [b[0] - a[0] for a, b in zip(candles, candles[1:]) if b[0] > a[0]]
+    size = min(gaps) if gaps else None
+    daily = size is not None and size >= GRANULARITIES[GRANULARITY_DAILY]
+
+    bars = []
+    for close_ms, open_, high, low, close in candles:
+        start = close_ms - size if size else close_ms
+        dt = datetime.fromtimestamp(start / 1000, tz=timezone.utc)
+        bars.append({
+            'time': dt.strftime("%Y-%m-%d" if daily else "%Y-%m-%d %H:%M"),
+            'timestamp': start,
+            'open': open_,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': None,
+            'samples': None,
+        })
+    return bars, size
+
+
+class CandleSeries:
+    """K 線序列（依時間遞增排列；來源為 market_chart 取樣聚合或原生 OHLC endpoint）"""
+
+    def __init__(self, bars, granularity, currency='usd', source='ohlc'):
+        """
+        初始化
+        :param bars: K 線列表 [{time, timestamp, open, high, low, close, volume, samples}, ...]
+        :param granularity: K 線粒度（raw / hourly / 4h / daily，原生 K 線為 API 決定的長度如 30m、4d）
+        :param currency: 計價貨幣
+        :param source: 資料來源（ohlc / ohlc/range / market_chart）
+        """
+        self.bars = bars
+        self.granularity = granularity
+        self.currency = currency
+        self.source = source
+
+    def __len__(self):
+        return len(self.bars)
+
+    def __iter__(self):
+        return iter(self.bars)
+
+    def statistics(self):
+        """
+        彙總統計
+        :return: dict {open, close, high, low, change_pct, avg_close, count}；沒有 K 線時數值為 None
+        """
+        if not self.bars:
+            return {'open': None, 'close': None, 'high': None, 'low': None, 'change_pct': None,
+                    'avg_close': None, 'count': 0}
+        first, last = self.bars[0], self.bars[-1]
+        return {
+            'open': first['open'],
+            'close': last['close'],
+            'high': max(bar['high'] for bar in self.bars),
+            'low': min(bar['low'] for bar in self.bars),
+            'change_pct': (last['close'] - first['open']) / first['open'] * 100 if first['open'] else None,
+            'avg_close': round(sum(bar['close'] for bar in self.bars) / len(self.bars), 8),
+            'count': len(self.bars),
+        }
+
+    def to_csv(self):
+        """轉為 CSV 文字（見 format_bars_csv）"""
+        return format_bars_csv(self.bars, self.currency)
+
+    def save(self, output_file):
+        """儲存為 CSV 檔案（見 save_bars_csv）"""
+        return save_bars_csv(self.bars, output_file, self.currency)
+
+
+def granularity_name(size_ms):
+    """K 線長度的顯示名稱（如 30m、4h、daily、4d）"""
+    if not size_ms:
+        return GRANULARITY_RAW
+    for name, size in GRANULARITIES.items():
+        if size == size_ms:
+            return name
+    minutes = size_ms // 60000
+    if minutes % 1440 == 0:
+        return f"{minutes // 1440}d"
+    if minutes % 60 == 0:
+        return f"{minutes // 60}h"
+    return f"{minutes}m"
+
+
+def format_bars_csv(bars, currency='usd'):
+    """
+    將 K 線轉為 CSV 文字（原生 OHLC 沒有成交量與取樣數，省略這兩欄）
+    :param bars: K 線列表
+    :param currency: 計價貨幣（用於欄位名稱）
+    :return: CSV 字串
+    """
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer)
+    currency = currency.upper()
+    aggregated = any(bar['samples'] is not None for bar in bars)
+    header = ['Time (UTC)', f'Open ({currency})', f'High ({currency})', f'Low ({currency})', f'Close ({currency})']
+    writer.writerow(header + [f'Volume 24h ({currency})', 'Samples'] if aggregated else header)
+    for bar in bars:
+        row = [bar['time'], bar['open'], bar['high'], bar['low'], bar['close']]
+        if aggregated:
+            row += [bar['volume'] if bar['volume'] is not None else 'N/A', bar['samples']]
+        writer.writerow(row)
+    return buffer.getvalue()
+
+
+def save_bars_csv(bars, output_file, currency='usd'):
+    """
+    儲存 K 線為 CSV 檔案（原子寫入）
+    :param bars: K 線列表
+    :param output_file: 輸出檔案路徑
+    :param currency: 計價貨幣
+    :return: 輸出檔案路徑
+    :raises Exception: 儲存失敗
+    """
+    if not bars:
+        raise ValueError("沒有 K 線資料可以輸出")
+    try:
+        atomic_write(output_file, format_bars_csv(bars, currency).encode('utf-8'))
+        return output_file
+    except Exception as e:
+        raise Exception(f"儲存 CSV 檔案時發生錯誤：{e}")
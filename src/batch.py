@@ -0,0 +1,84 @@
+"""
+批量查詢模組
+以多個工作執行緒並行查詢多個幣種；實際同時發送的請求數由 fetcher 的排程器
+（與其自適應流量控制器）決定，因此並行度會隨 429/延遲回饋自動調整
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.scheduler import PRIORITY_BATCH
+from src.resilience import RetryBudget
+from src.cancel import ensure_token
+from src.fx import BASE_CURRENCY
+
+
+def run_batch(fetcher, coin_ids, from_date, to_date, on_result=None, cancellation_check=None,
+              max_workers=None, priority=PRIORITY_BATCH, retry_budget=None, job_timeout=None, vs_currency=BASE_CURRENCY):
+    """
+    並行查詢多個幣種的日期區間價格
+    :param fetcher: CoinGeckoPriceFetcher
+    :param coin_ids: 幣種 ID 列表
+    :param from_date: 開始日期（YYYY-MM-DD）
+    :param to_date: 結束日期（YYYY-MM-DD）
+    :param on_result: 單一幣種完成時的回調 callback(coin_id, prices, elapsed, error)，
+                      在呼叫 run_batch 的執行緒中依完成順序執行
+    :param cancellation_check: CancellationToken 或取消檢查函數（期限涵蓋整批查詢）
+    :param max_workers: 工作執行緒數（預設為流量控制器的併發上限上限）
+    :param priority: 請求優先等級
+    :param retry_budget: 整批共用的重試預算（預設建立新的 RetryBudget）
+    :param job_timeout: 單一幣種的查詢期限（秒，從開始查詢該幣種起算；None 表示不限）
+    :param vs_currency: 計價貨幣（整批共用同一份匯率序列，只額外查詢一次）
+    :return: dict {coin_id: prices}，prices 為空列表表示查詢失敗
+    """
+    if max_workers is None:
+        limiter = fetcher.scheduler.limiter
+        max_workers = limiter.max_limit if limiter else fetcher.scheduler.max_concurrent
+    max_workers = max(1, min(max_workers, len(coin_ids) or 1))
+    if retry_budget is None:
+        retry_budget = RetryBudget()
+    token = ensure_token(cancellation_check)
+
+    def fetch(coin_id):
+        started = time.monotonic()
+        if token.cancelled:
+            return coin_id, [], 0.0
+        prices = fetcher.get_range_prices(
+            coin_id,
+            from_date,
+            to_date,
+            debug=False,
+            cancellation_check=token,
+            priority=priority,
+            retry_budget=retry_budget,
+            timeout=job_timeout,
+            vs_currency=vs_currency
+        )
+        return coin_id, prices, time.monotonic() - started
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch, coin_id): coin_id for coin_id in coin_ids}
+
+        # 取消時直接撤銷尚未開始的幣種，進行中的查詢由同一 token 中止
+        def cancel_pending():
+            for future in futures:
+                future.cancel()
+        token.add_callback(cancel_pending)
+
+        for future in as_completed(futures):
+            coin_id = futures[future]
+            if future.cancelled():
+                results[coin_id] = []
+                continue
+            try:
+                _, prices, elapsed = future.result()
+                error = None
+            except Exception as e:
+                prices, elapsed, error = [], 0.0, e
+            results[coin_id] = prices
+            if on_result:
+                on_result(coin_id, prices, elapsed, error)
+        token.remove_callback(cancel_pending)
+
+    return results
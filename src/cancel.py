@@ -0,0 +1,203 @@
+"""
+取消與期限模組
+CancellationToken 貫穿每次查詢、退避等待與批量步驟：
+- 可手動取消（如 GUI 的終止按鈕）或設定期限（逾時自動取消）
+- 等待以事件喚醒，取消後立即返回，不必等 sleep 結束
+- 可直接呼叫（token() 回傳是否已取消），相容原本的 cancellation_check 參數
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+# 取消原因
+REASON_CANCELLED = 'cancelled'
+REASON_TIMEOUT = 'timeout'
+
+# 包裝舊式 cancellation_check 函數時的輪詢間隔（秒）
+POLL_INTERVAL = 0.1
+
+
+class CancellationToken:
+    """取消權杖（執行緒安全）"""
+
+    def __init__(self, timeout=None, parent=None, check=None):
+        """
+        初始化
+        :param timeout: 期限（秒，從現在起算；None 表示不限）
+        :param parent: 上層權杖（上層取消時一併取消，期限取兩者較早者）
+        :param check: 舊式取消檢查函數（回傳 True 表示取消；以輪詢方式納入）
+        """
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._check = check
+        self.reason = None
+
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self._parent = parent
+        if parent is not None:
+            if parent.deadline is not None and (self.deadline is None or parent.deadline < self.deadline):
+                self.deadline = parent.deadline
+            parent.add_callback(self._on_parent_cancelled)
+
+    def _on_parent_cancelled(self):
+        self.cancel(self._parent.reason)
+
+    def child(self, timeout=None):
+        """
+        建立子權杖（本權杖取消時子權杖也取消，子權杖可另設較短的期限）
+        子權杖用畢須 close()（或以 with 使用），否則長期存在的上層權杖會一直持有其回調
+        :param timeout: 子權杖的期限（秒）
+        :return: CancellationToken
+        """
+        return CancellationToken(timeout=timeout, parent=self)
+
+    def close(self):
+        """解除與上層權杖的連結（不影響本權杖的取消狀態，重複呼叫無作用）"""
+        if self._parent is not None:
+            self._parent.remove_callback(self._on_parent_cancelled)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def cancel(self, reason=REASON_CANCELLED):
+        """取消（重複呼叫無作用），並喚醒所有等待中的執行緒"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    @property
+    def cancelled(self):
+        """是否已取消（期限已過或舊式檢查函數回傳 True 時自動取消）"""
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(REASON_TIMEOUT)
+            return True
+        if self._check is not None and self._check():
+            self.cancel()
+            return True
+        return False
+
+    def __call__(self):
+        """相容 cancellation_check：回傳是否已取消"""
+        return self.cancelled
+
+    def remaining(self):
+        """
+        距離期限的秒數
+        :return: 秒數（無期限時回傳 None）
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def clamp(self, seconds):
+        """
+        將等待/逾時秒數限制在期限內
+        :param seconds: 原本的秒數（None 表示不限）
+        :return: 秒數（皆不限時回傳 None）
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return seconds
+        return remaining if seconds is None else min(seconds, remaining)
+
+    def add_callback(self, callback):
+        """註冊取消時的回調（已取消則立即執行）"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        """移除取消回調"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, seconds=None):
+        """
+        可中斷的等待（取代 time.sleep）
+        :param seconds: 等待秒數（None 表示等到取消為止）
+        :return: True 表示等待期間被取消；False 表示等待時間已到
+        """
+        end = time.monotonic() + seconds if seconds is not None else None
+        while not self.cancelled:
+            timeout = self.clamp(None if end is None else max(0.0, end - time.monotonic()))
+            if self._check is not None:
+                timeout = POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL)
+            if end is not None and time.monotonic() >= end:
+                return False
+            self._event.wait(timeout)
+        return True
+
+
+def ensure_token(cancellation_check=None):
+    """
+    將 cancellation_check 參數轉為 CancellationToken
+    :param cancellation_check: CancellationToken、舊式檢查函數或 None
+    :return: CancellationToken
+    """
+    if isinstance(cancellation_check, CancellationToken):
+        return cancellation_check
+    return CancellationToken(check=cancellation_check)
+
+
+@contextmanager
+def scoped_token(cancellation_check=None, timeout=None):
+    """
+    在區塊內使用的權杖：指定期限時建立子權杖，離開區塊時解除與上層權杖的連結
+    :param cancellation_check: CancellationToken、舊式檢查函數或 None
+    :param timeout: 區塊的期限（秒；None 表示沿用上層權杖）
+    :return: 產生 CancellationToken
+    """
+    token = ensure_token(cancellation_check)
+    if timeout is None:
+        yield token
+        return
+    with token.child(timeout) as child:
+        yield child
+
+
+def wait_futures(futures, token, timeout=None):
+    """
+    等待任一 Future 完成、權杖取消或逾時（以事件喚醒）
+    :param futures: Future 集合
+    :param token: CancellationToken
+    :param timeout: 最長等待秒數（None 表示不限）
+    :return: 已完成的 Future 集合（取消或逾時時可能為空）
+    """
+    wakeup = threading.Event()
+    notify = lambda *_: wakeup.set()
+    for future in futures:
+        future.add_done_callback(notify)
+    token.add_callback(notify)
+
+    end = time.monotonic() + timeout if timeout is not None else None
+    try:
+        while True:
+            done = {f for f in futures if f.done()}
+            if done or token.cancelled:
+                return done
+            wait_time = token.clamp(None if end is None else end - time.monotonic())
+            if wait_time is not None and wait_time <= 0:
+                return done
+            if token._check is not None:
+                wait_time = POLL_INTERVAL if wait_time is None else min(wait_time, POLL_INTERVAL)
+            wakeup.wait(wait_time)
+            wakeup.clear()
+    finally:
+        token.remove_callback(notify)
@@ -61,5 +61,8 @@ COIN_MAPPING = {
     for coin in COIN_LIST
 }
 
+# 計價貨幣選項（非 USD 以 USD 價格乘上每日匯率換算）
+VS_CURRENCIES = ['usd', 'eur', 'twd', 'jpy', 'gbp', 'cny', 'krw', 'btc', 'eth']
+
 # 日期限制常數
 DATE_MAX_DAYS = 365
@@ -3,25 +3,214 @@ CoinGecko API 價格查詢核心模組
 支援 CLI 和 GUI 共用
 """
 
+import logging
 import requests
-import sys
+import threading
 import time
 from datetime import datetime, timedelta, timezone
-from collections import defaultdict
-
+from concurrent.futures import ThreadPoolExecutor
+from src.scheduler import RequestScheduler, PRIORITY_INTERACTIVE
+from src.throttle import AdaptiveLimiter, LatencyTracker, parse_retry_after
+from src.keypool import ApiKeyPool, is_quota_exhausted
+from src.resilience import CircuitBreaker, RetryBudget, STATE_OPEN
+from src.cancel import REASON_TIMEOUT, ensure_token, scoped_token, wait_futures
+from src.fx import BASE_CURRENCY, FxCache
+from src.profiling import span
+from src.logs import get_logger, log_context
+from src.settlement import get_policy, select_samples
+from src.bars import (GRANULARITIES, GRANULARITY_DAILY, GRANULARITY_HOURLY, CandleSeries, aggregate_bars,
+                      bars_in_range, granularity_name, parse_ohlc)
+
+
+log = get_logger('core')
 
 class CoinGeckoPriceFetcher:
     """CoinGecko API 價格查詢類別"""
 
     BASE_URL = "https://api.coingecko.com/api/v3"
+    REQUEST_TIMEOUT = 30  # 單次 HTTP 請求逾時（秒），有期限時取較短者
+    SIMPLE_PRICE_BATCH = 100  # /simple/price 單次請求的幣種數上限（避免網址過長）
+    SETTLEMENT_SAMPLE_MARGIN = 3600  # 延伸查詢區間時，結算時刻之後保留的秒數（至少包含一個每小時取樣點）
+    OHLC_DAYS = (1, 7, 14, 30, 90, 180, 365)  # /ohlc 的 days 參數可用值（免費方案）
+    OHLC_RANGE_MAX_DAYS = {GRANULARITY_DAILY: 180, GRANULARITY_HOURLY: 31}  # ohlc/range 單次請求的天數上限
 
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, scheduler=None, hedge_percentile=None):
         """
         初始化
-        :param api_key: CoinGecko API key（可選）
+        :param api_key: CoinGecko API key（可選）；可為單一 key、key 列表、[(key, quota), ...] 或 ApiKeyPool
+        :param scheduler: 請求排程器（可選，多個 fetcher 共用同一排程器即可共享 API 額度；
+                          未指定時依 key 池或自適應流量控制器建立）
+        :param hedge_percentile: 啟用 hedged request 的延遲百分位（如 0.95；None 表示不啟用）
         """
-        self.api_key = api_key
+        if isinstance(api_key, ApiKeyPool):
+            self.key_pool = api_key
+        elif api_key:
+            self.key_pool = ApiKeyPool([api_key] if isinstance(api_key, str) else api_key)
+        else:
+            self.key_pool = None
+
         self.session = requests.Session()
+        self.scheduler = scheduler or RequestScheduler(limiter=self.key_pool or AdaptiveLimiter())
+        self.breakers = {}  # endpoint -> CircuitBreaker
+        self._breakers_lock = threading.Lock()
+        self.retry_budget = RetryBudget()  # 未指定批量預算時使用
+        self.not_found = set()  # 曾回應 404 的請求網址（幣種不存在等，重試也不會成功）
+
+        # hedged request：以近期成功請求的延遲分佈決定何時送出重複請求
+        self.hedge_percentile = hedge_percentile
+        self.latency_tracker = LatencyTracker()
+        self.hedge_stats = {'sent': 0, 'won': 0}
+        self._hedge_lock = threading.Lock()
+
+        # 其他計價貨幣以 USD 序列換算，匯率序列由所有查詢共用
+        self.fx = FxCache()
+
+        # HTTP 請求在工作執行緒中發送，呼叫端以事件等待，取消或逾時時可立即放棄
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='fetch')
+
+    @property
+    def api_key(self):
+        """目前第一把可用的 API key（相容舊介面）"""
+        return self.key_pool.first_active() if self.key_pool else None
+
+    def get_key_usage(self):
+        """
+        取得每把 API key 的使用情況
+        :return: [{key, status, used, quota, succeeded, throttled, errors, limit}, ...]；未使用 key 時為空列表
+        """
+        return self.key_pool.usage() if self.key_pool else []
+
+    def _send(self, url, params, priority, token):
+        """
+        取得排程許可與 API key 後發送一次 GET 請求
+        啟用 hedging 時，若請求超過近期延遲的指定百分位仍未回應，會再送出一個重複請求
+        （同樣經過排程器與 key 池，不會超出流量限制），先回應者勝出
+        :param token: CancellationToken；取消或逾時時立即放棄等待回應
+        :return: (response, latency, key_state)；被取消或沒有可用 key 時 response 為 None
+        """
+        # 透過排程器取得發送許可（互動查詢優先於批量查詢；429 後的暫停也在此等待）
+        with span('queue_wait', priority=priority):
+            if not self.scheduler.acquire(priority, token):
+                return None, 0.0, None
+
+            key_state = None
+            if self.key_pool:
+                key_state = self.key_pool.acquire(token)
+                if key_state is None:
+                    self.scheduler.release()
+                    return None, 0.0, None
+
+        timeout = max(0.1, token.clamp(self.REQUEST_TIMEOUT))
+        primary = self._executor.submit(self._timed_get, url, params, key_state, timeout)
+        pending = {primary}
+
+        hedge = None
+        hedge_delay = self.latency_tracker.percentile(self.hedge_percentile) if self.hedge_percentile else None
+        if hedge_delay is not None and not wait_futures(pending, token, timeout=hedge_delay) and not token.cancelled:
+            # 對冲請求同樣排隊取得排程許可與 key（計入流量控制），主請求先完成時放棄排隊
+            hedge = self._executor.submit(self._hedge_attempt, url, params, priority, primary, token)
+            pending.add(hedge)
+
+        # 先完成者勝出；若先完成者失敗（或對冲請求未送出）則等待另一個
+        winner = None
+        while pending and winner is None:
+            done = wait_futures(pending, token)
+            if not done:
+                break  # 取消或逾時：不再等待回應
+            pending -= done
+            winner = next((f for f in done if f.exception() is None and f.result() is not None), None)
+        if winner is None and not pending:
+            winner = primary  # 皆失敗：回傳主請求的結果（拋出其例外）
+
+        for loser in pending:
+            # requests 無法中斷已送出的請求：未開始者直接取消，進行中者回應後立即關閉連線
+            if loser.cancel():
+                if loser is primary:
+                    # 主請求尚未送出：其許可與 key 額度在此歸還（_timed_get 不會執行）
+                    self._release_unsent(key_state)
+            else:
+                loser.add_done_callback(self._discard_response)
+
+        if winner is None:
+            return None, 0.0, None
+        if hedge is not None:
+            with self._hedge_lock:
+                self.hedge_stats['won'] += winner is hedge
+        return winner.result()
+
+    def _hedge_attempt(self, url, params, priority, primary, token):
+        """
+        送出對冲請求（與一般請求相同地取得排程許可與 key）
+        :param primary: 主請求的 Future；主請求先完成時放棄等待
+        :param token: CancellationToken
+        :return: (response, latency, key_state)，未送出時回傳 None
+        """
+        give_up = lambda: primary.done() or token.cancelled
+        if not self.scheduler.acquire(priority, cancellation_check=give_up):
+            return None
+
+        key_state = None
+        if self.key_pool:
+            key_state = self.key_pool.acquire(cancellation_check=give_up)
+            if key_state is None:
+                self.scheduler.release()
+                return None
+
+        with self._hedge_lock:
+            self.hedge_stats['sent'] += 1
+        return self._timed_get(url, params, key_state, max(0.1, token.clamp(self.REQUEST_TIMEOUT)))
+
+    def _timed_get(self, url, params, key_state, timeout=REQUEST_TIMEOUT):
+        """
+        發送 GET 請求並計時（呼叫前須已取得排程許可，完成後歸還）
+        :param timeout: HTTP 逾時秒數
+        :return: (response, latency, key_state)
+        """
+        try:
+            if key_state is not None:
+                params = dict(params, x_cg_pro_api_key=key_state.key)
+
+            started = time.monotonic()
+            with span('http', url=url[len(self.BASE_URL):]) as http_span:
+                response = self.session.get(url, params=params, timeout=timeout)
+                http_span.set(status=response.status_code)
+            latency = time.monotonic() - started
+            if response.status_code == 200:
+                self.latency_tracker.record(latency)
+            return response, latency, key_state
+        finally:
+            self.scheduler.release()
+
+    def _release_unsent(self, key_state):
+        """歸還未送出請求的排程許可與 key 額度"""
+        self.scheduler.release()
+        if key_state is not None:
+            self.key_pool.refund(key_state)
+
+    @staticmethod
+    def _discard_response(future):
+        """關閉落敗的對冲請求回應"""
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            future.result()[0].close()
+
+    def _report_success(self, key_state, latency):
+        """回報成功請求（有 key 池時回報給對應 key，否則回報給排程器）"""
+        if key_state is not None:
+            self.key_pool.report_success(key_state, latency)
+        else:
+            self.scheduler.report_success(latency)
+
+    def _report_throttle(self, key_state, retry_after):
+        """回報 429，回傳暫停秒數（有 key 池時只暫停該 key）"""
+        if key_state is not None:
+            return self.key_pool.report_throttle(key_state, retry_after)
+        return self.scheduler.report_throttle(retry_after)
+
+    def _report_error(self, key_state):
+        """回報暫時性錯誤，回傳重試前應等待的秒數"""
+        if key_state is not None:
+            return self.key_pool.report_error(key_state)
+        return self.scheduler.report_error()
 
     def _date_to_timestamp(self, date_str):
         """
@@ -43,15 +232,13 @@ class CoinGeckoPriceFetcher:
         dt = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
         return dt.strftime("%Y-%m-%d")
 
-    def get_range_prices_api(self, coin_id, from_date, to_date, max_retries=20, debug=False, cancellation_check=None):
+    def _get_market_chart(self, coin_id, from_date, to_date, intraday=False, max_retries=20, cancellation_check=None,
+                          priority=PRIORITY_INTERACTIVE, retry_budget=None, vs_currency=BASE_CURRENCY, policies=()):
         """
-        使用 market_chart/range API 取得日期區間內的價格
-        :param coin_id: CoinGecko 的幣種 ID（如 bitcoin）
-        :param from_date: 開始日期，格式：YYYY-MM-DD
-        :param to_date: 結束日期，格式：YYYY-MM-DD
-        :param max_retries: 最大重試次數
-        :param debug: 是否顯示詳細 debug 資訊
-        :return: 價格資料字典 {date: price} 或 None
+        發送 market_chart/range 請求（from_date 前一日 00:00 到 to_date 23:59:59 UTC）
+        :param intraday: 是否需要盤中取樣點（是則不指定 daily interval，由 API 依區間長度決定取樣間隔）
+        :param policies: 結算規則列表（結算時刻超出預設區間時延伸查詢區間，涵蓋各規則的結算取樣點）
+        :return: API 回應資料（含 prices 陣列），失敗時回傳 None
         """
         try:
             # from_date 需要往前推一天，因為該日數據來自前一天的 16:00 UTC
@@ -63,122 +250,265 @@ class CoinGeckoPriceFetcher:
             to_dt = datetime.strptime(to_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
             to_dt = to_dt.replace(hour=23, minute=59, second=59)
             to_ts = int(to_dt.timestamp())
+
+            # 其他結算規則（如 UTC 收盤）的結算時刻可能落在預設區間之外
+            for policy in policies:
+                from_ts = min(from_ts, policy.settlement_ms(from_date) // 1000)
+                to_ts = max(to_ts, policy.settlement_ms(to_date) // 1000 + self.SETTLEMENT_SAMPLE_MARGIN)
         except ValueError as e:
-            print(f"錯誤：日期格式不正確：{e}", file=sys.stderr)
+            log.error("日期格式不正確：%s", e)
             return None
 
         url = f"{self.BASE_URL}/coins/{coin_id}/market_chart/range"
         params = {
-            'vs_currency': 'usd',
+            'vs_currency': vs_currency,
             'from': from_ts,
             'to': to_ts
         }
 
-        # 如果有 API key，添加到參數中（並啟用 daily interval）
-        if self.api_key:
-            params['x_cg_pro_api_key'] = self.api_key
+        # 如果有 API key，啟用 daily interval（key 由 key 池逐次指定）
+        if self.key_pool and not intraday:
             params['interval'] = 'daily'  # daily interval 是付費功能
 
-        for attempt in range(max_retries):
-            # 檢查是否被取消
-            if cancellation_check and cancellation_check():
-                return None  # 立即返回，放棄查詢
-
-            try:
-                response = self.session.get(url, params=params, timeout=30)
-
-                if response.status_code == 404:
-                    print(f"錯誤：找不到幣種 '{coin_id}'", file=sys.stderr)
-                    return None
-                elif response.status_code == 429:
-                    # 在等待前檢查是否被取消
-                    if cancellation_check and cancellation_check():
-                        return None
-                    wait_time = 15
-                    print(f"警告：API 請求過於頻繁 (429)，等待 {wait_time} 秒...", file=sys.stderr)
-                    print(f"響應內容：{response.text}", file=sys.stderr)
-                    time.sleep(wait_time)
-                    continue
-                elif response.status_code == 401:
-                    print(f"錯誤：API 認證失敗 (401)", file=sys.stderr)
-                    print(f"響應內容：{response.text}", file=sys.stderr)
-                    return None
+        data = self._request_json(
+            'market_chart/range', url, params,
+            max_retries=max_retries,
+            cancellation_check=cancellation_check,
+            priority=priority,
+            retry_budget=retry_budget,
+            not_found_message=f"找不到幣種 '{coin_id}'"
+        )
+        if data is None:
+            return None
 
-                response.raise_for_status()
-                data = response.json()
+        # 解析 prices 陣列
+        if not isinstance(data, dict) or 'prices' not in data:
+            log.error("API 返回資料格式不正確", extra={'endpoint': 'market_chart/range'})
+            return None
+        return data
 
-                # 解析 prices 陣列
-                if 'prices' not in data:
-                    print("錯誤：API 返回資料格式不正確", file=sys.stderr)
-                    return None
+    def coin_not_found(self, coin_id):
+        """
+        幣種的歷史價格查詢是否曾回應 404（幣種 ID 不存在；與暫時性失敗不同，重試也不會成功）
+        :param coin_id: CoinGecko 的幣種 ID
+        :return: bool
+        """
+        return f"{self.BASE_URL}/coins/{coin_id}/market_chart/range" in self.not_found
 
-                prices_array = data['prices']
-                if not prices_array:
-                    print("警告：API 返回空資料", file=sys.stderr)
-                    return {}
+    def _daily_prices(self, prices_array, debug=False, policy=None):
+        """
+        從取樣點取出每日結算價
+        :param prices_array: [[timestamp_ms, price], ...]
+        :param debug: 是否以 INFO 等級輸出逐日結算細節（否則為 DEBUG 等級，依日誌設定決定是否輸出）
+        :param policy: 結算規則（預設為 CoinGecko 的前一天 UTC 16:00，見 src.settlement）
+        :return: 價格資料字典 {date: price}
+        """
+        policy = get_policy(policy)
+        return self._settle(prices_array, [policy], debug)[policy.name]
 
-                # 將 timestamp 按日期分組（處理同日多筆數據）
-                # 注意：CoinGecko 的邏輯是 UTC 16:00 的價格算作次日
-                daily_prices = defaultdict(list)
+    def _settle(self, prices_array, policies, debug=False):
+        """
+        以單次掃描依多個結算規則取出每日結算價（各日取結算時刻起的第一個取樣點，即最接近的取樣點）
+        :param prices_array: [[timestamp_ms, price], ...]
+        :param policies: 結算規則列表
+        :param debug: 是否以 INFO 等級輸出逐日結算細節（否則為 DEBUG 等級）
+        :return: dict {policy.name: {date: price}}（四捨五入到小數點後八位）
+        """
+        level = logging.INFO if debug else logging.DEBUG
+        verbose = log.isEnabledFor(level)
+        policies = {policy.name: policy for policy in policies}
+
+        result = {}
+        for name, samples in select_samples(prices_array, list(policies.values())).items():
+            daily = result[name] = {}
+            for date_str, (timestamp_ms, price) in samples.items():
+                if verbose:
+                    # 顯示詳細的時間資訊（只在啟用時計算與格式化）
+                    target_ms = policies[name].settlement_ms(date_str)
+                    chosen_dt = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
+                    log.log(level, "%s [%s]: 目標 %s UTC, 實際選擇 %s UTC (差距 %.1f 分鐘), 原始價格 $%.10f, round 後 $%.8f",
+                            date_str, name, policies[name].settlement_time(date_str).strftime('%Y-%m-%d %H:%M'),
+                            chosen_dt.strftime('%Y-%m-%d %H:%M:%S'), abs(timestamp_ms - target_ms) / 60000,
+                            price, round(price, 8))
+                daily[date_str] = round(price, 8)  # 四捨五入到小數點後八位
+        return result
+
+    def get_range_prices_api(self, coin_id, from_date, to_date, max_retries=20, debug=False, cancellation_check=None,
+                             priority=PRIORITY_INTERACTIVE, retry_budget=None, vs_currency=BASE_CURRENCY, policy=None):
+        """
+        使用 market_chart/range API 取得日期區間內的價格
+        :param coin_id: CoinGecko 的幣種 ID（如 bitcoin）
+        :param from_date: 開始日期，格式：YYYY-MM-DD
+        :param to_date: 結束日期，格式：YYYY-MM-DD
+        :param max_retries: 最大重試次數
+        :param debug: 是否顯示詳細 debug 資訊
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級（見 src.scheduler）
+        :param retry_budget: 重試預算（可選，批量查詢時整批共用）
+        :param vs_currency: API 計價貨幣（一般查詢一律使用 USD，其他貨幣由 get_range_prices 換算）
+        :param policy: 結算規則（名稱或 SettlementPolicy，預設為前一天 UTC 16:00）
+        :return: 價格資料字典 {date: price} 或 None
+        """
+        policy = get_policy(policy)
+        settled = self.get_settlement_prices_api(coin_id, from_date, to_date, [policy], max_retries=max_retries,
+                                                 debug=debug, cancellation_check=cancellation_check,
+                                                 priority=priority, retry_budget=retry_budget, vs_currency=vs_currency)
+        return None if settled is None else settled[policy.name]
+
+    def get_settlement_prices_api(self, coin_id, from_date, to_date, policies, max_retries=20, debug=False,
+                                  cancellation_check=None, priority=PRIORITY_INTERACTIVE, retry_budget=None,
+                                  vs_currency=BASE_CURRENCY):
+        """
+        以一次 market_chart/range 請求依多個結算規則取得每日價格（同一份取樣點單次掃描分組）
+        :param policies: 結算規則列表（SettlementPolicy）
+        :return: dict {規則名稱: {date: price}} 或 None（其餘參數見 get_range_prices_api）
+        """
+        data = self._get_market_chart(coin_id, from_date, to_date, max_retries=max_retries,
+                                      cancellation_check=cancellation_check, priority=priority,
+                                      retry_budget=retry_budget, vs_currency=vs_currency,
+                                      policies=policies)
+        if data is None:
+            return None
 
-                for timestamp_ms, price in prices_array:
-                    dt = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
+        try:
+            prices_array = data['prices']
+            if not prices_array:
+                log.warning("API 返回空資料")
+                return {policy.name: {} for policy in policies}
+            with span('settlement', samples=len(prices_array), policies=len(policies)):
+                return self._settle(prices_array, policies, debug)
+
+        except Exception as e:
+            log.error("處理資料時發生錯誤：%s", e)
+            return None
 
-                    # 如果時間 >= 16:00，算作次日的數據
-                    if dt.hour >= 16:
-                        dt = dt + timedelta(days=1)
+    def _breaker(self, endpoint):
+        """取得（或建立）endpoint 對應的斷路器"""
+        with self._breakers_lock:
+            breaker = self.breakers.get(endpoint)
+            if breaker is None:
+                breaker = self.breakers[endpoint] = CircuitBreaker()
+            return breaker
 
-                    date_str = dt.strftime("%Y-%m-%d")
-                    daily_prices[date_str].append((timestamp_ms, price))  # 保存 timestamp 和 price
+    def _request_json(self, endpoint, url, params, max_retries=20, cancellation_check=None,
+                      priority=PRIORITY_INTERACTIVE, retry_budget=None, not_found_message=None):
+        """
+        發送 GET 請求並解析 JSON（含排程、key 池、斷路器、重試預算與退避重試）
+        :param endpoint: endpoint 名稱（斷路器以此區分，如 market_chart/range）
+        :param url: 請求網址
+        :param params: 查詢參數
+        :param max_retries: 最大嘗試次數
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級
+        :param retry_budget: 重試預算（可選，預設使用 fetcher 共用的預算）
+        :param not_found_message: 404 時顯示的錯誤訊息
+        :return: JSON 資料，失敗時回傳 None
+        """
+        token = ensure_token(cancellation_check)
+        breaker = self._breaker(endpoint)
+        budget = retry_budget or self.retry_budget
+        budget.record_request()
 
-                # 每日取最接近 UTC 16:00 的價格（CoinGecko 標準每日結算時間）
-                # 注意：歸類到某日的數據實際上來自前一天的 16:xx
-                result = {}
-                for date_str in sorted(daily_prices.keys()):
-                    price_data = daily_prices[date_str]  # [(timestamp_ms, price), ...]
+        for attempt in range(max_retries):
+            # 檢查是否被取消或逾時
+            if token.cancelled:
+                self._report_cancelled(token, endpoint)
+                return None  # 立即返回，放棄查詢
 
-                    # 計算前一天 UTC 16:00 的時間戳（毫秒）
-                    # 因為歸類到 date_str 的數據實際上是前一天 >= 16:00 的數據
-                    target_dt = datetime.strptime(date_str, "%Y-%m-%d").replace(
-                        hour=16, minute=0, second=0, microsecond=0, tzinfo=timezone.utc
-                    )
-                    target_dt = target_dt - timedelta(days=1)  # 前一天的 16:00
-                    target_ts_ms = int(target_dt.timestamp() * 1000)
+            # 斷路器開啟：上游持續故障，快速失敗
+            if not breaker.allow():
+                log.error("%s 暫時無法使用（斷路器開啟，%.0f 秒後重新探測）", endpoint, breaker.retry_after(),
+                          extra={'endpoint': endpoint})
+                return None
 
-                    # 找到最接近前一天 UTC 16:00 的數據點
-                    closest = min(price_data, key=lambda x: abs(x[0] - target_ts_ms))
+            key_state = None
+            try:
+                with span('attempt', endpoint=endpoint, attempt=attempt + 1):
+                    response, latency, key_state = self._send(url, params, priority, token)
+                if response is None:
+                    breaker.release_probe()
+                    if token.cancelled:
+                        self._report_cancelled(token, endpoint)
+                    elif self.key_pool and not self.key_pool.has_active():
+                        log.error("沒有可用的 API key（皆已停用或配額用盡）")
+                    return None
 
-                    if debug:
-                        # 顯示詳細的時間資訊
-                        closest_dt = datetime.fromtimestamp(closest[0] / 1000, tz=timezone.utc)
-                        time_diff = abs(closest[0] - target_ts_ms) / 1000 / 60  # 分鐘
-                        print(f"  {date_str}: 目標前日 UTC 16:00, 實際選擇 {closest_dt.strftime('%Y-%m-%d %H:%M:%S')} UTC (差距 {time_diff:.1f} 分鐘)", file=sys.stderr)
-                        print(f"            原始價格: ${closest[1]:.10f}, round 後: ${round(closest[1], 8):.8f}", file=sys.stderr)
+                if response.status_code < 500:
+                    breaker.record_success()  # 上游有正常回應（包含 4xx）
 
-                    result[date_str] = round(closest[1], 8)  # 四捨五入到小數點後八位
+                if response.status_code == 404:
+                    self.not_found.add(url)
+                    log.error("%s", not_found_message or f"找不到資源 ({url})", extra={'endpoint': endpoint, 'status': 404})
+                    return None
+                elif response.status_code == 429 and key_state is not None and is_quota_exhausted(response.text):
+                    # key 的額度已用盡：重試也不會恢復，停用該 key，改用池中其他 key 重試
+                    self.key_pool.mark_exhausted(key_state)
+                    log.warning("API key %s 額度已用盡 (429)，已停用：%s", key_state.masked, response.text,
+                                extra={'endpoint': endpoint, 'status': 429})
+                    continue
+                elif response.status_code == 429:
+                    # 回報流量控制：收緊併發與速率，並暫停發送（下次取得許可時自動等待）
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    wait_time = self._report_throttle(key_state, retry_after)
+                    log.warning("API 請求過於頻繁 (429)，等待 %.1f 秒...", wait_time,
+                                extra={'endpoint': endpoint, 'status': 429, 'attempt': attempt + 1})
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("429 響應內容：%s", response.text, extra={'endpoint': endpoint})
+                    continue
+                elif response.status_code in (401, 403) and key_state is not None:
+                    # key 被拒絕：停用該 key，改用池中其他 key 重試
+                    self.key_pool.reject(key_state)
+                    log.warning("API key %s 認證失敗 (%d)，已停用：%s", key_state.masked, response.status_code,
+                                response.text, extra={'endpoint': endpoint, 'status': response.status_code})
+                    continue
+                elif response.status_code == 401:
+                    log.error("API 認證失敗 (401)：%s", response.text, extra={'endpoint': endpoint, 'status': 401})
+                    return None
 
-                return result
+                response.raise_for_status()
+                with span('json_decode', endpoint=endpoint):
+                    data = response.json()
+                self._report_success(key_state, latency)
+                return data
 
             except requests.exceptions.RequestException as e:
-                if attempt == max_retries - 1:
-                    print(f"錯誤：請求資料時發生錯誤：{e}", file=sys.stderr)
+                status_code = getattr(getattr(e, 'response', None), 'status_code', None)
+                if status_code is not None and status_code < 500:
+                    # 非暫時性錯誤（4xx）：重試也不會成功
+                    log.error("請求資料時發生錯誤：%s", e, extra={'endpoint': endpoint, 'status': status_code})
                     return None
-                # 在等待前檢查是否被取消
-                if cancellation_check and cancellation_check():
+
+                # 暫時性錯誤（連線錯誤、逾時、5xx）
+                breaker.record_failure()
+                if breaker.state == STATE_OPEN:
+                    log.error("請求資料時發生錯誤：%s（%s 連續失敗，斷路器開啟，不再重試）", e, endpoint,
+                              extra={'endpoint': endpoint, 'attempt': attempt + 1})
                     return None
-                time.sleep(2)  # 錯誤後等待 2 秒再重試
-            except Exception as e:
                 if attempt == max_retries - 1:
-                    print(f"錯誤：處理資料時發生錯誤：{e}", file=sys.stderr)
+                    log.error("請求資料時發生錯誤：%s", e, extra={'endpoint': endpoint, 'attempt': attempt + 1})
+                    return None
+                if not budget.try_spend():
+                    log.error("請求資料時發生錯誤：%s（重試預算已用盡，不再重試）", e,
+                              extra={'endpoint': endpoint, 'attempt': attempt + 1})
                     return None
-                # 在等待前檢查是否被取消
-                if cancellation_check and cancellation_check():
+                # 錯誤後依退避時間等待再重試（取消或逾時時立即結束等待）
+                with span('backoff', endpoint=endpoint, attempt=attempt + 1):
+                    cancelled = token.wait(self._report_error(key_state))
+                if cancelled:
+                    self._report_cancelled(token, endpoint)
                     return None
-                time.sleep(2)
 
         return None
 
-    def get_range_prices(self, coin_id, from_date, to_date, debug=False, progress_callback=None, cancellation_check=None):
+    @staticmethod
+    def _report_cancelled(token, endpoint):
+        """查詢因逾時而中止時顯示訊息（使用者取消不顯示）"""
+        if token.reason == REASON_TIMEOUT:
+            log.error("%s 查詢逾時，已中止", endpoint, extra={'endpoint': endpoint})
+
+    def get_range_prices(self, coin_id, from_date, to_date, debug=False, progress_callback=None, cancellation_check=None,
+                         priority=PRIORITY_INTERACTIVE, retry_budget=None, timeout=None, vs_currency=BASE_CURRENCY,
+                         policy=None):
         """
         取得日期區間內所有日期的價格
         :param coin_id: CoinGecko 的幣種 ID
@@ -186,6 +516,68 @@ class CoinGeckoPriceFetcher:
         :param to_date: 結束日期（YYYY-MM-DD）
         :param debug: 是否顯示詳細 debug 資訊
         :param progress_callback: 進度回調函數 callback(current, total, date, price, success)
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級（見 src.scheduler）
+        :param retry_budget: 重試預算（可選，批量查詢時整批共用）
+        :param timeout: 本次查詢的期限（秒，含排隊、重試與退避等待；None 表示不限）
+        :param vs_currency: 計價貨幣（非 USD 時以 USD 序列乘上共用的每日匯率換算）
+        :param policy: 結算規則（名稱或 SettlementPolicy，預設為前一天 UTC 16:00）
+        :return: 價格資料列表
+        """
+        with span('coin', coin_id=coin_id, vs_currency=vs_currency), log_context(coin_id=coin_id, vs_currency=vs_currency), \
+                scoped_token(cancellation_check, timeout) as cancellation_check:
+            # 使用新 API 一次取得所有資料
+            price_dict = self.get_range_prices_api(coin_id, from_date, to_date, debug=debug,
+                                                   cancellation_check=cancellation_check, priority=priority,
+                                                   retry_budget=retry_budget, policy=policy)
+
+            if price_dict is None:
+                return []
+
+            if vs_currency.lower() != BASE_CURRENCY:
+                price_dict = self.fx.convert(self, price_dict, vs_currency, from_date, to_date,
+                                             cancellation_check=cancellation_check, priority=priority,
+                                             retry_budget=retry_budget, policy=policy)
+                if price_dict is None:
+                    log.error("無法取得 %s 匯率", vs_currency.upper())
+                    return []
+
+            return self._fill_dates(price_dict, from_date, to_date, progress_callback)
+
+    def get_range_prices_by_policy(self, coin_id, from_date, to_date, policies, debug=False, cancellation_check=None,
+                                   priority=PRIORITY_INTERACTIVE, retry_budget=None, timeout=None,
+                                   vs_currency=BASE_CURRENCY):
+        """
+        以一次下載依多個結算規則取得日期區間價格（各規則共用同一份取樣點，不額外查詢；
+        非 USD 時各規則以同一規則結算的匯率換算，匯率序列一次查詢即快取所有內建規則）
+        :param policies: 結算規則列表（名稱或 SettlementPolicy）
+        :param timeout: 整體查詢期限（秒；None 表示不限）
+        :return: dict {規則名稱: 價格資料列表}；查詢或換算失敗的規則為空列表
+        :raises ValueError: 不支援的結算規則
+        """
+        policies = [get_policy(policy) for policy in policies]
+        with span('coin', coin_id=coin_id, vs_currency=vs_currency), log_context(coin_id=coin_id, vs_currency=vs_currency), \
+                scoped_token(cancellation_check, timeout) as token:
+            settled = self.get_settlement_prices_api(coin_id, from_date, to_date, policies, debug=debug,
+                                                     cancellation_check=token, priority=priority,
+                                                     retry_budget=retry_budget)
+            result = {}
+            for policy in policies:
+                price_dict = settled[policy.name] if settled is not None else None
+                if price_dict is not None and vs_currency.lower() != BASE_CURRENCY:
+                    price_dict = self.fx.convert(self, price_dict, vs_currency, from_date, to_date,
+                                                 cancellation_check=token, priority=priority,
+                                                 retry_budget=retry_budget, policy=policy)
+                    if price_dict is None:
+                        log.error("無法取得 %s 匯率", vs_currency.upper())
+                result[policy.name] = self._fill_dates(price_dict, from_date, to_date) if price_dict is not None else []
+            return result
+
+    @staticmethod
+    def _fill_dates(price_dict, from_date, to_date, progress_callback=None):
+        """
+        將 {date: price} 展開為區間內每一天的價格資料列表（缺少的日期價格為 None）
+        :param progress_callback: 進度回調函數 callback(current, total, date, price, success)
         :return: 價格資料列表
         """
         # 轉換為 datetime 物件
@@ -196,12 +588,6 @@ class CoinGeckoPriceFetcher:
         delta = end_dt - start_dt
         num_days = delta.days + 1  # 包含結束日期
 
-        # 使用新 API 一次取得所有資料
-        price_dict = self.get_range_prices_api(coin_id, from_date, to_date, debug=debug, cancellation_check=cancellation_check)
-
-        if price_dict is None:
-            return []
-
         # 建立完整的日期列表，補充缺失的日期
         prices = []
         current_dt = start_dt
@@ -230,3 +616,221 @@ class CoinGeckoPriceFetcher:
             current_dt += timedelta(days=1)
 
         return prices
+
+    def get_range_series(self, coin_id, from_date, to_date, granularity=GRANULARITY_HOURLY, debug=False,
+                         progress_callback=None, cancellation_check=None, priority=PRIORITY_INTERACTIVE,
+                         retry_budget=None, timeout=None, vs_currency=BASE_CURRENCY, policy=None):
+        """
+        以同一份 market_chart/range 回應同時取得每日結算價與 OHLC K 線（不重複下載）
+        盤中取樣間隔由 API 依區間長度決定（1 天內約 5 分鐘、90 天內每小時、更長為每日），
+        粒度小於取樣間隔時每根 K 線只有一個取樣點
+        :param coin_id: CoinGecko 的幣種 ID
+        :param from_date: 開始日期（YYYY-MM-DD）
+        :param to_date: 結束日期（YYYY-MM-DD）
+        :param granularity: K 線粒度（raw / hourly / 4h / daily，見 src.bars）
+        :param debug: 是否顯示詳細 debug 資訊
+        :param progress_callback: 進度回調函數 callback(current, total, date, price, success)
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級（見 src.scheduler）
+        :param retry_budget: 重試預算（可選）
+        :param timeout: 本次查詢的期限（秒；None 表示不限）
+        :param vs_currency: 計價貨幣（非 USD 時價格與 K 線皆以共用的每日匯率換算）
+        :param policy: 結算規則（每日價格、日 K 的日期分界與匯率皆依此規則，預設為前一天 UTC 16:00）
+        :return: (價格資料列表, K 線列表)；查詢失敗時為 ([], [])
+        :raises ValueError: 不支援的粒度或結算規則
+        """
+        policy = get_policy(policy)
+        with span('coin', coin_id=coin_id, vs_currency=vs_currency, granularity=granularity), \
+                log_context(coin_id=coin_id, vs_currency=vs_currency), \
+                scoped_token(cancellation_check, timeout) as cancellation_check:
+            if granularity not in GRANULARITIES:
+                raise ValueError(f"不支援的 K 線粒度：{granularity}（可用：{', '.join(GRANULARITIES)}）")
+
+            data = self._get_market_chart(coin_id, from_date, to_date, intraday=True,
+                                          cancellation_check=cancellation_check, priority=priority,
+                                          retry_budget=retry_budget, policies=[policy])
+            if data is None:
+                return [], []
+
+            try:
+                prices_array = data['prices']
+                if not prices_array:
+                    log.warning("API 返回空資料")
+                with span('settlement', samples=len(prices_array)):
+                    price_dict = self._daily_prices(prices_array, debug, policy)
+                with span('bars', samples=len(prices_array), granularity=granularity):
+                    bars = bars_in_range(aggregate_bars(prices_array, data.get('total_volumes'), granularity, policy),
+                                         from_date, to_date)
+            except Exception as e:
+                log.error("處理資料時發生錯誤：%s", e)
+                return [], []
+
+            if vs_currency.lower() != BASE_CURRENCY:
+                kwargs = dict(cancellation_check=cancellation_check, priority=priority, retry_budget=retry_budget,
+                              policy=policy)
+                price_dict = self.fx.convert(self, price_dict, vs_currency, from_date, to_date, **kwargs)
+                bars = self.fx.convert_bars(self, bars, vs_currency, from_date, to_date, **kwargs)
+                if price_dict is None or bars is None:
+                    log.error("無法取得 %s 匯率", vs_currency.upper())
+                    return [], []
+
+            return self._fill_dates(price_dict, from_date, to_date, progress_callback), bars
+
+    def get_ohlc(self, coin_id, from_date, to_date, interval=GRANULARITY_DAILY, vs_currency=BASE_CURRENCY,
+                 cancellation_check=None, priority=PRIORITY_INTERACTIVE, retry_budget=None, timeout=None):
+        """
+        使用原生 OHLC endpoint 取得日期區間內的 K 線（比以 market_chart 取樣點推算小得多的回應）
+        有 API key 時使用 ohlc/range（付費功能，可指定 daily / hourly，超過單次上限時分段查詢）；
+        否則使用 /ohlc，以涵蓋區間的最小 days 查詢後截取區間（K 線長度由 API 決定：
+        2 天內 30 分鐘、30 天內 4 小時、更長為 4 天，只能查詢最近 365 天）
+        :param coin_id: CoinGecko 的幣種 ID
+        :param from_date: 開始日期（YYYY-MM-DD）
+        :param to_date: 結束日期（YYYY-MM-DD）
+        :param interval: K 線長度（daily / hourly，僅 ohlc/range 適用）
+        :param vs_currency: 計價貨幣（OHLC endpoint 直接支援，不需換算）
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級（見 src.scheduler）
+        :param retry_budget: 重試預算（可選）
+        :param timeout: 本次查詢的期限（秒；None 表示不限）
+        :return: CandleSeries，查詢失敗時回傳 None
+        :raises ValueError: 不支援的 K 線長度
+        """
+        if interval not in self.OHLC_RANGE_MAX_DAYS:
+            raise ValueError(f"不支援的 K 線長度：{interval}（可用：{', '.join(self.OHLC_RANGE_MAX_DAYS)}）")
+        with log_context(coin_id=coin_id, vs_currency=vs_currency), scoped_token(cancellation_check, timeout) as token:
+            kwargs = dict(cancellation_check=token, priority=priority, retry_budget=retry_budget,
+                          not_found_message=f"找不到幣種 '{coin_id}'")
+
+            start = datetime.strptime(from_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            end = datetime.strptime(to_date, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+            rows = []
+            if self.key_pool:
+                endpoint = 'ohlc/range'
+                url = f"{self.BASE_URL}/coins/{coin_id}/ohlc/range"
+                step = timedelta(days=self.OHLC_RANGE_MAX_DAYS[interval])
+                window_start = start
+                while window_start < end:
+                    window_end = min(window_start + step, end)
+                    params = {'vs_currency': vs_currency, 'from': int(window_start.timestamp()),
+                              'to': int(window_end.timestamp()), 'interval': interval}
+                    data = self._request_json(endpoint, url, params, **kwargs)
+                    if data is None:
+                        return None
+                    rows.extend(data if isinstance(data, list) else [])
+                    window_start = window_end
+            else:
+                endpoint = 'ohlc'
+                needed = (datetime.now(timezone.utc) - start).days + 1
+                days = next((d for d in self.OHLC_DAYS if d >= needed), self.OHLC_DAYS[-1])
+                if needed > days:
+                    log.warning("/ohlc 只提供最近 %d 天的 K 線，%s 起的部分資料無法取得", days, from_date)
+                data = self._request_json(endpoint, f"{self.BASE_URL}/coins/{coin_id}/ohlc",
+                                          {'vs_currency': vs_currency, 'days': days}, **kwargs)
+                if data is None:
+                    return None
+                rows = data if isinstance(data, list) else []
+
+            try:
+                bars, size = parse_ohlc(rows)
+            except (TypeError, ValueError) as e:
+                log.error("處理資料時發生錯誤：%s", e)
+                return None
+
+            # 分段查詢的邊界可能重複回傳同一根 K 線
+            bars = list({bar['timestamp']: bar for bar in bars}.values())
+            bars = bars_in_range(bars, from_date, to_date)
+            return CandleSeries(bars, interval if self.key_pool else granularity_name(size), vs_currency.lower(), endpoint)
+
+    def get_range_prices_multi(self, coin_id, from_date, to_date, vs_currencies, debug=False, progress_callback=None,
+                               cancellation_check=None, priority=PRIORITY_INTERACTIVE, retry_budget=None, timeout=None):
+        """
+        以一次 USD 查詢取得多種計價貨幣的日期區間價格（其他貨幣以共用的每日匯率換算）
+        :param coin_id: CoinGecko 的幣種 ID
+        :param from_date: 開始日期（YYYY-MM-DD）
+        :param to_date: 結束日期（YYYY-MM-DD）
+        :param vs_currencies: 計價貨幣列表（如 ['usd', 'eur', 'btc']）
+        :param debug: 是否顯示詳細 debug 資訊
+        :param progress_callback: USD 查詢的進度回調函數 callback(current, total, date, price, success)
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級（見 src.scheduler）
+        :param retry_budget: 重試預算（可選）
+        :param timeout: 整體查詢期限（秒；None 表示不限）
+        :return: dict {vs_currency: 價格資料列表}；查詢或換算失敗的貨幣為空列表
+        """
+        with scoped_token(cancellation_check, timeout) as token:
+            usd_prices = self.get_range_prices(coin_id, from_date, to_date, debug=debug, progress_callback=progress_callback,
+                                               cancellation_check=token, priority=priority, retry_budget=retry_budget)
+            usd_dict = {p['date']: p['price'] for p in usd_prices if p['price'] is not None}
+
+            result = {}
+            for vs_currency in vs_currencies:
+                vs_currency = vs_currency.lower()
+                if vs_currency == BASE_CURRENCY or not usd_prices:
+                    result[vs_currency] = usd_prices
+                    continue
+                converted = self.fx.convert(self, usd_dict, vs_currency, from_date, to_date,
+                                            cancellation_check=token, priority=priority, retry_budget=retry_budget)
+                if converted is None:
+                    log.error("無法取得 %s 匯率", vs_currency.upper())
+                    result[vs_currency] = []
+                else:
+                    result[vs_currency] = [{'date': p['date'], 'price': converted.get(p['date'])} for p in usd_prices]
+            return result
+
+    def get_current_prices(self, coin_ids, vs_currency='usd', cancellation_check=None,
+                           priority=PRIORITY_INTERACTIVE):
+        """
+        使用 simple/price API 取得多個幣種的目前價格（以最少的請求數批次查詢）
+        :param coin_ids: 幣種 ID 列表
+        :param vs_currency: 計價貨幣
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級（見 src.scheduler）
+        :return: dict {coin_id: {'price': 價格, 'updated_at': UNIX timestamp 或 None}}；
+                 查詢失敗的幣種不會出現在結果中
+        """
+        url = f"{self.BASE_URL}/simple/price"
+        coin_ids = list(dict.fromkeys(coin_ids))  # 去除重複並保留順序
+        result = {}
+
+        for start in range(0, len(coin_ids), self.SIMPLE_PRICE_BATCH):
+            chunk = coin_ids[start:start + self.SIMPLE_PRICE_BATCH]
+            params = {
+                'ids': ','.join(chunk),
+                'vs_currencies': vs_currency,
+                'include_last_updated_at': 'true',
+                'precision': 'full'
+            }
+            data = self._request_json(
+                'simple/price', url, params,
+                cancellation_check=cancellation_check,
+                priority=priority
+            )
+            if not data:
+                continue
+
+            for coin_id in chunk:
+                quote = data.get(coin_id) or {}
+                price = quote.get(vs_currency)
+                if price is not None:
+                    result[coin_id] = {'price': price, 'updated_at': quote.get('last_updated_at')}
+
+        return result
+
+    def get_coin_list(self, cancellation_check=None, priority=PRIORITY_INTERACTIVE):
+        """
+        使用 coins/list API 取得完整的幣種目錄
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級（見 src.scheduler）
+        :return: [{'id', 'symbol', 'name'}, ...]，失敗時回傳 None
+        """
+        data = self._request_json(
+            'coins/list', f"{self.BASE_URL}/coins/list", {},
+            cancellation_check=cancellation_check,
+            priority=priority
+        )
+        if not isinstance(data, list):
+            return None
+        return [
+            {'id': item['id'], 'symbol': item.get('symbol') or '', 'name': item.get('name') or ''}
+            for item in data if isinstance(item, dict) and item.get('id')
+        ]
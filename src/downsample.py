@@ -0,0 +1,179 @@
+"""
+降採樣模組
+以 LTTB（Largest-Triangle-Three-Buckets）將長序列縮減為固定點數並保留走勢形狀；
+MultiResolutionSeries 預先建立逐層減半的降採樣層級，讓縮放/平移時只需處理
+與螢幕寬度相當的點數，繪圖成本不隨序列長度增加
+"""
+
+from bisect import bisect_left, bisect_right
+
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降採樣
+    :param points: [(x, y), ...]，依 x 遞增排序
+    :param threshold: 目標點數（至少 3；點數不超過時原樣回傳）
+    :return: 降採樣後的 [(x, y), ...]（保留首尾點）
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0  # 上一個選中的點
+
+    for i in range(threshold - 2):
+        # 下一個桶的平均點（作為三角形的第三個頂點）
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        avg_x = sum(points[j][0] for j in range(next_start, next_end)) / count
+        avg_y = sum(points[j][1] for j in range(next_start, next_end)) / count
+
+        # 目前桶中與前一點、下一桶平均點構成最大三角形面積的點
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def halve(source, target, start=0):
+    """
+    以固定兩點一桶的 LTTB 將 source 減半到 target，只重算 target[start:]
+    （target[0] 為 source[0]；第 i 桶為 source[2i-1:2i+1]，選出與前一個選中點、下一桶平均點
+    構成最大三角形面積的點；尾端不足一桶的點原樣保留）。桶的位置固定，
+    因此 source 從第 d 點起變動時只需從第 max(0, (d - 1) // 2) 桶起重算
+    :param source: [(x, y), ...]，依 x 遞增排序
+    :param target: 減半層級（就地更新）
+    :param start: 開始重算的桶序號
+    """
+    del target[start:]
+    n = len(source)
+    if not n:
+        return
+    if start == 0:
+        target.append(source[0])
+        start = 1
+
+    for i in range(start, n // 2 + 1):
+        first = 2 * i - 1
+        if first + 1 >= n:
+            target.append(source[first])  # 尾端不足一桶
+            break
+        following = source[first + 2:first + 4]
+        if not following:
+            target.append(source[first + 1])  # 最後一桶：保留末點
+            break
+        avg_x = sum(p[0] for p in following) / len(following)
+        avg_y = sum(p[1] for p in following) / len(following)
+        ax, ay = target[-1]
+        best, best_area = source[first], -1.0
+        for x, y in source[first:first + 2]:
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = (x, y), area
+        target.append(best)
+
+
+class MultiResolutionSeries:
+    """
+    多解析度序列：第 0 層為原始資料，之後每層以固定兩點一桶的 LTTB 減半
+    查詢可見視窗時選用點數足夠的最粗層級，再降採樣到目標點數；
+    附加資料時各層只重算尾端受影響的桶，不必重建整個層級
+    """
+
+    def __init__(self, points=None, min_level_size=256):
+        """
+        初始化
+        :param points: [(x, y), ...]，依 x 遞增排序
+        :param min_level_size: 最粗層級的點數下限
+        """
+        self.min_level_size = min_level_size
+        self._levels = [list(points or [])]
+        self._xs = [[p[0] for p in self._levels[0]]]  # 各層的 x 座標（供二分搜尋）
+        self._update(0)
+
+    def __len__(self):
+        return len(self._levels[0])
+
+    @property
+    def points(self):
+        """原始資料點"""
+        return self._levels[0]
+
+    def extend(self, points):
+        """
+        附加資料點（x 必須大於現有的最後一點；較粗的層級只重算尾端的桶）
+        :param points: [(x, y), ...]
+        """
+        base = self._levels[0]
+        changed = len(base)
+        base.extend(points)
+        self._xs[0].extend(p[0] for p in points)
+        self._update(changed)
+
+    def bounds(self):
+        """
+        資料範圍
+        :return: (x_min, x_max)，沒有資料時回傳 None
+        """
+        base = self._levels[0]
+        if not base:
+            return None
+        return base[0][0], base[-1][0]
+
+    def _update(self, changed):
+        """
+        第 0 層從第 changed 點起變動後，逐層重算受影響的尾端（點數足夠時增加更粗的層級）
+        :param changed: 第 0 層第一個變動的位置
+        """
+        level = 0
+        while len(self._levels[level]) > self.min_level_size * 2:
+            if level + 1 == len(self._levels):
+                self._levels.append([])
+                self._xs.append([])
+                start = 0
+            else:
+                start = max(0, (changed - 1) // 2)
+            coarse, xs = self._levels[level + 1], self._xs[level + 1]
+            halve(self._levels[level], coarse, start)
+            del xs[start:]
+            xs.extend(p[0] for p in coarse[start:])
+            changed = start
+            level += 1
+
+    def window(self, x_min, x_max, target):
+        """
+        取得可見視窗的降採樣資料
+        :param x_min: 視窗左界
+        :param x_max: 視窗右界
+        :param target: 目標點數（通常為繪圖區的像素寬度）
+        :return: [(x, y), ...]，含視窗外各一個相鄰點，讓折線延伸到邊界
+        """
+        # 由細到粗找出視窗內點數仍不少於目標兩倍的最粗層級
+        chosen = 0
+        for index, xs in enumerate(self._xs):
+            count = bisect_right(xs, x_max) - bisect_left(xs, x_min)
+            if count >= target * 2:
+                chosen = index
+            else:
+                break
+
+        xs = self._xs[chosen]
+        start = max(0, bisect_left(xs, x_min) - 1)
+        end = min(len(xs), bisect_right(xs, x_max) + 1)
+        return lttb(self._levels[chosen][start:end], max(3, target))
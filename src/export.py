@@ -0,0 +1,178 @@
+"""
+匯出清單模組
+為輸出目錄維護 manifest（每個檔案的內容雜湊與資料來源區間）：
+內容與上次相同的檔案略過不寫，有變動的檔案以原子寫入取代，
+並回報本次變動的檔案列表，讓下游同步只需處理差異
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from src.utils import atomic_write, format_csv
+from src.fx import BASE_CURRENCY, parse_series_key
+from src.profiling import span
+
+
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ExportManifest:
+    """輸出目錄的內容雜湊清單（執行緒安全）"""
+
+    def __init__(self, directory, filename=MANIFEST_FILENAME):
+        """
+        初始化（若目錄中已有 manifest 則載入）
+        :param directory: 輸出目錄
+        :param filename: manifest 檔名
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, filename)
+        self._lock = threading.Lock()
+        self._entries = {}  # 檔名 -> {sha256, size, mtime, coin_id, from_date, to_date, rows, updated_at}
+        self.changed = []  # 本次寫入（新增或變動）的檔名
+        self.unchanged = []  # 本次因內容相同而略過的檔名
+        self._dirty = False
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f).get('files', {})
+            except (OSError, ValueError):
+                self._entries = {}  # manifest 損毀：視為全部需要比對
+
+    def _is_current(self, filename, digest):
+        """目標檔案的內容是否已與 digest 相同"""
+        path = os.path.join(self.directory, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+
+        entry = self._entries.get(filename)
+        if entry and entry['sha256'] == digest and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return True
+
+        # manifest 缺少或過期（例如上次中途中止）：直接比對現有檔案內容
+        with open(path, 'rb') as f:
+            return _sha256(f.read()) == digest
+
+    def export(self, prices, coin_id, from_date, to_date, filename=None, stats=None, currency=BASE_CURRENCY):
+        """
+        匯出價格資料為 CSV，內容未變動時不重寫
+        :param prices: 價格資料列表
+        :param coin_id: 幣種 ID
+        :param from_date: 開始日期
+        :param to_date: 結束日期
+        :param filename: 輸出檔名（預設為 {coin_id}_{from_date}_{to_date}.csv）
+        :param stats: 已計算好的統計資訊（可選）
+        :param currency: 計價貨幣
+        :return: (輸出檔案路徑, 是否有寫入)
+        :raises Exception: 儲存失敗
+        """
+        if not prices:
+            raise ValueError("沒有價格資料可以輸出")
+
+        filename = filename or f"{coin_id}_{from_date}_{to_date}.csv"
+        path = os.path.join(self.directory, filename)
+        with span('csv_format', file=filename, rows=len(prices)):
+            data = format_csv(prices, stats, currency).encode('utf-8')
+            digest = _sha256(data)
+
+        with self._lock:
+            try:
+                written = not self._is_current(filename, digest)
+                if written:
+                    with span('csv_write', file=filename, rows=len(prices)):
+                        atomic_write(path, data)
+            except Exception as e:
+                raise Exception(f"儲存 CSV 檔案時發生錯誤：{e}")
+
+            stat = os.stat(path)
+            entry = {
+                'sha256': digest,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'coin_id': coin_id,
+                'from_date': from_date,
+                'to_date': to_date,
+                'rows': len(prices),
+                'updated_at': datetime.now().isoformat(timespec='seconds') if written
+                else self._entries.get(filename, {}).get('updated_at'),
+            }
+            if entry != self._entries.get(filename):
+                self._entries[filename] = entry
+                self._dirty = True
+            (self.changed if written else self.unchanged).append(filename)
+        return path, written
+
+    def entries(self):
+        """取得 manifest 內容 {檔名: {...}}"""
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._entries.items()}
+
+    def save(self):
+        """以原子寫入儲存 manifest（沒有變動時不寫）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({'version': 1, 'files': self._entries}, ensure_ascii=False, indent=2, sort_keys=True)
+            atomic_write(self.path, data.encode('utf-8'))
+            self._dirty = False
+
+
+def export_result_set(store, entries, directory=None, output_file=None, progress_callback=None,
+                      cancellation_check=None):
+    """
+    匯出已查詢的結果集（資料與區間取自本地儲存，而非輸入欄位）
+    :param store: PriceStore
+    :param entries: [(coin_id, from_date, to_date), ...]，coin_id 為本地儲存的序列鍵值（見 src.fx.series_key）
+    :param directory: 輸出目錄（多幣種匯出；透過 manifest 略過內容未變動的檔案）
+    :param output_file: 輸出檔案路徑（僅限單一幣種）
+    :param progress_callback: 進度回調 callback(current, total, coin_id)
+    :param cancellation_check: CancellationToken 或取消檢查函數
+    :return: dict {written: [路徑], unchanged: [路徑], skipped: [coin_id], cancelled: bool}
+    :raises Exception: 儲存失敗
+    """
+    if output_file is not None and len(entries) != 1:
+        raise ValueError("指定輸出檔案時只能匯出單一幣種")
+    if output_file is None and directory is None:
+        raise ValueError("請指定輸出目錄或輸出檔案")
+
+    manifest = ExportManifest(directory) if output_file is None else None
+    result = {'written': [], 'unchanged': [], 'skipped': [], 'cancelled': False}
+    total = len(entries)
+
+    for index, (coin_id, from_date, to_date) in enumerate(entries):
+        if cancellation_check and cancellation_check():
+            result['cancelled'] = True
+            break
+
+        prices = store.to_list(coin_id, from_date, to_date)
+        if not prices:
+            result['skipped'].append(coin_id)
+        else:
+            stats = store.range_statistics(coin_id, from_date, to_date)
+            _, currency = parse_series_key(coin_id)
+            if manifest is None:
+                try:
+                    atomic_write(output_file, format_csv(prices, stats, currency).encode('utf-8'))
+                except Exception as e:
+                    raise Exception(f"儲存 CSV 檔案時發生錯誤：{e}")
+                result['written'].append(output_file)
+            else:
+                path, written = manifest.export(prices, coin_id, from_date, to_date, stats=stats, currency=currency)
+                result['written' if written else 'unchanged'].append(path)
+
+        if progress_callback:
+            progress_callback(index + 1, total, coin_id)
+
+    if manifest is not None:
+        manifest.save()
+    return result
@@ -0,0 +1,175 @@
+"""
+計價貨幣換算模組
+其他計價貨幣（EUR、TWD、BTC 等）的價格以 USD 序列乘上每日匯率換算：
+匯率 = 參考幣種以目標貨幣計價的每日結算價 ÷ 參考幣種的 USD 每日結算價，
+兩者取自同一結算時間點，因此換算結果與直接以目標貨幣查詢一致。
+參考幣種的結算價序列快取在 fetcher 上，整批幣種共用，
+每多一種計價貨幣只需額外查詢一次參考幣種，而不是每個幣種各查一次
+"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+
+from src.scheduler import PRIORITY_INTERACTIVE
+from src.bars import convert_bars
+from src.profiling import span
+from src.settlement import POLICIES, get_policy
+
+
+BASE_CURRENCY = 'usd'
+FX_REFERENCE_COIN = 'bitcoin'  # 流動性最高、各計價貨幣報價最完整的幣種
+
+
+def series_key(coin_id, vs_currency=BASE_CURRENCY):
+    """
+    本地儲存與輸出檔名使用的序列鍵值
+    :param coin_id: 幣種 ID
+    :param vs_currency: 計價貨幣
+    :return: USD 為 coin_id，其他貨幣為 coin_id@貨幣（如 bitcoin@eur）
+    """
+    vs_currency = vs_currency.lower()
+    return coin_id if vs_currency == BASE_CURRENCY else f"{coin_id}@{vs_currency}"
+
+
+def parse_series_key(key):
+    """
+    解析序列鍵值
+    :param key: series_key 的結果
+    :return: (coin_id, vs_currency)
+    """
+    coin_id, _, vs_currency = key.partition('@')
+    return coin_id, vs_currency or BASE_CURRENCY
+
+
+def _round_significant(value, digits=10):
+    """換算後的價格取有效位數（BTC 計價的小幣價格可能遠小於 1e-8，不能以固定小數位數四捨五入）"""
+    return float(f"{value:.{digits}g}")
+
+
+class FxCache:
+    """
+    參考幣種在各計價貨幣（含 USD）的每日結算價快取，用來推算 USD → 目標貨幣的匯率（執行緒安全）
+    """
+
+    def __init__(self, reference_coin=FX_REFERENCE_COIN):
+        """
+        初始化
+        :param reference_coin: 用來推算匯率的參考幣種
+        """
+        self.reference_coin = reference_coin
+        self._series = {}  # (貨幣, 結算規則名稱) -> {date: 參考幣種結算價}
+        self._locks = {}  # 貨幣 -> Lock（同一貨幣同時只查詢一次，其他執行緒等待並共用結果）
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, currency):
+        with self._locks_lock:
+            lock = self._locks.get(currency)
+            if lock is None:
+                lock = self._locks[currency] = threading.Lock()
+            return lock
+
+    def _reference_prices(self, fetcher, currency, dates, policy, **kwargs):
+        """
+        取得參考幣種以 currency 計價、依 policy 結算的每日結算價（快取中缺少的日期才查詢）
+        同一份回應同時依所有內建結算規則分組並快取，之後換用其他規則不需再查詢
+        """
+        with self._lock(currency):
+            cached = self._series.setdefault((currency, policy.name), {})
+            missing = [d for d in dates if d not in cached]
+            if not missing:
+                return {d: cached[d] for d in dates}
+
+            variants = list({p.name: p for p in (*POLICIES.values(), policy)}.values())
+            fetched = fetcher.get_settlement_prices_api(self.reference_coin, missing[0], missing[-1], variants,
+                                                        vs_currency=currency, **kwargs)
+            if fetched is None:
+                return None
+            # 結算未滿一天的日期（結算價仍會變動）不放入快取
+            cutoff = datetime.now(timezone.utc) - timedelta(days=1)
+            for variant in variants:
+                self._series.setdefault((currency, variant.name), {}).update(
+                    (d, price) for d, price in fetched[variant.name].items() if variant.is_settled(d, cutoff))
+            return {d: cached.get(d, fetched[policy.name].get(d)) for d in dates}
+
+    def rates(self, fetcher, vs_currency, from_date, to_date, cancellation_check=None,
+              priority=PRIORITY_INTERACTIVE, retry_budget=None, policy=None):
+        """
+        取得日期區間內的每日匯率（USD → vs_currency）
+        :param fetcher: CoinGeckoPriceFetcher
+        :param vs_currency: 目標計價貨幣
+        :param from_date: 開始日期（YYYY-MM-DD）
+        :param to_date: 結束日期（YYYY-MM-DD）
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級
+        :param retry_budget: 重試預算（可選）
+        :param policy: 結算規則（匯率與價格須依同一規則結算，預設為前一天 UTC 16:00）
+        :return: dict {date: rate}（沒有資料的日期不列入），查詢失敗時回傳 None
+        """
+        vs_currency = vs_currency.lower()
+        start = datetime.strptime(from_date, "%Y-%m-%d")
+        end = datetime.strptime(to_date, "%Y-%m-%d")
+        dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end - start).days + 1)]
+        if vs_currency == BASE_CURRENCY:
+            return {d: 1.0 for d in dates}
+
+        policy = get_policy(policy)
+        kwargs = dict(cancellation_check=cancellation_check, priority=priority, retry_budget=retry_budget)
+        quote = self._reference_prices(fetcher, vs_currency, dates, policy, **kwargs)
+        if quote is None:
+            return None
+        base = self._reference_prices(fetcher, BASE_CURRENCY, dates, policy, **kwargs)
+        if base is None:
+            return None
+        return {d: quote[d] / base[d] for d in dates if quote.get(d) is not None and base.get(d)}
+
+    def convert(self, fetcher, price_dict, vs_currency, from_date, to_date, cancellation_check=None,
+                priority=PRIORITY_INTERACTIVE, retry_budget=None, policy=None):
+        """
+        將 USD 價格換算為目標貨幣
+        :param fetcher: CoinGeckoPriceFetcher
+        :param price_dict: USD 價格 {date: price}
+        :param vs_currency: 目標計價貨幣
+        :param from_date: 開始日期（YYYY-MM-DD）
+        :param to_date: 結束日期（YYYY-MM-DD）
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級
+        :param retry_budget: 重試預算（可選）
+        :param policy: 價格的結算規則（以同一規則結算的匯率換算）
+        :return: 換算後的 {date: price}（該日沒有匯率時不列入），匯率查詢失敗時回傳 None
+        """
+        if vs_currency.lower() == BASE_CURRENCY:
+            return dict(price_dict)
+        with span('fx_convert', vs_currency=vs_currency):
+            rates = self.rates(fetcher, vs_currency, from_date, to_date, cancellation_check=cancellation_check,
+                               priority=priority, retry_budget=retry_budget, policy=policy)
+            if rates is None:
+                return None
+            return {d: _round_significant(price * rates[d]) for d, price in price_dict.items()
+                    if price is not None and d in rates}
+
+    def convert_bars(self, fetcher, bars, vs_currency, from_date, to_date, cancellation_check=None,
+                     priority=PRIORITY_INTERACTIVE, retry_budget=None, policy=None):
+        """
+        將 USD K 線換算為目標貨幣（每根 K 線依其結算日期的匯率換算）
+        :param fetcher: CoinGeckoPriceFetcher
+        :param bars: USD K 線列表（見 src.bars）
+        :param vs_currency: 目標計價貨幣
+        :param from_date: 開始日期（YYYY-MM-DD）
+        :param to_date: 結束日期（YYYY-MM-DD）
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級
+        :param retry_budget: 重試預算（可選）
+        :param policy: K 線日期所依的結算規則（以同一規則結算的匯率換算）
+        :return: 換算後的 K 線列表，匯率查詢失敗時回傳 None
+        """
+        if vs_currency.lower() == BASE_CURRENCY:
+            return list(bars)
+        rates = self.rates(fetcher, vs_currency, from_date, to_date, cancellation_check=cancellation_check,
+                           priority=priority, retry_budget=retry_budget, policy=policy)
+        if rates is None:
+            return None
+        # 結束日期結算時刻之後的盤中 K 線屬於次日（尚未結算），沿用結束日期的匯率
+        next_day = (datetime.strptime(to_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        if to_date in rates:
+            rates.setdefault(next_day, rates[to_date])
+        return convert_bars(bars, rates, policy)
@@ -0,0 +1,89 @@
+"""
+缺漏修補模組
+找出價格序列中缺少的結算日，將其合併成最少且最窄的日期區間，
+只重新查詢這些區間並把取得的價格併回原序列，不必重查整個日期範圍
+"""
+
+from datetime import datetime, timezone
+
+from src.scheduler import PRIORITY_BATCH
+from src.fx import BASE_CURRENCY
+from src.settlement import DEFAULT_POLICY
+
+
+def is_settled(date_str, now, policy=DEFAULT_POLICY):
+    """某日的價格（預設為前一天 UTC 16:00 結算）是否應已存在"""
+    return policy.is_settled(date_str, now)
+
+
+def find_missing_dates(prices, now=None):
+    """
+    找出缺少價格的結算日
+    :param prices: 價格資料列表 [{date, price}, ...]
+    :param now: 目前時間（UTC，預設為現在），尚未結算的日期不算缺漏
+    :return: 依日期排序的缺漏日期列表
+    """
+    now = now or datetime.now(timezone.utc)
+    return sorted(p['date'] for p in prices if p['price'] is None and is_settled(p['date'], now))
+
+
+def group_missing_dates(dates, max_join=2):
+    """
+    將缺漏日期合併成查詢區間
+    連續的缺漏日合併為一個區間；兩段缺漏之間只隔 max_join 天以內的已知資料時也合併，
+    以少量重複資料換取較少的請求次數
+    :param dates: 缺漏日期列表（YYYY-MM-DD）
+    :param max_join: 可跨越的已知資料天數
+    :return: [(from_date, to_date), ...]
+    """
+    windows = []
+    for date_str in sorted(set(dates)):
+        day = datetime.strptime(date_str, "%Y-%m-%d")
+        if windows and (day - windows[-1][1]).days <= max_join + 1:
+            windows[-1][1] = day
+        else:
+            windows.append([day, day])
+    return [(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")) for start, end in windows]
+
+
+def repair_gaps(fetcher, coin_id, prices, max_join=2, cancellation_check=None,
+                priority=PRIORITY_BATCH, retry_budget=None, vs_currency=BASE_CURRENCY):
+    """
+    只重新查詢缺漏日所在的區間，並將取得的價格併回
+    :param fetcher: CoinGeckoPriceFetcher
+    :param coin_id: 幣種 ID
+    :param prices: 價格資料列表 [{date, price}, ...]
+    :param max_join: 見 group_missing_dates
+    :param cancellation_check: CancellationToken 或取消檢查函數
+    :param priority: 請求優先等級
+    :param retry_budget: 重試預算（可選）
+    :param vs_currency: 價格資料的計價貨幣（非 USD 時以共用匯率換算）
+    :return: (修補後的價格資料列表, 補上的日期列表, 查詢的區間列表)
+    """
+    windows = group_missing_dates(find_missing_dates(prices), max_join=max_join)
+    fetched = {}
+    for from_date, to_date in windows:
+        if cancellation_check and cancellation_check():
+            break
+        price_dict = fetcher.get_range_prices_api(
+            coin_id, from_date, to_date,
+            cancellation_check=cancellation_check,
+            priority=priority,
+            retry_budget=retry_budget
+        )
+        if price_dict and vs_currency != BASE_CURRENCY:
+            price_dict = fetcher.fx.convert(fetcher, price_dict, vs_currency, from_date, to_date,
+                                            cancellation_check=cancellation_check, priority=priority,
+                                            retry_budget=retry_budget)
+        if price_dict:
+            fetched.update(price_dict)
+
+    repaired = []
+    filled = []
+    for item in prices:
+        price = item['price']
+        if price is None and fetched.get(item['date']) is not None:
+            price = fetched[item['date']]
+            filled.append(item['date'])
+        repaired.append({'date': item['date'], 'price': price})
+    return repaired, filled, windows
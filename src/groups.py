@@ -0,0 +1,39 @@
+"""
+幣種群組模組
+儲存使用者自訂的具名幣種組合（JSON 檔案）
+"""
+
+import json
+import os
+
+from src.utils import atomic_write
+
+
+DEFAULT_GROUPS_FILE = "coin_groups.json"
+
+
+def load_groups(path=DEFAULT_GROUPS_FILE):
+    """
+    讀取已儲存的幣種群組
+    :param path: 群組檔案路徑
+    :return: dict {群組名稱: [coin_id, ...]}；檔案不存在或損毀時回傳空 dict
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {str(name): [str(coin_id) for coin_id in coin_ids]
+            for name, coin_ids in data.items() if isinstance(coin_ids, list)}
+
+
+def save_groups(groups, path=DEFAULT_GROUPS_FILE):
+    """
+    儲存幣種群組（原子寫入）
+    :param groups: dict {群組名稱: [coin_id, ...]}
+    :param path: 群組檔案路徑
+    """
+    data = json.dumps(groups, ensure_ascii=False, indent=2, sort_keys=True)
+    atomic_write(path, data.encode('utf-8'))
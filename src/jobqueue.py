@@ -0,0 +1,396 @@
+"""
+共享工作佇列模組
+將大範圍回補（全部幣種 × 多年）切成 (幣種, 時間窗) 工作單元，放在 SQLite 檔案中；
+多個工作行程（同一台或多台機器，各自使用自己的 API key）以租約領取工作：
+- 領取與完成都在單一交易中進行，同一單元同時只會有一個持有者
+- 持有者定期續約；行程當機時租約到期，單元自動回到可領取狀態
+- 完成時檢查仍持有租約，租約已被他人接手的結果直接捨棄
+吞吐量隨工作行程數線性增加，直到合計的 API 額度用盡
+注意：多台機器共用時，佇列檔所在的共享儲存必須支援檔案鎖（SQLite 在部分 NFS 上不可靠）
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from src.scheduler import PRIORITY_BATCH
+from src.resilience import RetryBudget
+from src.cancel import ensure_token, wait_futures
+from src.export import ExportManifest
+from src.logs import log_context
+from src.fx import BASE_CURRENCY, series_key
+from src.utils import validate_date
+
+
+STATUS_PENDING = 'pending'
+STATUS_LEASED = 'leased'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+DEFAULT_WINDOW_DAYS = 90  # market_chart/range 超過 90 天時只回傳每日取樣
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    coin_id TEXT NOT NULL,
+    from_date TEXT NOT NULL,
+    to_date TEXT NOT NULL,
+    vs_currency TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    error TEXT,
+    result TEXT,
+    updated_at REAL,
+    UNIQUE (coin_id, from_date, to_date, vs_currency)
+);
+CREATE INDEX IF NOT EXISTS units_status ON units (status, lease_expires);
+"""
+
+
+def split_windows(from_date, to_date, window_days=DEFAULT_WINDOW_DAYS):
+    """
+    將日期區間切成不超過 window_days 天的時間窗
+    :param from_date: 開始日期（YYYY-MM-DD）
+    :param to_date: 結束日期（YYYY-MM-DD）
+    :param window_days: 每個時間窗的天數
+    :return: [(from_date, to_date), ...]
+    """
+    start = datetime.strptime(from_date, "%Y-%m-%d")
+    end = datetime.strptime(to_date, "%Y-%m-%d")
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=window_days - 1), end)
+        windows.append((start.strftime("%Y-%m-%d"), window_end.strftime("%Y-%m-%d")))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+def default_worker_id():
+    """工作行程識別（主機名稱:PID:隨機碼）"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class JobQueue:
+    """SQLite 工作佇列（每次操作使用獨立連線，可在多執行緒與多行程間共用同一檔案）"""
+
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS, busy_timeout=60.0):
+        """
+        初始化（檔案不存在時建立）
+        :param path: 佇列檔路徑（多台機器共用時放在共享儲存）
+        :param max_attempts: 單元最多領取次數（含租約到期重新領取），超過即標記為失敗
+        :param busy_timeout: 等待其他行程釋放資料庫鎖的秒數
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.busy_timeout = busy_timeout
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        # isolation_level=None：由各操作自行以 BEGIN IMMEDIATE 取得寫入鎖，避免領取時的競爭
+        return sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+
+    def _write(self, sql_steps):
+        """在單一寫入交易中執行 sql_steps(conn)，回傳其結果"""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = sql_steps(conn)
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, coin_ids, from_date, to_date, window_days=DEFAULT_WINDOW_DAYS, vs_currency=BASE_CURRENCY):
+        """
+        加入工作單元（幣種 × 時間窗；已存在的單元不重複加入）
+        :param coin_ids: 幣種 ID 列表
+        :param from_date: 開始日期（YYYY-MM-DD）
+        :param to_date: 結束日期（YYYY-MM-DD）
+        :param window_days: 每個單元的天數
+        :param vs_currency: 計價貨幣
+        :return: 新加入的單元數
+        :raises ValueError: 日期錯誤
+        """
+        if validate_date(from_date, "開始日期") > validate_date(to_date, "結束日期"):
+            raise ValueError("開始日期不能晚於結束日期")
+        if window_days < 1:
+            raise ValueError("時間窗天數必須大於 0")
+
+        now = time.time()
+        rows = [(coin_id, window_from, window_to, vs_currency.lower(), STATUS_PENDING, now)
+                for coin_id in dict.fromkeys(coin_ids)
+                for window_from, window_to in split_windows(from_date, to_date, window_days)]
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO units (coin_id, from_date, to_date, vs_currency, status, updated_at) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            return conn.total_changes - before
+        return self._write(insert)
+
+    def claim(self, worker_id, limit=1, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        領取工作單元（待處理者，或租約已到期的單元）
+        :param worker_id: 工作行程識別
+        :param limit: 最多領取數
+        :param lease_seconds: 租約長度（秒）
+        :return: [{id, coin_id, from_date, to_date, vs_currency, attempts}, ...]
+        """
+        def take(conn):
+            now = time.time()
+            # 租約到期且已用盡嘗試次數的單元（持有者反覆當機）直接標記失敗
+            conn.execute("UPDATE units SET status = ?, worker = NULL, error = ?, updated_at = ? "
+                         "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                         (STATUS_FAILED, "租約到期次數過多", now, STATUS_LEASED, now, self.max_attempts))
+            rows = conn.execute(
+                "SELECT id, coin_id, from_date, to_date, vs_currency, attempts FROM units "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT ?",
+                (STATUS_PENDING, STATUS_LEASED, now, limit)).fetchall()
+            conn.executemany(
+                "UPDATE units SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ?",
+                [(STATUS_LEASED, worker_id, now + lease_seconds, now, row[0]) for row in rows])
+            return [{'id': row[0], 'coin_id': row[1], 'from_date': row[2], 'to_date': row[3], 'vs_currency': row[4],
+                     'attempts': row[5] + 1} for row in rows]
+        return self._write(take)
+
+    def renew(self, worker_id, unit_ids, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        續約（只續仍由此工作行程持有的單元）
+        :return: 成功續約的單元數
+        """
+        if not unit_ids:
+            return 0
+
+        def extend(conn):
+            now = time.time()
+            cursor = conn.executemany(
+                "UPDATE units SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = ? AND worker = ?",
+                [(now + lease_seconds, now, unit_id, STATUS_LEASED, worker_id) for unit_id in unit_ids])
+            return cursor.rowcount
+        return self._write(extend)
+
+    def complete(self, unit_id, worker_id, prices):
+        """
+        寫入結果並標記完成（租約已被他人接手時不寫入）
+        :return: 是否寫入
+        """
+        def finish(conn):
+            cursor = conn.execute(
+                "UPDATE units SET status = ?, result = ?, error = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (STATUS_DONE, json.dumps(prices, separators=(',', ':')), time.time(), unit_id, STATUS_LEASED,
+                 worker_id))
+            return cursor.rowcount == 1
+        return self._write(finish)
+
+    def fail(self, unit_id, worker_id, error, retry=True):
+        """
+        回報失敗：可重試且尚有嘗試次數時放回待處理，否則標記失敗
+        :param retry: 是否可重試（重試也不會成功的錯誤，如幣種不存在，直接標記失敗）
+        :return: 更新後的狀態（STATUS_PENDING 或 STATUS_FAILED）；租約已被他人接手時不更新，回傳 None
+        """
+        max_attempts = self.max_attempts if retry else 0
+
+        def record(conn):
+            cursor = conn.execute(
+                "UPDATE units SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL, "
+                "lease_expires = NULL, error = ?, updated_at = ? WHERE id = ? AND status = ? AND worker = ?",
+                (max_attempts, STATUS_FAILED, STATUS_PENDING, str(error), time.time(), unit_id, STATUS_LEASED,
+                 worker_id))
+            if cursor.rowcount != 1:
+                return None
+            return conn.execute("SELECT status FROM units WHERE id = ?", (unit_id,)).fetchone()[0]
+        return self._write(record)
+
+    def release(self, worker_id, unit_ids):
+        """
+        歸還未完成的單元（工作行程正常結束或被取消時；不計入嘗試次數）
+        :return: 歸還的單元數
+        """
+        if not unit_ids:
+            return 0
+
+        def give_back(conn):
+            cursor = conn.executemany(
+                "UPDATE units SET status = ?, worker = NULL, lease_expires = NULL, attempts = attempts - 1, "
+                "updated_at = ? WHERE id = ? AND status = ? AND worker = ?",
+                [(STATUS_PENDING, time.time(), unit_id, STATUS_LEASED, worker_id) for unit_id in unit_ids])
+            return cursor.rowcount
+        return self._write(give_back)
+
+    def retry_failed(self):
+        """
+        將失敗的單元重新放回待處理（重設嘗試次數）
+        :return: 重新放回的單元數
+        """
+        def reset(conn):
+            cursor = conn.execute("UPDATE units SET status = ?, attempts = 0, error = NULL, updated_at = ? "
+                                  "WHERE status = ?", (STATUS_PENDING, time.time(), STATUS_FAILED))
+            return cursor.rowcount
+        return self._write(reset)
+
+    def progress(self):
+        """
+        各狀態的單元數
+        :return: dict {pending, leased, done, failed, total, workers}；workers 為目前持有租約的工作行程數
+        """
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall())
+            workers = conn.execute("SELECT COUNT(DISTINCT worker) FROM units WHERE status = ? AND lease_expires >= ?",
+                                   (STATUS_LEASED, time.time())).fetchone()[0]
+        result = {status: counts.get(status, 0) for status in (STATUS_PENDING, STATUS_LEASED, STATUS_DONE, STATUS_FAILED)}
+        result['total'] = sum(result.values())
+        result['workers'] = workers
+        return result
+
+    def failures(self):
+        """
+        失敗的單元
+        :return: [{coin_id, from_date, to_date, vs_currency, attempts, error}, ...]
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT coin_id, from_date, to_date, vs_currency, attempts, error FROM units "
+                                "WHERE status = ? ORDER BY id", (STATUS_FAILED,)).fetchall()
+        return [dict(zip(('coin_id', 'from_date', 'to_date', 'vs_currency', 'attempts', 'error'), row)) for row in rows]
+
+    def results(self):
+        """
+        合併已完成單元的價格（依幣種與計價貨幣，時間窗依序串接）
+        :return: dict {(coin_id, vs_currency): 價格資料列表}
+        """
+        merged = {}
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT coin_id, vs_currency, result FROM units WHERE status = ? "
+                                "ORDER BY coin_id, vs_currency, from_date", (STATUS_DONE,))
+            for coin_id, vs_currency, result in rows:
+                merged.setdefault((coin_id, vs_currency), []).extend(json.loads(result))
+        return merged
+
+    def export(self, directory):
+        """
+        將已完成的結果匯出為 CSV（每個幣種與計價貨幣一個檔案，內容未變動的檔案略過）
+        缺少的時間窗（尚未完成或失敗）不列入，檔名的區間為實際涵蓋的日期
+        :param directory: 輸出目錄
+        :return: ExportManifest（changed / unchanged 為本次寫入與略過的檔名）
+        """
+        os.makedirs(directory, exist_ok=True)
+        manifest = ExportManifest(directory)
+        for (coin_id, vs_currency), prices in sorted(self.results().items()):
+            if prices:
+                manifest.export(prices, series_key(coin_id, vs_currency), prices[0]['date'], prices[-1]['date'],
+                                currency=vs_currency)
+        manifest.save()
+        return manifest
+
+
+def run_worker(fetcher, queue, worker_id=None, concurrency=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+               cancellation_check=None, on_unit=None, poll_interval=5.0, priority=PRIORITY_BATCH):
+    """
+    工作行程主迴圈：持續領取並處理單元，直到佇列中沒有待處理或處理中的單元
+    其他行程持有的單元尚未完成時繼續等待，若其租約到期（持有者當機）則接手
+    :param fetcher: CoinGeckoPriceFetcher（各行程使用自己的 fetcher 與 API key）
+    :param queue: JobQueue
+    :param worker_id: 工作行程識別（預設為 主機名稱:PID:隨機碼）
+    :param concurrency: 同時處理的單元數上限（預設為流量控制器的併發上限；實際隨即時併發上限調整）
+    :param lease_seconds: 租約長度（秒），處理中每 1/3 租約續約一次
+    :param cancellation_check: CancellationToken 或取消檢查函數（取消時歸還未完成的單元）
+    :param on_unit: 單元處理結束時的回調 callback(unit, ok, error)（失敗但放回重試時也會呼叫），在 run_worker 的執行緒中呼叫
+    :param poll_interval: 沒有可領取的單元時的輪詢間隔（秒）
+    :param priority: 請求優先等級
+    :return: dict {done, failed, retried, discarded, worker_id, cancelled}；failed 為因此標記失敗的單元數，
+             retried 為失敗後放回待處理的次數，discarded 為租約已被接手而捨棄的結果數
+    """
+    worker_id = worker_id or default_worker_id()
+    if concurrency is None:
+        limiter = fetcher.scheduler.limiter
+        concurrency = limiter.max_limit if limiter else fetcher.scheduler.max_concurrent
+    concurrency = max(1, concurrency)
+    caller_token = ensure_token(cancellation_check)
+    token = caller_token.child()  # 結束時取消進行中的查詢，不影響呼叫端的權杖
+    retry_budget = RetryBudget()
+    counts = {'done': 0, 'failed': 0, 'retried': 0, 'discarded': 0, 'worker_id': worker_id, 'cancelled': False}
+
+    def process(unit):
+        with log_context(worker_id=worker_id, unit_id=unit['id']):
+            prices = fetcher.get_range_prices(unit['coin_id'], unit['from_date'], unit['to_date'],
+                                              cancellation_check=token, priority=priority, retry_budget=retry_budget,
+                                              vs_currency=unit['vs_currency'])
+        if token.cancelled:
+            return None
+        if not prices:
+            if fetcher.coin_not_found(unit['coin_id']):
+                raise LookupError(f"找不到幣種 '{unit['coin_id']}'")  # 不重試
+            raise ValueError("無法取得任何價格資料")
+        # API 有回應但時間窗內沒有資料（如幣種上市前）：以全為 None 的價格完成，不重試
+        return prices
+
+    active = {}  # Future -> unit
+    renew_every = lease_seconds / 3
+    last_renew = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='worker')
+    try:
+        while not token.cancelled:
+            # 只領取目前能立即開始的數量（依流量控制器的即時併發上限），其餘留給其他工作行程
+            free = min(concurrency, fetcher.scheduler.max_concurrent) - len(active)
+            if free > 0:
+                for unit in queue.claim(worker_id, free, lease_seconds):
+                    active[executor.submit(process, unit)] = unit
+
+            if not active:
+                pending = queue.progress()
+                if not pending[STATUS_PENDING] and not pending[STATUS_LEASED]:
+                    break  # 全部完成或失敗
+                token.wait(poll_interval)  # 其他行程處理中：等待完成或租約到期
+                continue
+
+            done = wait_futures(set(active), token, timeout=min(poll_interval, renew_every))
+            for future in done:
+                unit = active.pop(future)
+                try:
+                    prices = future.result()
+                    error = None
+                except Exception as e:
+                    prices, error = None, e
+                if prices is None and error is None:
+                    active[future] = unit  # 取消：於結束時歸還
+                    continue
+                if error is not None:
+                    status = queue.fail(unit['id'], worker_id, error, retry=not isinstance(error, LookupError))
+                    if status is None:
+                        counts['discarded'] += 1  # 租約已到期並被其他工作行程接手
+                        continue
+                    counts['failed' if status == STATUS_FAILED else 'retried'] += 1
+                    ok = False
+                elif queue.complete(unit['id'], worker_id, prices):
+                    counts['done'] += 1
+                    ok = True
+                else:
+                    counts['discarded'] += 1  # 租約已到期並被其他工作行程接手
+                    continue
+                if on_unit:
+                    on_unit(unit, ok, error)
+
+            if active and time.monotonic() - last_renew >= renew_every:
+                queue.renew(worker_id, [unit['id'] for unit in active.values()], lease_seconds)
+                last_renew = time.monotonic()
+    finally:
+        counts['cancelled'] = caller_token.cancelled
+        token.cancel()
+        token.close()
+        executor.shutdown(wait=True)
+        queue.release(worker_id, [unit['id'] for unit in active.values()])
+
+    return counts
@@ -0,0 +1,161 @@
+"""
+查詢工作串流模組
+從文字串流（stdin 或工作檔）逐行讀取 (coin_id, from, to) 查詢工作，
+邊讀邊並行查詢，每完成一筆即輸出一行 JSON（NDJSON），
+讓下游程式不必等整批完成即可開始處理，一個行程即可服務整份工作清單
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.scheduler import PRIORITY_BATCH
+from src.resilience import RetryBudget
+from src.cancel import ensure_token
+from src.utils import validate_date_range, calculate_statistics
+from src.fx import BASE_CURRENCY
+
+
+def parse_job_line(line, vs_currency=BASE_CURRENCY):
+    """
+    解析一行查詢工作
+    支援 JSON 物件 {"coin_id": ..., "from": ..., "to": ..., "vs_currency": ...}，
+    或以空白/逗號分隔的 "coin_id from to [vs_currency]"
+    :param line: 一行文字
+    :param vs_currency: 未指定計價貨幣時的預設值
+    :return: (coin_id, from_date, to_date, vs_currency)；空行與 # 註解回傳 None
+    :raises ValueError: 格式或日期錯誤
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+
+    if line.startswith('{'):
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"JSON 格式錯誤：{e}")
+        coin_id = data.get('coin_id')
+        from_date = data.get('from', data.get('from_date'))
+        to_date = data.get('to', data.get('to_date'))
+        vs_currency = data.get('vs_currency') or vs_currency
+    else:
+        fields = line.replace(',', ' ').split()
+        if len(fields) not in (3, 4):
+            raise ValueError("格式應為：coin_id from to [vs_currency]")
+        coin_id, from_date, to_date = fields[:3]
+        if len(fields) == 4:
+            vs_currency = fields[3]
+
+    if not coin_id or not from_date or not to_date:
+        raise ValueError("需要 coin_id、from 與 to")
+    if not all(isinstance(value, str) for value in (coin_id, from_date, to_date, vs_currency)):
+        raise ValueError("coin_id、from、to 與 vs_currency 必須是字串")
+    validate_date_range(from_date, to_date)
+    return coin_id, from_date, to_date, vs_currency.lower()
+
+
+def stream_jobs(fetcher, lines, on_record, cancellation_check=None, max_workers=None,
+                priority=PRIORITY_BATCH, retry_budget=None, job_timeout=None, vs_currency=BASE_CURRENCY):
+    """
+    邊讀邊查詢工作串流，每筆完成即回調結果紀錄
+    讀取端以同時進行的工作數為上限（背壓），不會一次讀入整個串流
+    :param fetcher: CoinGeckoPriceFetcher
+    :param lines: 可迭代的文字行（如 sys.stdin 或開啟的檔案）
+    :param on_record: 結果回調 callback(record)，依完成順序、一次一筆（已序列化呼叫）；
+                      record 為 {job, line, coin_id, from, to, vs_currency, ok, prices, stats, elapsed} 或
+                      {job, line, ok: False, error, ...}
+    :param cancellation_check: CancellationToken 或取消檢查函數
+    :param max_workers: 同時進行的工作數（預設為流量控制器的併發上限）
+    :param priority: 請求優先等級
+    :param retry_budget: 整個串流共用的重試預算（預設建立新的 RetryBudget）
+    :param job_timeout: 單一工作的查詢期限（秒；None 表示不限）
+    :param vs_currency: 工作未指定計價貨幣時的預設值（同一貨幣的匯率序列由所有工作共用）
+    :return: dict {total, succeeded, failed, cancelled}
+    """
+    if max_workers is None:
+        limiter = fetcher.scheduler.limiter
+        max_workers = limiter.max_limit if limiter else fetcher.scheduler.max_concurrent
+    max_workers = max(1, max_workers)
+    if retry_budget is None:
+        retry_budget = RetryBudget()
+    token = ensure_token(cancellation_check)
+
+    slots = threading.Semaphore(max_workers)
+    emit_lock = threading.Lock()
+    counts = {'total': 0, 'succeeded': 0, 'failed': 0, 'cancelled': False}
+    pending = set()
+
+    def emit(record):
+        with emit_lock:
+            counts['succeeded' if record['ok'] else 'failed'] += 1
+            on_record(record)
+
+    def run(job_index, line_number, coin_id, from_date, to_date, job_currency):
+        record = {'job': job_index, 'line': line_number, 'coin_id': coin_id, 'from': from_date, 'to': to_date,
+                  'vs_currency': job_currency}
+        started = time.monotonic()
+        try:
+            prices = fetcher.get_range_prices(
+                coin_id,
+                from_date,
+                to_date,
+                cancellation_check=token,
+                priority=priority,
+                retry_budget=retry_budget,
+                timeout=job_timeout,
+                vs_currency=job_currency
+            )
+            if token.cancelled:
+                return
+            if prices:
+                record.update(ok=True, prices=prices, stats=calculate_statistics(prices))
+            else:
+                record.update(ok=False, error="無法取得任何價格資料")
+        except Exception as e:
+            record.update(ok=False, error=str(e))
+        finally:
+            slots.release()
+        record['elapsed'] = round(time.monotonic() - started, 3)
+        emit(record)
+
+    def cancel_pending():
+        for future in list(pending):
+            future.cancel()
+
+    token.add_callback(cancel_pending)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+    try:
+        for line_number, line in enumerate(lines, start=1):
+            if token.cancelled:
+                break
+            try:
+                job = parse_job_line(line, vs_currency)
+            except ValueError as e:
+                counts['total'] += 1
+                emit({'job': counts['total'] - 1, 'line': line_number, 'ok': False, 'error': str(e)})
+                continue
+            if job is None:
+                continue
+
+            # 背壓：等待空出的工作槽（期間仍可取消）
+            while not slots.acquire(timeout=0.1):
+                if token.cancelled:
+                    break
+            if token.cancelled:
+                break
+
+            counts['total'] += 1
+            future = executor.submit(run, counts['total'] - 1, line_number, *job)
+            pending.add(future)
+            future.add_done_callback(pending.discard)
+    except BaseException:
+        token.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        token.remove_callback(cancel_pending)
+
+    counts['cancelled'] = token.cancelled
+    return counts
@@ -0,0 +1,245 @@
+"""
+API key 池模組
+每把 key 各自擁有配額與自適應流量控制狀態；請求依各 key 的就緒時間與用量分散，
+配額用盡或被拒絕（401/403）的 key 會自動停用，並可回報每把 key 的使用情況
+"""
+
+import threading
+import time
+
+from src.throttle import AdaptiveLimiter
+
+
+# key 狀態
+KEY_ACTIVE = 'active'
+KEY_EXHAUSTED = 'exhausted'
+KEY_REJECTED = 'rejected'
+
+# 429 響應內容含這些字詞時表示 key 的額度（如每月 credit）已用盡，而非暫時的流量限制
+QUOTA_EXHAUSTED_MARKERS = ('credit', 'quota', 'monthly')
+
+
+def parse_api_keys(text):
+    """
+    解析 API key 輸入字串
+    :param text: 以逗號、分號或換行分隔的 key，可在 key 後加 ":配額"（如 KEY1:10000,KEY2）
+    :return: [(key, quota), ...]，未指定配額時 quota 為 None
+    """
+    keys = []
+    if not text:
+        return keys
+    for token in text.replace(';', ',').replace('\n', ',').split(','):
+        token = token.strip()
+        if not token:
+            continue
+        key, _, quota = token.partition(':')
+        try:
+            keys.append((key.strip(), int(quota) if quota.strip() else None))
+        except ValueError:
+            raise ValueError(f"API key 配額格式錯誤：{token}")
+    return keys
+
+
+def is_quota_exhausted(body):
+    """
+    判斷 429 響應是否表示 key 的額度已用盡（重試不會恢復，應停用該 key）
+    :param body: 響應內容
+    :return: bool
+    """
+    text = (body or '').lower()
+    return any(marker in text for marker in QUOTA_EXHAUSTED_MARKERS)
+
+
+class ApiKeyState:
+    """單一 API key 的配額與流量控制狀態"""
+
+    def __init__(self, key, quota=None, limiter=None):
+        """
+        初始化
+        :param key: API key
+        :param quota: 可使用的請求次數（None 表示不限）
+        :param limiter: 此 key 專用的流量控制器
+        """
+        self.key = key
+        self.quota = quota
+        self.limiter = limiter or AdaptiveLimiter()
+        self.status = KEY_ACTIVE
+        self.used = 0
+        self.succeeded = 0
+        self.throttled = 0
+        self.errors = 0
+        self.next_ready = 0.0  # 下次可發送的時間（monotonic）
+
+    @property
+    def masked(self):
+        """遮蔽後的 key（供顯示使用）"""
+        if len(self.key) <= 8:
+            return '*' * len(self.key)
+        return f"{self.key[:4]}...{self.key[-4:]}"
+
+
+class ApiKeyPool:
+    """
+    API key 池（執行緒安全）
+    同時提供 RequestScheduler 所需的 limit / interval / max_limit 介面，
+    其值為所有可用 key 的總和
+    """
+
+    def __init__(self, keys):
+        """
+        初始化
+        :param keys: key 字串列表，或 [(key, quota), ...]
+        """
+        self._lock = threading.Lock()
+        self._states = []
+        for item in keys:
+            key, quota = item if isinstance(item, tuple) else (item, None)
+            if key and key not in [s.key for s in self._states]:
+                self._states.append(ApiKeyState(key, quota))
+        if not self._states:
+            raise ValueError("API key 池至少需要一把 key")
+
+    def _active(self):
+        return [s for s in self._states if s.status == KEY_ACTIVE]
+
+    @property
+    def limit(self):
+        """所有可用 key 的併發上限總和"""
+        with self._lock:
+            return max(1, sum(s.limiter.limit for s in self._active()))
+
+    @property
+    def max_limit(self):
+        """所有可用 key 的併發上限上限總和"""
+        with self._lock:
+            return max(1, sum(s.limiter.max_limit for s in self._active()))
+
+    @property
+    def interval(self):
+        """
+        全域請求間隔：各 key 依自身間隔發送，因此全域只需最小間隔
+        （實際的每 key 間隔由 acquire 控制）
+        """
+        with self._lock:
+            rates = [1.0 / s.limiter.interval for s in self._active()]
+            return 1.0 / sum(rates) if rates else 1.0
+
+    def first_active(self):
+        """
+        取得第一把可用的 key
+        :return: key 字串或 None
+        """
+        with self._lock:
+            active = self._active()
+            return active[0].key if active else None
+
+    def has_active(self):
+        """是否仍有可用的 key"""
+        with self._lock:
+            return bool(self._active())
+
+    def acquire(self, cancellation_check=None):
+        """
+        選出一把可立即使用的 key（都在冷卻中則等待）
+        :param cancellation_check: 取消檢查函數
+        :return: ApiKeyState，沒有可用 key 或被取消時回傳 None
+        """
+        while True:
+            if cancellation_check and cancellation_check():
+                return None
+
+            with self._lock:
+                active = self._active()
+                if not active:
+                    return None
+
+                state = self._pick_ready(active)
+                if state is not None:
+                    return state
+
+                wait_time = min(s.next_ready for s in active) - time.monotonic()
+
+            time.sleep(min(max(wait_time, 0.01), 0.2))
+
+    def _pick_ready(self, active):
+        """從可用 key 中選出已就緒且用量最少的一把並記帳（呼叫端需持有鎖）"""
+        now = time.monotonic()
+        ready = [s for s in active if s.next_ready <= now]
+        if not ready:
+            return None
+
+        # 用量最少者優先，讓請求平均分散到各 key
+        state = min(ready, key=lambda s: (s.used, s.next_ready))
+        state.used += 1
+        state.next_ready = now + state.limiter.interval
+        if state.quota is not None and state.used >= state.quota:
+            state.status = KEY_EXHAUSTED
+        return state
+
+    def refund(self, state):
+        """歸還已取得但未送出的請求額度（如排隊中被取消的請求）"""
+        with self._lock:
+            # 因這次取得而用盡配額的 key 恢復可用
+            if state.status == KEY_EXHAUSTED and state.quota is not None and state.used == state.quota:
+                state.status = KEY_ACTIVE
+            state.used = max(0, state.used - 1)
+
+    def report_success(self, state, latency):
+        """回報某把 key 的成功請求"""
+        with self._lock:
+            state.succeeded += 1
+        state.limiter.on_success(latency)
+
+    def report_throttle(self, state, retry_after=None):
+        """
+        回報某把 key 收到 429（只暫停該 key）
+        :return: 該 key 暫停的秒數
+        """
+        wait_time = state.limiter.on_throttle(retry_after)
+        with self._lock:
+            state.throttled += 1
+            state.next_ready = max(state.next_ready, time.monotonic() + wait_time)
+        return wait_time
+
+    def report_error(self, state):
+        """
+        回報某把 key 的暫時性錯誤
+        :return: 建議重試前等待的秒數
+        """
+        with self._lock:
+            state.errors += 1
+        return state.limiter.on_error()
+
+    def reject(self, state):
+        """停用被 API 拒絕（401/403）的 key"""
+        with self._lock:
+            state.status = KEY_REJECTED
+
+    def mark_exhausted(self, state):
+        """停用配額用盡的 key（如 429 響應表示每月額度已用完）"""
+        with self._lock:
+            state.status = KEY_EXHAUSTED
+
+    def usage(self):
+        """
+        取得每把 key 的使用情況
+        :return: [{key, status, used, quota, succeeded, throttled, errors, limit}, ...]
+        """
+        with self._lock:
+            return [
+                {
+                    'key': s.masked,
+                    'status': s.status,
+                    'used': s.used,
+                    'quota': s.quota,
+                    'succeeded': s.succeeded,
+                    'throttled': s.throttled,
+                    'errors': s.errors,
+                    'limit': s.limiter.limit,
+                }
+                for s in self._states
+            ]
+
+    def snapshot(self):
+        """取得 key 池狀態（供 RequestScheduler.snapshot 使用）"""
+        return {'keys': self.usage()}
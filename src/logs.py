@@ -0,0 +1,162 @@
+"""
+結構化日誌模組
+以標準 logging 取代直接 print 到 stderr：
+- 分等級（DEBUG 的逐日結算細節可常駐程式中，未啟用時不格式化訊息）
+- 每筆紀錄帶有目前查詢的上下文欄位（幣種、計價貨幣、工作行程等，以 contextvars 依執行緒/工作傳遞）
+- 重複的警告（如連續的 429）在間隔內只輸出一次，並記錄期間略過的筆數
+- 輸出格式可選 JSON lines（供日誌管線收集）或人類可讀的文字
+"""
+
+import contextvars
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+ROOT_LOGGER = 'crypto_price'
+DEFAULT_RATE_LIMIT = 10.0  # 同一警告的最短輸出間隔（秒）
+
+_LEVEL_LABELS = {
+    logging.DEBUG: '除錯',
+    logging.INFO: '資訊',
+    logging.WARNING: '警告',
+    logging.ERROR: '錯誤',
+    logging.CRITICAL: '嚴重錯誤',
+}
+
+_context = contextvars.ContextVar('log_context', default={})
+
+# LogRecord 內建屬性（其餘屬性視為 extra 傳入的結構化欄位）
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'context'}
+
+
+def get_logger(name):
+    """
+    取得模組 logger（掛在 crypto_price 之下，共用同一組設定）
+    :param name: 模組名稱（如 core）
+    :return: logging.Logger
+    """
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    在區塊內的日誌紀錄加上上下文欄位（可巢狀，內層覆蓋同名欄位）
+    :param fields: 欄位（如 coin_id='bitcoin'）
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """將目前的上下文欄位附加到紀錄（record.context）"""
+
+    def filter(self, record):
+        record.context = _context.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    重複警告限流：同一 logger、訊息樣板（未代入參數前）與上下文欄位（如幣種）在間隔內只放行一次，
+    下一次放行時以 suppressed 欄位回報期間略過的筆數（ERROR 以上一律放行）；
+    不同幣種的同一警告分別計算，不會互相遮蔽
+    """
+
+    def __init__(self, interval=DEFAULT_RATE_LIMIT):
+        super().__init__()
+        self.interval = interval
+        self._last = {}  # key -> (上次放行時間, 略過筆數)
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno != logging.WARNING or self.interval <= 0:
+            return True
+        context = getattr(record, 'context', None) or {}
+        key = (record.name, record.msg, tuple(sorted((k, str(v)) for k, v in context.items())))
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._last.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._last[key] = (last, suppressed + 1)
+                return False
+            self._last[key] = (now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+def _fields(record):
+    """紀錄的結構化欄位：上下文欄位加上 extra 傳入的欄位"""
+    fields = dict(getattr(record, 'context', None) or {})
+    fields.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+    return fields
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆紀錄輸出為一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """人類可讀格式：「錯誤：訊息 [coin_id=bitcoin ...]」"""
+
+    def format(self, record):
+        text = f"{_LEVEL_LABELS.get(record.levelno, record.levelname)}：{record.getMessage()}"
+        fields = _fields(record)
+        if fields:
+            text += " [" + " ".join(f"{key}={value}" for key, value in fields.items()) + "]"
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+
+def configure_logging(level=logging.WARNING, fmt='text', stream=None, rate_limit=DEFAULT_RATE_LIMIT):
+    """
+    設定 crypto_price 日誌（重複呼叫會取代先前的設定）
+    :param level: 日誌等級（logging 常數或名稱，如 'DEBUG'）
+    :param fmt: 輸出格式 'json'（JSON lines）或 'text'
+    :param stream: 輸出串流（預設 stderr）
+    :param rate_limit: 同一警告的最短輸出間隔（秒；0 表示不限流）
+    :return: crypto_price 根 logger
+    :raises ValueError: 不支援的格式或等級
+    """
+    if fmt not in ('json', 'text'):
+        raise ValueError(f"不支援的日誌格式：{fmt}（可用：json、text）")
+    if isinstance(level, str):
+        if not isinstance(logging.getLevelName(level.upper()), int):
+            raise ValueError(f"不支援的日誌等級：{level}")
+        level = logging.getLevelName(level.upper())
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+    handler.addFilter(ContextFilter())
+    handler.addFilter(RateLimitFilter(rate_limit))
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
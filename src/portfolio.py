@@ -0,0 +1,285 @@
+"""
+投資組合估值模組
+讀取持倉檔（coin_id → 數量，可隨日期變動），並行查詢所需幣種後，
+以「日期 × 幣種」矩陣一次計算每日總市值、各幣種貢獻與損益：
+    V = Q ∘ P                    每日各幣種市值
+    PnL[t] = Q[t-1] ∘ (P[t] - P[t-1])  持有部位的每日損益（不含買賣造成的部位變動）
+取代逐幣種匯出 CSV 再手動合併
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta
+from itertools import accumulate
+from operator import mul
+
+from src.batch import run_batch
+from src.scheduler import PRIORITY_BATCH
+from src.utils import atomic_write
+from src.fx import BASE_CURRENCY
+
+
+def load_holdings(path):
+    """
+    讀取持倉檔
+    CSV：欄位 coin_id, quantity，可選 date（自該日起持有此數量；未填表示期初即持有）
+    JSON：{coin_id: quantity} 或 {coin_id: [{"date": ..., "quantity": ...}, ...]}
+    同一幣種、同一生效日期的多筆持倉（如分散在多個錢包）數量相加
+    :param path: 持倉檔路徑（.csv 或 .json）
+    :return: dict {coin_id: [(生效日期或 None, 數量), ...]}，依生效日期排序
+    :raises ValueError: 檔案格式錯誤
+    """
+    try:
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            text = f.read()
+    except OSError as e:
+        raise ValueError(f"無法讀取持倉檔：{e}")
+
+    entries = []
+    if os.path.splitext(path)[1].lower() == '.json':
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"持倉檔 JSON 格式錯誤：{e}")
+        if not isinstance(data, dict):
+            raise ValueError("持倉檔 JSON 必須是 {coin_id: 數量} 格式")
+        for coin_id, value in data.items():
+            if isinstance(value, list):
+                for item in value:
+                    if not isinstance(item, dict):
+                        raise ValueError(f"{coin_id} 的持倉變動必須是 {{\"date\", \"quantity\"}} 格式：{item}")
+                    entries.append((coin_id, item.get('date'), item.get('quantity')))
+            else:
+                entries.append((coin_id, None, value))
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or not {'coin_id', 'quantity'} <= {name.strip() for name in reader.fieldnames}:
+            raise ValueError("持倉檔 CSV 需要 coin_id 與 quantity 欄位")
+        for row in reader:
+            row = {key.strip(): (value or '').strip() for key, value in row.items() if key}
+            if row.get('coin_id'):
+                entries.append((row['coin_id'], row.get('date') or None, row.get('quantity')))
+
+    holdings = {}
+    for coin_id, date_str, quantity in entries:
+        try:
+            quantity = float(quantity)
+        except (TypeError, ValueError):
+            raise ValueError(f"{coin_id} 的數量格式錯誤：{quantity}")
+        if date_str is not None:
+            try:
+                datetime.strptime(date_str, "%Y-%m-%d")
+            except (TypeError, ValueError):
+                raise ValueError(f"{coin_id} 的生效日期格式錯誤，請使用 YYYY-MM-DD：{date_str}")
+        schedule = holdings.setdefault(coin_id.strip(), {})
+        schedule[date_str] = schedule.get(date_str, 0.0) + quantity
+
+    if not holdings:
+        raise ValueError("持倉檔沒有任何持倉")
+    return {coin_id: sorted(schedule.items(), key=lambda item: item[0] or '')
+            for coin_id, schedule in holdings.items()}
+
+
+def _date_range(from_date, to_date):
+    start = datetime.strptime(from_date, "%Y-%m-%d")
+    end = datetime.strptime(to_date, "%Y-%m-%d")
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end - start).days + 1)]
+
+
+def _quantity_column(schedule, dates):
+    """將持倉變動表展開為每日數量（生效日前為 0）"""
+    column = []
+    index, quantity = 0, 0.0
+    for date_str in dates:
+        while index < len(schedule) and (schedule[index][0] is None or schedule[index][0] <= date_str):
+            quantity = schedule[index][1]
+            index += 1
+        column.append(quantity)
+    return column
+
+
+def _price_column(prices, dates):
+    """將價格資料對齊到日期軸，缺漏以前一日價格延續（期初前無價格時為 None）"""
+    by_date = {item['date']: item['price'] for item in prices}
+    column = []
+    last = None
+    for date_str in dates:
+        price = by_date.get(date_str)
+        if price is not None:
+            last = price
+        column.append(last)
+    return column
+
+
+class PortfolioValuation:
+    """投資組合估值結果（矩陣皆為 日期 × 幣種，依 dates / coin_ids 排列）"""
+
+    def __init__(self, dates, coin_ids, quantities, prices, currency=BASE_CURRENCY):
+        """
+        初始化並計算市值與損益
+        :param dates: 日期列表
+        :param coin_ids: 幣種 ID 列表
+        :param quantities: 持有數量矩陣
+        :param prices: 價格矩陣（缺漏已前值延續；仍無價格為 None）
+        :param currency: 計價貨幣
+        """
+        self.currency = currency
+        self.dates = dates
+        self.coin_ids = coin_ids
+        self.quantities = quantities
+        self.prices = prices
+
+        # 無價格的格子以 0 計值，另以 missing 記錄當日無法估值的幣種數
+        filled = [[p if p is not None else 0.0 for p in row] for row in prices]
+        self.missing = [sum(1 for q, p in zip(q_row, p_row) if q and p is None)
+                        for q_row, p_row in zip(quantities, prices)]
+
+        # V = Q ∘ P
+        self.values = [list(map(mul, q_row, p_row)) for q_row, p_row in zip(quantities, filled)]
+        self.totals = [sum(row) for row in self.values]
+
+        # PnL[t] = Q[t-1] ∘ (P[t] - P[t-1])；任一端無價格時為 0
+        zero = [0.0] * len(coin_ids)
+        self.pnl = [zero] + [
+            [q * (p - p_prev) if p is not None and p_prev is not None else 0.0
+             for q, p, p_prev in zip(q_prev, p_row, p_prev_row)]
+            for q_prev, p_row, p_prev_row in zip(quantities, prices[1:], prices)
+        ]
+        self.daily_pnl = [sum(row) for row in self.pnl]
+        self.cumulative_pnl = list(accumulate(self.daily_pnl))
+
+    def summary(self):
+        """
+        彙總
+        :return: dict {start_value, end_value, pnl, return_pct, coins: {coin_id: {quantity, price, value, weight, pnl, pnl_share}}}
+        """
+        if not self.dates:
+            return {'start_value': 0.0, 'end_value': 0.0, 'pnl': 0.0, 'return_pct': None, 'coins': {}}
+
+        start_value, end_value = self.totals[0], self.totals[-1]
+        total_pnl = self.cumulative_pnl[-1]
+        coin_pnl = [sum(column) for column in zip(*self.pnl)]
+
+        coins = {}
+        for index, coin_id in enumerate(self.coin_ids):
+            value = self.values[-1][index]
+            coins[coin_id] = {
+                'quantity': self.quantities[-1][index],
+                'price': self.prices[-1][index],
+                'value': value,
+                'weight': value / end_value if end_value else None,
+                'pnl': coin_pnl[index],
+                'pnl_share': coin_pnl[index] / total_pnl if total_pnl else None,
+            }
+
+        return {
+            'start_value': start_value,
+            'end_value': end_value,
+            'pnl': total_pnl,
+            'return_pct': total_pnl / start_value * 100 if start_value else None,
+            'coins': coins,
+        }
+
+    def to_rows(self):
+        """
+        每日明細
+        :return: [{'date', 'value', 'pnl', 'cumulative_pnl', 'missing', 'coins': {coin_id: value}}, ...]
+        """
+        return [
+            {
+                'date': date_str,
+                'value': total,
+                'pnl': pnl,
+                'cumulative_pnl': cumulative,
+                'missing': missing,
+                'coins': dict(zip(self.coin_ids, values)),
+            }
+            for date_str, total, pnl, cumulative, missing, values in zip(
+                self.dates, self.totals, self.daily_pnl, self.cumulative_pnl, self.missing, self.values)
+        ]
+
+
+def value_portfolio(holdings, prices_by_coin, from_date, to_date, currency=BASE_CURRENCY):
+    """
+    計算投資組合估值
+    :param holdings: load_holdings 的結果
+    :param prices_by_coin: dict {coin_id: 價格資料列表}
+    :param from_date: 開始日期（YYYY-MM-DD）
+    :param to_date: 結束日期（YYYY-MM-DD）
+    :param currency: 價格資料的計價貨幣
+    :return: PortfolioValuation
+    """
+    dates = _date_range(from_date, to_date)
+    coin_ids = sorted(holdings)
+
+    # 逐欄建立後轉置為 日期 × 幣種 矩陣
+    quantity_columns = [_quantity_column(holdings[coin_id], dates) for coin_id in coin_ids]
+    price_columns = [_price_column(prices_by_coin.get(coin_id) or [], dates) for coin_id in coin_ids]
+    quantities = [list(row) for row in zip(*quantity_columns)] or [[] for _ in dates]
+    prices = [list(row) for row in zip(*price_columns)] or [[] for _ in dates]
+    return PortfolioValuation(dates, coin_ids, quantities, prices, currency)
+
+
+def fetch_portfolio(fetcher, holdings, from_date, to_date, on_result=None, cancellation_check=None,
+                    priority=PRIORITY_BATCH, retry_budget=None, vs_currency=BASE_CURRENCY):
+    """
+    並行查詢持倉幣種的價格並計算估值
+    :param fetcher: CoinGeckoPriceFetcher
+    :param holdings: load_holdings 的結果
+    :param from_date: 開始日期（YYYY-MM-DD）
+    :param to_date: 結束日期（YYYY-MM-DD）
+    :param on_result: 單一幣種完成時的回調 callback(coin_id, prices, elapsed, error)
+    :param cancellation_check: CancellationToken 或取消檢查函數
+    :param priority: 請求優先等級
+    :param retry_budget: 整批共用的重試預算
+    :param vs_currency: 計價貨幣
+    :return: (PortfolioValuation, prices_by_coin)；查詢失敗的幣種價格為空列表
+    """
+    prices_by_coin = run_batch(
+        fetcher,
+        sorted(holdings),
+        from_date,
+        to_date,
+        on_result=on_result,
+        cancellation_check=cancellation_check,
+        priority=priority,
+        retry_budget=retry_budget,
+        vs_currency=vs_currency
+    )
+    return value_portfolio(holdings, prices_by_coin, from_date, to_date, vs_currency), prices_by_coin
+
+
+def format_portfolio_csv(valuation):
+    """
+    將估值結果轉為 CSV 文字（每日總市值、損益與各幣種市值）
+    :param valuation: PortfolioValuation
+    :return: CSV 字串
+    """
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer)
+    currency = valuation.currency.upper()
+    writer.writerow(['Date', f'Value ({currency})', f'P&L ({currency})', f'Cumulative P&L ({currency})']
+                    + [f"{coin_id} ({currency})" for coin_id in valuation.coin_ids])
+    for row in valuation.to_rows():
+        writer.writerow([row['date'], row['value'], row['pnl'], row['cumulative_pnl']]
+                        + [row['coins'][coin_id] for coin_id in valuation.coin_ids])
+    return buffer.getvalue()
+
+
+def save_portfolio_csv(valuation, output_file):
+    """
+    儲存估值結果為 CSV 檔案（原子寫入）
+    :param valuation: PortfolioValuation
+    :param output_file: 輸出檔案路徑
+    :return: 輸出檔案路徑
+    :raises Exception: 儲存失敗
+    """
+    if not valuation.dates:
+        raise ValueError("沒有估值資料可以輸出")
+    try:
+        atomic_write(output_file, format_portfolio_csv(valuation).encode('utf-8'))
+        return output_file
+    except Exception as e:
+        raise Exception(f"儲存 CSV 檔案時發生錯誤：{e}")
@@ -0,0 +1,258 @@
+"""
+效能分析模組
+以 span 記錄各階段耗時（排隊、HTTP、退避等待、JSON 解析、結算價分組、匯率換算、CSV 寫入），
+每個幣種、每次嘗試各一段，可匯出 Chrome / Perfetto trace JSON（chrome://tracing 或 ui.perfetto.dev 開啟）
+與各階段彙總表，並可選擇同時以 cProfile 分析函數層級的耗時（各執行緒分別分析，結束時合併）。
+未啟用時 span() 直接回傳共用的空物件，不記錄也不計時
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+
+_active = None  # 目前啟用的 Profiler（None 表示關閉）
+
+
+class _NullSpan:
+    """未啟用時使用的空 span"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'args', 'started')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def set(self, **args):
+        """補上結束前才知道的附加資訊（如 HTTP 狀態碼）"""
+        self.args.update(args)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.profiler.record(self.name, self.started, time.perf_counter_ns(), self.args)
+        return False
+
+
+def span(name, **args):
+    """
+    記錄一段耗時（with span('http', url=...)）
+    :param name: 階段名稱
+    :param args: 附加資訊（幣種、嘗試次數等，顯示在 trace 中）
+    :return: context manager；未啟用效能分析時為不做任何事的共用物件
+    """
+    profiler = _active
+    if profiler is None:
+        return _NULL_SPAN
+    return _Span(profiler, name, args)
+
+
+def active():
+    """目前啟用的 Profiler（未啟用時為 None）"""
+    return _active
+
+
+class _ProfileSnapshot:
+    """
+    其他執行緒的 cProfile 統計快照（供 pstats.Stats 合併）
+    pstats 載入 Profile 時會呼叫 disable()，而 disable() 只作用於目前執行緒，
+    因此改為直接取快照，不影響該執行緒的分析狀態
+    """
+
+    def __init__(self, profile):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self):
+        pass
+
+
+class Profiler:
+    """效能分析紀錄（執行緒安全；同時只能啟用一個）"""
+
+    def __init__(self, use_cprofile=False):
+        """
+        初始化
+        :param use_cprofile: 是否同時啟用 cProfile（分析呼叫 start() 的執行緒與之後啟動的所有執行緒，
+                             如查詢工作執行緒；start() 之前已存在的其他執行緒不列入）
+        """
+        self.use_cprofile = use_cprofile
+        self._events = []  # (name, start_ns, end_ns, thread_id, args)
+        self._threads = {}  # thread_id -> 執行緒名稱
+        self._lock = threading.Lock()
+        self._cprofile = None
+        self._thread_profiles = []  # 其他執行緒各自的 cProfile.Profile
+        self._cprofile_stats = None  # stop() 時合併的 pstats.Stats
+        self.origin = None
+        self.elapsed = None
+
+    def start(self):
+        """
+        開始記錄
+        :raises RuntimeError: 已有其他 Profiler 啟用中
+        """
+        global _active
+        if _active is not None:
+            raise RuntimeError("效能分析已在進行中")
+        self.origin = time.perf_counter_ns()
+        _active = self
+        if self.use_cprofile:
+            # cProfile 只分析啟用它的執行緒：之後啟動的執行緒在第一個事件時各自建立並啟用一個
+            self._cprofile = cProfile.Profile()
+            threading.setprofile(self._profile_thread)
+            self._cprofile.enable()
+        return self
+
+    def _profile_thread(self, frame, event, arg):
+        """新執行緒的第一個 profile 事件：建立該執行緒的 cProfile（enable 後取代此回調）"""
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profiles.append(profile)
+        profile.enable()
+
+    def stop(self):
+        """
+        停止記錄（cProfile 統計在此時合併；仍在執行的其他執行緒之後的活動不列入）
+        """
+        global _active
+        if self._cprofile is not None and self._cprofile_stats is None:
+            threading.setprofile(None)
+            self._cprofile.disable()
+            stats = pstats.Stats(self._cprofile)
+            with self._lock:
+                profiles = list(self._thread_profiles)
+            for profile in profiles:
+                snapshot = _ProfileSnapshot(profile)
+                if snapshot.stats:
+                    stats.add(snapshot)
+            self._cprofile_stats = stats
+        if _active is self:
+            _active = None
+            self.elapsed = (time.perf_counter_ns() - self.origin) / 1e9
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def record(self, name, start_ns, end_ns, args=None):
+        """記錄一段已結束的 span"""
+        thread = threading.current_thread()
+        with self._lock:
+            self._events.append((name, start_ns, end_ns, thread.ident, args or {}))
+            self._threads.setdefault(thread.ident, thread.name)
+
+    def chrome_trace(self):
+        """
+        轉為 Chrome trace event 格式
+        :return: dict {traceEvents, displayTimeUnit}
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in threads.items()]
+        for name, start_ns, end_ns, tid, args in events:
+            trace.append({
+                'name': name,
+                'cat': name,
+                'ph': 'X',
+                'ts': (start_ns - self.origin) / 1000,
+                'dur': (end_ns - start_ns) / 1000,
+                'pid': pid,
+                'tid': tid,
+                'args': {key: str(value) for key, value in args.items()},
+            })
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def save_trace(self, path):
+        """
+        儲存 Chrome / Perfetto trace JSON（原子寫入）
+        :param path: 輸出檔案路徑
+        :return: 輸出檔案路徑
+        """
+        from src.utils import atomic_write  # src.utils 本身也使用 span，避免循環匯入
+        atomic_write(path, json.dumps(self.chrome_trace(), ensure_ascii=False).encode('utf-8'))
+        return path
+
+    def summary(self):
+        """
+        各階段彙總（依總耗時排序；各 span 可能重疊或巢狀，總和不等於實際經過時間）
+        :return: [{name, count, total, mean, p95, max}, ...]（秒）
+        """
+        durations = {}
+        with self._lock:
+            for name, start_ns, end_ns, _, _ in self._events:
+                durations.setdefault(name, []).append((end_ns - start_ns) / 1e9)
+
+        rows = []
+        for name, values in durations.items():
+            values.sort()
+            rows.append({
+                'name': name,
+                'count': len(values),
+                'total': sum(values),
+                'mean': sum(values) / len(values),
+                'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+                'max': values[-1],
+            })
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows
+
+    def format_summary(self):
+        """彙總表文字"""
+        lines = [f"{'階段':<18}{'次數':>8}{'總計(s)':>12}{'平均(ms)':>12}{'P95(ms)':>12}{'最大(ms)':>12}"]
+        for row in self.summary():
+            lines.append(f"{row['name']:<20}{row['count']:>8}{row['total']:>12.3f}{row['mean'] * 1000:>12.1f}"
+                         f"{row['p95'] * 1000:>12.1f}{row['max'] * 1000:>12.1f}")
+        if self.elapsed is not None:
+            lines.append(f"實際經過時間：{self.elapsed:.3f}s（span 可能並行或巢狀，總計不可直接相加）")
+        return "\n".join(lines)
+
+    def save_cprofile(self, path):
+        """
+        儲存 cProfile 統計（pstats 格式，可用 snakeviz 等工具檢視）
+        :return: 輸出檔案路徑，未啟用 cProfile 或尚未 stop() 時回傳 None
+        """
+        if self._cprofile_stats is None:
+            return None
+        self._cprofile_stats.dump_stats(path)
+        return path
+
+    def format_cprofile(self, limit=20):
+        """cProfile（所有執行緒合併）依累計時間排序的前 limit 個函數（未啟用 cProfile 或尚未 stop() 時為空字串）"""
+        if self._cprofile_stats is None:
+            return ""
+        buffer = io.StringIO()
+        self._cprofile_stats.stream = buffer
+        self._cprofile_stats.sort_stats('cumulative').print_stats(limit)
+        return buffer.getvalue()
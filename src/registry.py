@@ -0,0 +1,281 @@
+"""
+幣種目錄模組
+將 CoinGecko /coins/list 的完整目錄（上萬筆）同步到本地快取，並建立索引：
+- 代號 → ID 解析（同代號多個幣種時優先常用幣種，仍無法判斷則回報候選）
+- 以排序鍵值二分搜尋的前綴搜尋，不足時再以子字串與近似比對補足
+目錄更新在背景執行緒進行，與目前目錄比對後只在有變動時重建索引，不影響啟動速度
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from difflib import get_close_matches
+
+from src.constants import COIN_LIST
+from src.scheduler import PRIORITY_PREFETCH
+from src.utils import atomic_write
+
+
+DEFAULT_REGISTRY_FILE = "coin_registry.json"
+REGISTRY_MAX_AGE = 24 * 3600  # 快取超過此秒數才重新同步
+
+
+class AmbiguousCoinError(ValueError):
+    """代號對應到多個幣種"""
+
+    def __init__(self, query, candidates):
+        """
+        初始化
+        :param query: 查詢字串
+        :param candidates: 候選幣種 [{id, symbol, name}, ...]
+        """
+        self.query = query
+        self.candidates = candidates
+        choices = "、".join(f"{coin['id']}（{coin['name']}）" for coin in candidates[:10])
+        more = f" 等 {len(candidates)} 個" if len(candidates) > 10 else ""
+        super().__init__(f"「{query}」對應到多個幣種：{choices}{more}，請改用幣種 ID")
+
+
+class _Index:
+    """不可變的目錄索引（更新時整個替換，讀取端不需加鎖）"""
+
+    def __init__(self, coins, preferred):
+        self.by_id = {}
+        self.by_symbol = {}  # 代號（小寫）-> [coin_id, ...]，常用幣種優先
+        self.by_name = {}  # 名稱（小寫）-> [coin_id, ...]
+        keys = []  # (鍵值, 排序權重, coin_id)
+        for coin in coins:
+            coin_id = coin['id']
+            entry = {'id': coin_id, 'symbol': coin['symbol'].upper(), 'name': coin['name']}
+            self.by_id[coin_id] = entry
+            symbol, name = coin['symbol'].lower(), coin['name'].lower()
+            self.by_symbol.setdefault(symbol, []).append(coin_id)
+            self.by_name.setdefault(name, []).append(coin_id)
+
+            rank = 0 if coin_id in preferred else 1
+            words = {symbol, name, coin_id} | set(name.split())
+            keys.extend((word, rank, coin_id) for word in words if word)
+
+        for ids in list(self.by_symbol.values()) + list(self.by_name.values()):
+            ids.sort(key=lambda coin_id: (coin_id not in preferred, len(coin_id), coin_id))
+        keys.sort()
+        self.keys = [key for key, _, _ in keys]
+        self.key_ids = [coin_id for _, _, coin_id in keys]
+        self.search_text = [(f"{entry['symbol']} {entry['name']} {coin_id}".lower(), coin_id)
+                            for coin_id, entry in self.by_id.items()]
+        self.fuzzy_keys = list(self.by_symbol) + [coin_id for coin_id in self.by_id if coin_id not in self.by_symbol]
+
+
+class CoinRegistry:
+    """幣種目錄（執行緒安全；沒有快取時以內建常用幣種列表為準）"""
+
+    def __init__(self, path=DEFAULT_REGISTRY_FILE, max_age=REGISTRY_MAX_AGE):
+        """
+        初始化（不讀取快取；呼叫 load() 或 start_background_refresh()）
+        :param path: 本地快取檔路徑
+        :param max_age: 快取有效期（秒）
+        """
+        self.path = path
+        self.max_age = max_age
+        self.synced_at = None  # 上次同步完成的時間（UNIX timestamp）
+        self._preferred = {coin['id'] for coin in COIN_LIST}
+        self._coins = {coin['id']: {'id': coin['id'], 'symbol': coin['symbol'], 'name': coin['name']}
+                       for coin in COIN_LIST}
+        self._index = _Index(self._coins.values(), self._preferred)
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    def __len__(self):
+        return len(self._index.by_id)
+
+    def load(self):
+        """
+        讀取本地快取（檔案不存在或損毀時保留內建列表）
+        :return: 是否成功讀取
+        """
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            coins = {coin['id']: {'id': coin['id'], 'symbol': coin.get('symbol') or '', 'name': coin.get('name') or ''}
+                     for coin in data.get('coins', []) if coin.get('id')}
+        except (OSError, ValueError, AttributeError, TypeError):
+            return False
+
+        with self._lock:
+            self._replace(coins)
+            self.synced_at = data.get('synced_at')
+        return True
+
+    def _replace(self, coins):
+        """以新目錄重建索引（內建常用幣種一律保留）"""
+        merged = dict(coins)
+        for coin in COIN_LIST:
+            merged.setdefault(coin['id'], {'id': coin['id'], 'symbol': coin['symbol'], 'name': coin['name']})
+        self._coins = merged
+        self._index = _Index(merged.values(), self._preferred)
+
+    def is_stale(self):
+        """快取是否需要重新同步"""
+        return self.synced_at is None or time.time() - self.synced_at > self.max_age
+
+    def refresh(self, fetcher, cancellation_check=None, priority=PRIORITY_PREFETCH):
+        """
+        從 API 同步目錄並寫入快取（與目前目錄比對，只在有新增/移除/變動時重建索引）
+        :param fetcher: CoinGeckoPriceFetcher
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param priority: 請求優先等級（預設為背景預取，不佔用查詢的 API 額度）
+        :return: dict {added, removed, updated}（各為 coin_id 列表），失敗時回傳 None
+        """
+        coins = fetcher.get_coin_list(cancellation_check=cancellation_check, priority=priority)
+        if not coins:
+            return None
+
+        latest = {coin['id']: coin for coin in coins}
+        with self._lock:
+            current = self._coins
+            diff = {
+                'added': sorted(set(latest) - set(current)),
+                'removed': sorted(coin_id for coin_id in current
+                                  if coin_id not in latest and coin_id not in self._preferred),
+                'updated': sorted(coin_id for coin_id, coin in latest.items()
+                                  if coin_id in current
+                                  and (coin['symbol'].upper(), coin['name'])
+                                  != (current[coin_id]['symbol'].upper(), current[coin_id]['name'])),
+            }
+            if any(diff.values()):
+                self._replace(latest)
+            self.synced_at = time.time()
+            data = {'version': 1, 'synced_at': self.synced_at,
+                    'coins': sorted(self._coins.values(), key=lambda coin: coin['id'])}
+
+        atomic_write(self.path, json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return diff
+
+    def start_background_refresh(self, fetcher_factory, on_done=None, force=False):
+        """
+        在背景執行緒讀取快取，快取過期時再同步（不阻塞啟動）
+        :param fetcher_factory: 回傳 CoinGeckoPriceFetcher 的函數（在背景執行緒中呼叫）
+        :param on_done: 完成時的回調 callback(diff)，diff 為 None 表示未同步或同步失敗（在背景執行緒中呼叫）
+        :param force: 是否忽略有效期強制同步
+        :return: 背景執行緒
+        """
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return self._refresh_thread
+
+        def run():
+            self.load()
+            diff = None
+            if force or self.is_stale():
+                try:
+                    diff = self.refresh(fetcher_factory())
+                except Exception:
+                    diff = None
+            if on_done:
+                on_done(diff)
+
+        self._refresh_thread = threading.Thread(target=run, daemon=True)
+        self._refresh_thread.start()
+        return self._refresh_thread
+
+    def get(self, coin_id):
+        """
+        取得幣種資訊
+        :param coin_id: 幣種 ID
+        :return: {id, symbol, name}，不存在時回傳 None
+        """
+        return self._index.by_id.get(coin_id)
+
+    def symbol(self, coin_id):
+        """取得幣種代號（未知時以 ID 大寫代替）"""
+        entry = self._index.by_id.get(coin_id)
+        return entry['symbol'] if entry and entry['symbol'] else coin_id.upper()
+
+    def resolve(self, query, strict=False):
+        """
+        將幣種 ID、代號或名稱解析為幣種 ID
+        :param query: 查詢字串（不分大小寫）
+        :param strict: 無法解析時是否拋出錯誤（否則原樣回傳，交由 API 判斷）
+        :return: 幣種 ID
+        :raises AmbiguousCoinError: 代號/名稱對應到多個幣種且無法判斷
+        :raises ValueError: strict 模式下找不到幣種
+        """
+        index = self._index
+        text = query.strip()
+        if text in index.by_id:
+            return text
+
+        key = text.lower()
+        if key in index.by_id:
+            return key
+        for table in (index.by_symbol, index.by_name):
+            ids = table.get(key)
+            if not ids:
+                continue
+            if len(ids) == 1:
+                return ids[0]
+            preferred = [coin_id for coin_id in ids if coin_id in self._preferred]
+            if len(preferred) == 1:
+                return preferred[0]
+            raise AmbiguousCoinError(text, [index.by_id[coin_id] for coin_id in ids])
+
+        if strict:
+            suggestions = self.search(text, limit=5)
+            hint = f"，您是否要找：{'、'.join(coin['id'] for coin in suggestions)}" if suggestions else ""
+            raise ValueError(f"找不到幣種「{text}」{hint}")
+        return text
+
+    def search(self, keyword, limit=50):
+        """
+        搜尋幣種：代號/名稱/ID 前綴相符者優先，其次為子字串相符，都沒有時再找近似的代號或 ID
+        :param keyword: 搜尋字串（不分大小寫）
+        :param limit: 最多回傳筆數
+        :return: [{id, symbol, name}, ...]，常用幣種與完全相符者排在前面
+        """
+        index = self._index
+        key = keyword.strip().lower()
+        if not key:
+            return []
+
+        found = []
+        seen = set()
+
+        def add(coin_id):
+            if coin_id not in seen:
+                seen.add(coin_id)
+                found.append(coin_id)
+
+        # 完全相符的代號
+        for coin_id in index.by_symbol.get(key, ()):
+            add(coin_id)
+
+        # 前綴：二分搜尋到第一個 >= key 的鍵值，依序掃描到不再相符
+        prefix = []
+        position = bisect_left(index.keys, key)
+        while position < len(index.keys) and index.keys[position].startswith(key):
+            prefix.append(index.key_ids[position])
+            position += 1
+        prefix.sort(key=lambda coin_id: (coin_id not in self._preferred, len(index.by_id[coin_id]['name'])))
+        for coin_id in prefix:
+            add(coin_id)
+            if len(found) >= limit:
+                return [index.by_id[coin_id] for coin_id in found]
+
+        # 子字串
+        if len(key) >= 2:
+            for text, coin_id in index.search_text:
+                if key in text:
+                    add(coin_id)
+                    if len(found) >= limit:
+                        break
+
+        # 近似代號或 ID（拼錯時）
+        if not found:
+            for match in get_close_matches(key, index.fuzzy_keys, n=limit, cutoff=0.75):
+                for coin_id in index.by_symbol.get(match) or [match]:
+                    add(coin_id)
+
+        return [index.by_id[coin_id] for coin_id in found[:limit]]
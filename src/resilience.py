@@ -0,0 +1,158 @@
+"""
+上游故障保護模組
+- CircuitBreaker：每個 API endpoint 一個斷路器（closed / open / half-open），
+  連續失敗後快速失敗，冷卻後只放行少量探測請求
+- RetryBudget：整批查詢共用的重試預算，重試次數不超過請求數的固定比例，
+  避免服務中斷時每個幣種各自重試到上限
+"""
+
+import threading
+import time
+
+
+# 斷路器狀態
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """斷路器（執行緒安全）"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, max_reset_timeout=300.0, half_open_probes=1):
+        """
+        初始化
+        :param failure_threshold: 連續失敗幾次後斷開
+        :param reset_timeout: 斷開後多久進入 half-open 探測（秒）
+        :param max_reset_timeout: 探測連續失敗時冷卻時間的上限（秒）
+        :param half_open_probes: half-open 狀態下同時允許的探測請求數
+        """
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._reset_timeout = reset_timeout
+        self._probes_in_flight = 0
+
+    @property
+    def state(self):
+        """目前狀態（open 冷卻結束時視為 half-open）"""
+        with self._lock:
+            if self._state == STATE_OPEN and time.monotonic() >= self._opened_at + self._reset_timeout:
+                return STATE_HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """
+        是否允許發送請求
+        :return: True 表示可發送；False 表示應快速失敗
+        """
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_OPEN:
+                if time.monotonic() < self._opened_at + self._reset_timeout:
+                    return False
+                self._state = STATE_HALF_OPEN
+                self._probes_in_flight = 0
+            # half-open：只放行少量探測請求
+            if self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def release_probe(self):
+        """歸還未實際發送的探測名額（例如等待許可時被取消）"""
+        with self._lock:
+            if self._state == STATE_HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def retry_after(self):
+        """
+        距離下次允許探測的秒數
+        :return: 秒數（closed 時為 0）
+        """
+        with self._lock:
+            if self._state != STATE_OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self._reset_timeout - time.monotonic())
+
+    def record_success(self):
+        """記錄一次成功（上游正常回應）"""
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._failures = 0
+            self._probes_in_flight = 0
+            self._reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        """記錄一次上游故障（連線錯誤、逾時、5xx）"""
+        with self._lock:
+            self._failures += 1
+            if self._state == STATE_HALF_OPEN:
+                # 探測失敗：重新斷開，冷卻時間加倍
+                self._probes_in_flight = 0
+                self._reset_timeout = min(self.max_reset_timeout, self._reset_timeout * 2)
+                self._open()
+            elif self._state == STATE_CLOSED and self._failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self._state = STATE_OPEN
+        self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        """取得斷路器狀態（供監控顯示）"""
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'failures': self._failures,
+                'reset_timeout': self._reset_timeout,
+            }
+
+
+class RetryBudget:
+    """重試預算（執行緒安全）：允許的重試次數 = min_retries + ratio × 已發送的首次請求數"""
+
+    def __init__(self, ratio=0.2, min_retries=10):
+        """
+        初始化
+        :param ratio: 重試次數相對於首次請求數的比例
+        :param min_retries: 不論請求數多少都允許的基本重試次數
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+
+    def record_request(self):
+        """記錄一次首次請求"""
+        with self._lock:
+            self._requests += 1
+
+    def try_spend(self):
+        """
+        嘗試使用一次重試額度
+        :return: True 表示可以重試；False 表示預算已用盡
+        """
+        with self._lock:
+            if self._retries < self.min_retries + self.ratio * self._requests:
+                self._retries += 1
+                return True
+            return False
+
+    def snapshot(self):
+        """取得預算使用狀態"""
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'retries': self._retries,
+                'allowed': int(self.min_retries + self.ratio * self._requests),
+            }
@@ -0,0 +1,185 @@
+"""
+API 請求排程模組
+所有 fetcher 的 HTTP 請求都經過排程器取得發送許可：
+依優先等級（互動 > 批量 > 預取）排隊，並統一控制併發數與請求間隔；
+若配置 AdaptiveLimiter，併發數與間隔會依 429/延遲回饋動態調整
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+
+# 優先等級（數字越小越優先）
+PRIORITY_INTERACTIVE = 0  # 使用者在 GUI/CLI 直接發起的單一查詢
+PRIORITY_BATCH = 1        # 批量查詢
+PRIORITY_PREFETCH = 2     # 背景預取
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_BATCH: 'batch',
+    PRIORITY_PREFETCH: 'prefetch',
+}
+
+
+class RequestScheduler:
+    """依優先等級發放 API 請求許可的排程器（執行緒安全）"""
+
+    # 未配置 limiter 時，429 與錯誤後的固定等待秒數
+    THROTTLE_WAIT = 15
+    ERROR_WAIT = 2
+
+    def __init__(self, max_concurrent=2, min_interval=0.5, reserved_interactive=1, limiter=None):
+        """
+        初始化
+        :param max_concurrent: 同時進行中的請求上限（配置 limiter 時由 limiter 決定）
+        :param min_interval: 兩次請求發送之間的最小間隔（秒，配置 limiter 時由 limiter 決定）
+        :param reserved_interactive: 保留給互動查詢的併發名額（併發上限 > 1 時生效）
+        :param limiter: 自適應流量控制器（可選，見 src.throttle.AdaptiveLimiter）
+        """
+        self._max_concurrent = max_concurrent
+        self._min_interval = min_interval
+        self.reserved_interactive = reserved_interactive
+        self.limiter = limiter
+
+        self._cond = threading.Condition()
+        self._waiting = []  # heap: [priority, seq, active]
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._next_dispatch = 0.0
+        self._blocked_until = 0.0
+        self._dispatched = {name: 0 for name in PRIORITY_NAMES.values()}
+
+    @property
+    def max_concurrent(self):
+        """目前的併發上限"""
+        return self.limiter.limit if self.limiter else self._max_concurrent
+
+    @property
+    def min_interval(self):
+        """目前的請求間隔（秒）"""
+        return self.limiter.interval if self.limiter else self._min_interval
+
+    def _capacity_for(self, priority):
+        """取得指定優先等級可使用的併發名額"""
+        max_concurrent = self.max_concurrent
+        if priority != PRIORITY_INTERACTIVE and max_concurrent > 1:
+            return max(1, max_concurrent - self.reserved_interactive)
+        return max_concurrent
+
+    def _head(self):
+        """取得排隊中優先權最高的有效項目（順便清除已取消的項目）"""
+        while self._waiting and not self._waiting[0][2]:
+            heapq.heappop(self._waiting)
+        return self._waiting[0] if self._waiting else None
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, cancellation_check=None):
+        """
+        等待並取得一個請求許可
+        :param priority: 優先等級
+        :param cancellation_check: 取消檢查函數（回傳 True 表示放棄等待）
+        :return: True 表示取得許可；False 表示等待期間被取消
+        """
+        entry = [priority, next(self._seq), True]
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            while True:
+                if cancellation_check and cancellation_check():
+                    entry[2] = False
+                    self._cond.notify_all()
+                    return False
+
+                now = time.monotonic()
+                is_head = self._head() is entry
+                has_capacity = self._in_flight < self._capacity_for(priority)
+
+                ready_at = max(self._next_dispatch, self._blocked_until)
+
+                if is_head and has_capacity and now >= ready_at:
+                    heapq.heappop(self._waiting)
+                    self._in_flight += 1
+                    self._next_dispatch = now + self.min_interval
+                    name = PRIORITY_NAMES.get(priority, str(priority))
+                    self._dispatched[name] = self._dispatched.get(name, 0) + 1
+                    self._cond.notify_all()
+                    return True
+
+                # 只差發送間隔時精準等待，否則定期醒來檢查取消狀態
+                timeout = 0.2
+                if is_head and has_capacity:
+                    timeout = min(timeout, ready_at - now)
+                self._cond.wait(timeout)
+
+    def release(self):
+        """歸還請求許可"""
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._cond.notify_all()
+
+    def report_success(self, latency):
+        """
+        回報一次成功的請求
+        :param latency: 回應時間（秒）
+        """
+        if self.limiter:
+            self.limiter.on_success(latency)
+
+    def report_throttle(self, retry_after=None):
+        """
+        回報一次 429，並暫停所有請求的發送
+        :param retry_after: Retry-After 秒數（可選）
+        :return: 暫停的秒數
+        """
+        if self.limiter:
+            wait_time = self.limiter.on_throttle(retry_after)
+        else:
+            wait_time = retry_after if retry_after is not None else self.THROTTLE_WAIT
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + wait_time)
+            self._cond.notify_all()
+        return wait_time
+
+    def report_error(self):
+        """
+        回報一次暫時性錯誤
+        :return: 建議重試前等待的秒數
+        """
+        if self.limiter:
+            return self.limiter.on_error()
+        return self.ERROR_WAIT
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_INTERACTIVE, cancellation_check=None):
+        """
+        以 with 語法取得請求許可
+        :return: 產生 True（取得許可）或 False（被取消）
+        """
+        acquired = self.acquire(priority, cancellation_check)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release()
+
+    def snapshot(self):
+        """
+        取得排程器目前狀態（供監控顯示）
+        :return: dict {in_flight, limit, interval, paused, waiting, dispatched, limiter}
+        """
+        with self._cond:
+            waiting = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _, active in self._waiting:
+                if active:
+                    name = PRIORITY_NAMES.get(priority, str(priority))
+                    waiting[name] = waiting.get(name, 0) + 1
+            return {
+                'in_flight': self._in_flight,
+                'limit': self.max_concurrent,
+                'interval': self.min_interval,
+                'paused': max(0.0, round(self._blocked_until - time.monotonic(), 1)),
+                'waiting': waiting,
+                'dispatched': dict(self._dispatched),
+                'limiter': self.limiter.snapshot() if self.limiter else None,
+            }
@@ -0,0 +1,86 @@
+"""
+GUI 工作階段模組
+將最近的查詢結果（價格序列）與輸入設定存到本地 JSON 檔案，下次啟動時直接由磁碟顯示，
+只在背景重新查詢取得時尚未結算或剛結算的最近幾天，不必為相同的查詢重新下載整個區間
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from src.gaps import is_settled
+from src.utils import atomic_write
+
+
+DEFAULT_SESSION_FILE = "gui_session.json"
+SESSION_VERSION = 1
+# 結算後一天內 API 仍以 5 分鐘取樣回傳最近資料，最接近 UTC 16:00 的取樣點可能再變動
+SETTLEMENT_GRACE = 24 * 3600
+
+
+def save_session(settings, results, store, current=None, path=DEFAULT_SESSION_FILE):
+    """
+    儲存工作階段（原子寫入）
+    :param settings: 輸入設定 dict（幣種選項、日期、計價貨幣、已勾選幣種）
+    :param results: 結果集 [{'key', 'from_date', 'to_date', 'fetched_at'}, ...]（fetched_at 為取得時間，epoch 秒）
+    :param store: PriceStore（各結果的價格由此取出）
+    :param current: 目前顯示的結果 (key, from_date, to_date)，可選
+    :param path: 檔案路徑
+    """
+    data = {
+        'version': SESSION_VERSION,
+        'saved_at': time.time(),
+        'settings': settings or {},
+        'current': list(current) if current else None,
+        'results': [
+            dict(entry, prices=[[p['date'], p['price']]
+                                for p in store.to_list(entry['key'], entry['from_date'], entry['to_date'])])
+            for entry in results
+        ],
+    }
+    atomic_write(path, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+
+def load_session(path=DEFAULT_SESSION_FILE):
+    """
+    讀取工作階段
+    :param path: 檔案路徑
+    :return: dict {settings, current, results}，results 的 prices 為 [{date, price}, ...]；
+             檔案不存在、損毀或版本不符時回傳 None
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != SESSION_VERSION:
+            return None
+        results = [{
+            'key': str(entry['key']),
+            'from_date': str(entry['from_date']),
+            'to_date': str(entry['to_date']),
+            'fetched_at': float(entry['fetched_at']),
+            'prices': [{'date': str(d), 'price': p} for d, p in entry['prices']],
+        } for entry in data.get('results', [])]
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+    current = tuple(data['current']) if data.get('current') else None
+    return {'settings': data.get('settings') or {}, 'current': current, 'results': results}
+
+
+def unsettled_window(entry, now=None, grace=SETTLEMENT_GRACE):
+    """
+    需要重新驗證的日期區間：取得時尚未結算或結算未滿 grace 秒的日期，到結果的結束日期為止
+    :param entry: 工作階段的結果 {from_date, to_date, fetched_at, prices}
+    :param now: 目前時間（UTC，預設為現在），目前仍未結算的日期不必重新查詢
+    :param grace: 結算後仍視為可能變動的秒數
+    :return: (from_date, to_date) 或 None（全部已結算）
+    """
+    now = now or datetime.now(timezone.utc)
+    fetched = datetime.fromtimestamp(entry['fetched_at'] - grace, tz=timezone.utc)
+    dates = [p['date'] for p in entry['prices'] if not is_settled(p['date'], fetched)]
+    if not dates or not is_settled(min(dates), now):
+        return None
+    return min(dates), entry['to_date']
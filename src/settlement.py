@@ -0,0 +1,125 @@
+"""
+每日結算規則模組
+每日價格取「結算時刻」起的第一個取樣點（即最接近且不早於結算時刻的取樣點），
+結算時刻由規則決定：CoinGecko 預設為前一天 UTC 16:00（台北時間當日 00:00），
+另有 UTC 00:00 收盤、台北時間午夜收盤等。
+同一份 market_chart 回應可在單次掃描中同時依多個規則分組，各規則不需另外下載
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+
+
+DAY_MS = 24 * 3600 * 1000
+TAIPEI = timezone(timedelta(hours=8), 'Asia/Taipei')
+
+
+class SettlementPolicy:
+    """每日結算規則：日期 D 的結算時刻為 tz 時區中第 D + day_offset 天的 hour 點"""
+
+    def __init__(self, name, hour=16, day_offset=-1, tz=timezone.utc, description=None):
+        """
+        初始化
+        :param name: 規則名稱（用於參數與輸出檔名）
+        :param hour: 結算時刻（tz 時區的整點）
+        :param day_offset: 結算時刻相對於日期的天數（-1 表示前一天，1 表示隔天，即該日收盤）
+        :param tz: 時區（tzinfo；固定時差時以整數運算分組，速度最快）
+        :param description: 說明文字
+        """
+        self.name = name
+        self.hour = hour
+        self.day_offset = day_offset
+        self.tz = tz
+        self.description = description or name
+        offset = tz.utcoffset(None)
+        # 固定時差：取樣時間加上位移後整除一天即為日期序號
+        self._shift_ms = None if offset is None else (
+            int(offset.total_seconds() * 1000) - hour * 3600 * 1000 - day_offset * DAY_MS)
+
+    def __repr__(self):
+        return f"SettlementPolicy({self.name!r})"
+
+    def settlement_time(self, date_str):
+        """
+        日期的結算時刻
+        :param date_str: 日期字串 YYYY-MM-DD
+        :return: datetime（UTC）
+        """
+        day = datetime.strptime(date_str, "%Y-%m-%d").date() + timedelta(days=self.day_offset)
+        return datetime.combine(day, time(self.hour), tzinfo=self.tz).astimezone(timezone.utc)
+
+    def settlement_ms(self, date_str):
+        """日期的結算時刻（UNIX timestamp 毫秒）"""
+        return int(self.settlement_time(date_str).timestamp() * 1000)
+
+    def day_number(self, timestamp_ms):
+        """
+        取樣時間所屬日期的序號（date.toordinal()）
+        :param timestamp_ms: UNIX timestamp（毫秒）
+        :return: int
+        """
+        if self._shift_ms is not None:
+            return (timestamp_ms + self._shift_ms) // DAY_MS + _EPOCH_ORDINAL
+        local = datetime.fromtimestamp(timestamp_ms / 1000, tz=self.tz) - timedelta(hours=self.hour)
+        return local.date().toordinal() - self.day_offset
+
+    def settlement_date(self, timestamp_ms):
+        """取樣時間所屬的結算日期（YYYY-MM-DD）"""
+        return date.fromordinal(self.day_number(timestamp_ms)).isoformat()
+
+    def is_settled(self, date_str, now):
+        """
+        某日的結算時刻是否已過（價格應已存在）
+        :param date_str: 日期字串
+        :param now: 目前時間（aware datetime）
+        """
+        return self.settlement_time(date_str) <= now
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+POLICY_UTC16 = SettlementPolicy('utc16', 16, -1, timezone.utc,
+                                "前一天 UTC 16:00（CoinGecko 預設，等同台北時間當日 00:00）")
+POLICY_UTC_CLOSE = SettlementPolicy('utc-close', 0, 1, timezone.utc, "當日 UTC 收盤（隔天 UTC 00:00）")
+POLICY_TAIPEI_CLOSE = SettlementPolicy('taipei-close', 0, 1, TAIPEI, "當日台北時間收盤（隔天台北時間 00:00）")
+
+POLICIES = {policy.name: policy for policy in (POLICY_UTC16, POLICY_UTC_CLOSE, POLICY_TAIPEI_CLOSE)}
+DEFAULT_POLICY = POLICY_UTC16
+
+
+def get_policy(policy):
+    """
+    取得結算規則
+    :param policy: 規則名稱、SettlementPolicy 或 None（預設規則）
+    :return: SettlementPolicy
+    :raises ValueError: 不支援的規則名稱
+    """
+    if policy is None:
+        return DEFAULT_POLICY
+    if isinstance(policy, SettlementPolicy):
+        return policy
+    if policy not in POLICIES:
+        raise ValueError(f"不支援的結算規則：{policy}（可用：{', '.join(POLICIES)}）")
+    return POLICIES[policy]
+
+
+def select_samples(prices_array, policies):
+    """
+    單次掃描取樣點，同時依多個結算規則選出每日的結算取樣點（各日取最早的取樣點，輸入不必排序）
+    :param prices_array: [[timestamp_ms, price], ...]
+    :param policies: SettlementPolicy 列表
+    :return: dict {policy.name: {date: (timestamp_ms, price)}}，日期依時間排序
+    """
+    day_numbers = [policy.day_number for policy in policies]
+    selected = [{} for _ in policies]
+    for timestamp_ms, price in prices_array:
+        for day_number, chosen in zip(day_numbers, selected):
+            day = day_number(timestamp_ms)
+            current = chosen.get(day)
+            if current is None or timestamp_ms < current[0]:
+                chosen[day] = (timestamp_ms, price)
+
+    return {
+        policy.name: {date.fromordinal(day).isoformat(): chosen[day] for day in sorted(chosen)}
+        for policy, chosen in zip(policies, selected)
+    }
+
@@ -0,0 +1,319 @@
+"""
+本地價格儲存模組
+以幣種為單位保存每日價格，並預先計算前綴和、稀疏表與週/月/年彙總，
+讓任意日期區間的平均、最高、最低價都能在 O(log n) 內取得
+"""
+
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+
+# 支援的彙總週期
+ROLLUP_PERIODS = ('weekly', 'monthly', 'yearly')
+
+
+def _period_key(date_str, period):
+    """
+    取得日期所屬的彙總週期鍵值
+    :param date_str: 日期字串，格式：YYYY-MM-DD
+    :param period: weekly / monthly / yearly
+    :return: 週期鍵值（如 2025-W07、2025-02、2025）
+    """
+    if period == 'monthly':
+        return date_str[:7]
+    if period == 'yearly':
+        return date_str[:4]
+    iso_year, iso_week, _ = datetime.strptime(date_str, "%Y-%m-%d").isocalendar()
+    return f"{iso_year}-W{iso_week:02d}"
+
+
+class PriceSeries:
+    """單一幣種的每日價格序列（含預先計算的索引）"""
+
+    def __init__(self):
+        self.dates = []   # 已排序的日期字串
+        self.prices = []  # 對應價格，None 表示無資料
+        self._prefix_sum = [0.0]
+        self._prefix_count = [0]
+        self._min_table = []
+        self._max_table = []
+        self._rollups = {}
+
+    def merge(self, prices, replace=False):
+        """
+        合併價格資料（同日期以新資料為準）；索引只從第一個變動的日期起更新，
+        新增最近幾天的價格時不需重建整個序列
+        :param prices: 價格資料列表 [{'date': ..., 'price': ...}, ...]
+        :param replace: 是否以 None 覆蓋既有價格（False 時 None 不會蓋掉已儲存的價格）
+        :return: 合併後 prices 涵蓋區間的價格資料列表（與之後的統計一致）
+        """
+        updates = {}
+        for item in prices:
+            if replace or item['price'] is not None or item['date'] not in updates:
+                updates[item['date']] = item['price']
+        if not updates:
+            return []
+
+        changed = None  # 第一個變動的索引
+        added = []
+        for date_str, price in sorted(updates.items()):
+            index = bisect_left(self.dates, date_str)
+            if index < len(self.dates) and self.dates[index] == date_str:
+                if (price is None and not replace) or self.prices[index] == price:
+                    continue
+                self.prices[index] = price
+                changed = index if changed is None else min(changed, index)
+            else:
+                added.append((date_str, price))
+
+        if added:
+            start = bisect_left(self.dates, added[0][0])
+            tail = sorted(list(zip(self.dates[start:], self.prices[start:])) + added)
+            self.dates[start:] = [date_str for date_str, _ in tail]
+            self.prices[start:] = [price for _, price in tail]
+            changed = start if changed is None else min(changed, start)
+
+        if changed is not None:
+            self._reindex(changed)
+        return self.to_list(min(updates), max(updates))
+
+    def _reindex(self, lo):
+        """更新索引 lo 之後受影響的前綴和、稀疏表與週期彙總（之前的部分不變）"""
+        del self._prefix_sum[lo + 1:]
+        del self._prefix_count[lo + 1:]
+        total, count = self._prefix_sum[-1], self._prefix_count[-1]
+        for price in self.prices[lo:]:
+            if price is not None:
+                total += price
+                count += 1
+            self._prefix_sum.append(total)
+            self._prefix_count.append(count)
+
+        # 稀疏表：第 k 層記錄長度 2^k 區間的最小/最大值，無資料以 ±inf 代替；
+        # 只有涵蓋 lo 之後的區間需要重算
+        n = len(self.prices)
+        inf = float('inf')
+        for table, pick, missing in ((self._min_table, min, inf), (self._max_table, max, -inf)):
+            if not table:
+                table.append([])
+            del table[0][lo:]
+            table[0].extend(p if p is not None else missing for p in self.prices[lo:])
+            level, span = 1, 1
+            while span * 2 <= n:
+                if level == len(table):
+                    table.append([])
+                previous, current = table[level - 1], table[level]
+                start = max(0, lo - 2 * span + 1)
+                del current[start:]
+                current.extend(pick(previous[i], previous[i + span]) for i in range(start, n - 2 * span + 1))
+                level += 1
+                span *= 2
+
+        # 週期彙總：重建 lo 所屬週期起的彙總（週期鍵值依時間遞增）
+        for period in ROLLUP_PERIODS:
+            rollup = self._rollups.setdefault(period, {})
+            key = _period_key(self.dates[lo], period)
+            for stale in [k for k in reversed(rollup) if k >= key]:
+                del rollup[stale]
+            start = lo
+            while start > 0 and _period_key(self.dates[start - 1], period) == key:
+                start -= 1
+            rollup.update(self._build_rollup(period, start))
+
+    def _build_rollup(self, period, start=0):
+        """
+        建立指定週期的彙總（mean/min/max/last）
+        :param period: weekly / monthly / yearly
+        :param start: 起始索引（須為週期的第一天）
+        :return: dict {period_key: {...}}，依時間排序
+        """
+        rollup = {}
+        for date_str, price in zip(self.dates[start:], self.prices[start:]):
+            key = _period_key(date_str, period)
+            bucket = rollup.get(key)
+            if bucket is None:
+                bucket = rollup[key] = {
+                    'period': key, 'from_date': date_str, 'to_date': date_str,
+                    'sum': 0.0, 'count': 0, 'min': None, 'max': None, 'last': None
+                }
+            bucket['to_date'] = date_str
+            if price is None:
+                continue
+            bucket['sum'] += price
+            bucket['count'] += 1
+            bucket['min'] = price if bucket['min'] is None else min(bucket['min'], price)
+            bucket['max'] = price if bucket['max'] is None else max(bucket['max'], price)
+            bucket['last'] = price
+
+        for bucket in rollup.values():
+            total = bucket.pop('sum')
+            bucket['mean'] = round(total / bucket['count'], 8) if bucket['count'] else None
+        return rollup
+
+    def _index_range(self, from_date=None, to_date=None):
+        """將日期區間轉換為索引區間 [lo, hi)"""
+        lo = bisect_left(self.dates, from_date) if from_date else 0
+        hi = bisect_right(self.dates, to_date) if to_date else len(self.dates)
+        return lo, hi
+
+    def range_statistics(self, from_date=None, to_date=None):
+        """
+        計算日期區間的統計資訊（格式與 calculate_statistics 相同）
+        :param from_date: 開始日期（可選，預設為最早日期）
+        :param to_date: 結束日期（可選，預設為最晚日期）
+        :return: dict {avg, max, min, valid_count, total_count}
+        """
+        lo, hi = self._index_range(from_date, to_date)
+        total_count = max(hi - lo, 0)
+        valid_count = self._prefix_count[hi] - self._prefix_count[lo] if total_count else 0
+
+        if not valid_count:
+            return {
+                'avg': None,
+                'max': None,
+                'min': None,
+                'valid_count': 0,
+                'total_count': total_count
+            }
+
+        level = (hi - lo).bit_length() - 1
+        span = 1 << level
+        total = self._prefix_sum[hi] - self._prefix_sum[lo]
+
+        return {
+            'avg': round(total / valid_count, 8),
+            'max': max(self._max_table[level][lo], self._max_table[level][hi - span]),
+            'min': min(self._min_table[level][lo], self._min_table[level][hi - span]),
+            'valid_count': valid_count,
+            'total_count': total_count
+        }
+
+    def rollup(self, period, from_date=None, to_date=None):
+        """
+        取得週期彙總
+        :param period: weekly / monthly / yearly
+        :param from_date: 開始日期（可選）
+        :param to_date: 結束日期（可選）
+        :return: 彙總列表 [{period, from_date, to_date, mean, min, max, last, count}, ...]
+        """
+        if period not in self._rollups:
+            raise ValueError(f"不支援的彙總週期：{period}（可用：{', '.join(ROLLUP_PERIODS)}）")
+
+        return [
+            dict(bucket) for bucket in self._rollups[period].values()
+            if (from_date is None or bucket['to_date'] >= from_date)
+            and (to_date is None or bucket['from_date'] <= to_date)
+        ]
+
+    def to_list(self, from_date=None, to_date=None):
+        """
+        取得價格資料列表
+        :return: [{'date': ..., 'price': ...}, ...]
+        """
+        lo, hi = self._index_range(from_date, to_date)
+        return [{'date': d, 'price': p} for d, p in zip(self.dates[lo:hi], self.prices[lo:hi])]
+
+
+class PriceStore:
+    """本地價格儲存（多幣種，執行緒安全）"""
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def update(self, coin_id, prices, replace=False):
+        """
+        寫入幣種價格資料，並更新預先計算的索引
+        :param coin_id: 幣種 ID
+        :param prices: 價格資料列表
+        :param replace: 是否以 None 覆蓋既有價格（預設保留已儲存的價格）
+        :return: 合併後 prices 涵蓋區間的價格資料列表（顯示與匯出應使用此結果，才會與區間統計一致）
+        """
+        with self._lock:
+            series = self._series.get(coin_id)
+            if series is None:
+                series = self._series[coin_id] = PriceSeries()
+            return series.merge(prices, replace)
+
+    def get(self, coin_id):
+        """
+        取得幣種的價格序列
+        :param coin_id: 幣種 ID
+        :return: PriceSeries 或 None
+        """
+        with self._lock:
+            return self._series.get(coin_id)
+
+    def to_list(self, coin_id, from_date=None, to_date=None):
+        """
+        取得幣種在日期區間的價格資料列表
+        :param coin_id: 幣種 ID
+        :param from_date: 開始日期（可選）
+        :param to_date: 結束日期（可選）
+        :return: [{'date': ..., 'price': ...}, ...]
+        """
+        with self._lock:
+            series = self._series.get(coin_id)
+            return series.to_list(from_date, to_date) if series is not None else []
+
+    def coins(self):
+        """取得已儲存的幣種 ID 列表"""
+        with self._lock:
+            return sorted(self._series)
+
+    def range_statistics(self, coin_id, from_date=None, to_date=None):
+        """
+        計算幣種在日期區間的統計資訊
+        :param coin_id: 幣種 ID
+        :param from_date: 開始日期（可選）
+        :param to_date: 結束日期（可選）
+        :return: dict {avg, max, min, valid_count, total_count}
+        """
+        with self._lock:
+            series = self._series.get(coin_id)
+            if series is None:
+                return {'avg': None, 'max': None, 'min': None, 'valid_count': 0, 'total_count': 0}
+            return series.range_statistics(from_date, to_date)
+
+    def rollup(self, coin_id, period, from_date=None, to_date=None):
+        """
+        取得幣種的週期彙總
+        :param coin_id: 幣種 ID
+        :param period: weekly / monthly / yearly
+        :return: 彙總列表
+        """
+        with self._lock:
+            series = self._series.get(coin_id)
+            if series is None:
+                return []
+            return series.rollup(period, from_date, to_date)
+
+    def clear(self):
+        """清空所有資料"""
+        with self._lock:
+            self._series = {}
+
+    def save(self, path):
+        """
+        將原始每日價格寫入 JSON 檔案（索引於載入時重建）
+        :param path: 檔案路徑
+        """
+        with self._lock:
+            data = {
+                coin_id: [[d, p] for d, p in zip(series.dates, series.prices)]
+                for coin_id, series in self._series.items()
+            }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def load(self, path):
+        """
+        從 JSON 檔案載入價格資料
+        :param path: 檔案路徑
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for coin_id, rows in data.items():
+            self.update(coin_id, [{'date': d, 'price': p} for d, p in rows])
@@ -0,0 +1,187 @@
+"""
+自適應流量控制模組
+依據 429、回應時間與 Retry-After 動態調整併發上限與請求間隔（AIMD）：
+連續成功時線性放寬，遇到 429 時倍數收緊，延遲明顯上升時提前小幅收緊
+"""
+
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(value):
+    """
+    解析 Retry-After 標頭
+    :param value: 標頭值（秒數或 HTTP 日期）
+    :return: 等待秒數，無法解析時回傳 None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_dt.tzinfo is None:
+        retry_dt = retry_dt.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_dt - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveLimiter:
+    """AIMD 併發/速率控制器（執行緒安全）"""
+
+    def __init__(self, initial_limit=2, min_limit=1, max_limit=8,
+                 initial_interval=0.5, min_interval=0.1, max_interval=10.0,
+                 decrease_factor=0.5, latency_tolerance=2.0, window=20):
+        """
+        初始化
+        :param initial_limit: 初始併發上限
+        :param min_limit: 併發上限下限
+        :param max_limit: 併發上限上限
+        :param initial_interval: 初始請求間隔（秒）
+        :param min_interval: 請求間隔下限（秒）
+        :param max_interval: 請求間隔上限（秒）
+        :param decrease_factor: 遇到 429 時的倍數收緊係數
+        :param latency_tolerance: 近期延遲超過基準延遲幾倍時視為壅塞
+        :param window: 近期延遲的統計樣本數
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+
+        self._lock = threading.Lock()
+        self._limit = float(initial_limit)
+        self._rate = 1.0 / initial_interval  # 每秒請求數（間隔的倒數）
+        self._latencies = deque(maxlen=window)
+        self._baseline_latency = None
+        self._throttle_backoff = 2.0
+        self._error_backoff = 1.0
+        self._throttled_count = 0
+        self._success_count = 0
+        self._since_decrease = 0
+
+    @property
+    def limit(self):
+        """目前的併發上限"""
+        with self._lock:
+            return int(self._limit)
+
+    @property
+    def interval(self):
+        """目前的請求間隔（秒）"""
+        with self._lock:
+            return 1.0 / self._rate
+
+    def on_success(self, latency):
+        """
+        回報一次成功的請求
+        :param latency: 回應時間（秒）
+        """
+        with self._lock:
+            self._success_count += 1
+            self._throttle_backoff = 2.0
+            self._error_backoff = 1.0
+            self._latencies.append(latency)
+
+            # 以中位數衡量近期延遲，避免單一慢請求造成誤判
+            recent = sorted(self._latencies)[len(self._latencies) // 2]
+
+            # 基準延遲取歷史最小值，並依近期中位數緩慢上調以適應網路環境變化
+            if self._baseline_latency is None or latency < self._baseline_latency:
+                self._baseline_latency = latency
+            elif recent > self._baseline_latency:
+                self._baseline_latency += (recent - self._baseline_latency) * 0.01
+            self._since_decrease += 1
+            if len(self._latencies) >= 5 and recent > self._baseline_latency * self.latency_tolerance:
+                # 延遲梯度上升：小幅收緊（每個統計視窗最多一次），避免把伺服器推向 429
+                if self._since_decrease >= self._latencies.maxlen:
+                    self._limit = max(self.min_limit, self._limit - 1)
+                    self._rate = max(1.0 / self.max_interval, self._rate * 0.9)
+                    self._since_decrease = 0
+            else:
+                # 加法放寬：每完成約一輪（limit 次）成功請求，併發上限 +1；速率每次 +0.1 req/s
+                self._limit = min(self.max_limit, self._limit + 1.0 / max(self._limit, 1.0))
+                self._rate = min(1.0 / self.min_interval, self._rate + 0.1)
+
+    def on_throttle(self, retry_after=None):
+        """
+        回報一次 429
+        :param retry_after: Retry-After 秒數（可選）
+        :return: 建議暫停發送的秒數
+        """
+        with self._lock:
+            self._throttled_count += 1
+            self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+            self._rate = max(1.0 / self.max_interval, self._rate * self.decrease_factor)
+
+            if retry_after is not None:
+                wait_time = retry_after
+            else:
+                wait_time = self._throttle_backoff
+                self._throttle_backoff = min(60.0, self._throttle_backoff * 2)
+            return wait_time
+
+    def on_error(self):
+        """
+        回報一次暫時性錯誤（連線錯誤、逾時、5xx）
+        :return: 建議重試前等待的秒數
+        """
+        with self._lock:
+            wait_time = self._error_backoff
+            self._error_backoff = min(30.0, self._error_backoff * 2)
+            return wait_time
+
+    def snapshot(self):
+        """
+        取得控制器狀態（供監控顯示）
+        :return: dict
+        """
+        with self._lock:
+            recent = sorted(self._latencies)[len(self._latencies) // 2] if self._latencies else None
+            return {
+                'limit': int(self._limit),
+                'interval': round(1.0 / self._rate, 3),
+                'recent_latency': round(recent, 3) if recent is not None else None,
+                'baseline_latency': round(self._baseline_latency, 3) if self._baseline_latency is not None else None,
+                'successes': self._success_count,
+                'throttled': self._throttled_count,
+            }
+
+
+class LatencyTracker:
+    """近期請求延遲統計（執行緒安全），供 hedged request 計算觸發門檻"""
+
+    def __init__(self, window=200, min_samples=20):
+        """
+        初始化
+        :param window: 保留的最近樣本數
+        :param min_samples: 樣本數不足時不回傳百分位數
+        """
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def record(self, latency):
+        """記錄一次成功請求的延遲（秒）"""
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, p):
+        """
+        取得延遲百分位數
+        :param p: 百分位（0~1，如 0.95）
+        :return: 秒數；樣本不足時回傳 None
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))
+        return ordered[index]
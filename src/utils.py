@@ -3,9 +3,14 @@
 """
 
 import csv
+import io
+import os
 import sys
+import uuid
 from datetime import datetime
 
+from src.profiling import span
+
 
 def validate_date(date_str, date_name="日期"):
     """
@@ -52,7 +57,63 @@ def validate_date_range(from_date_str, to_date_str):
     return from_dt, to_dt
 
 
-def save_to_csv(prices, coin_id, from_date, to_date, output_file=None):
+def format_csv(prices, stats=None, currency='usd'):
+    """
+    將價格資料轉為 CSV 文字（每日價格加上 Average 列）
+    :param prices: 價格資料列表
+    :param stats: 已計算好的統計資訊（可選）
+    :param currency: 計價貨幣（用於欄位名稱）
+    :return: CSV 字串
+    """
+    # 計算平均價格（排除 None）
+    if stats is None:
+        stats = calculate_statistics(prices)
+    avg_price = stats['avg']
+
+    buffer = io.StringIO(newline='')
+    price_field = f'Price ({currency.upper()})'
+    fieldnames = ['Date', price_field]
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+
+    writer.writeheader()
+
+    # 寫入每日價格
+    for price_data in prices:
+        writer.writerow({
+            'Date': price_data['date'],
+            price_field: price_data['price'] if price_data['price'] is not None else 'N/A'
+        })
+
+    # 寫入平均價格
+    writer.writerow({
+        'Date': 'Average',
+        price_field: avg_price if avg_price is not None else 'N/A'
+    })
+
+    return buffer.getvalue()
+
+
+def atomic_write(path, data):
+    """
+    原子寫入檔案：先寫入同目錄的暫存檔再取代，讀取端不會看到寫到一半的內容
+    :param path: 目標檔案路徑
+    :param data: bytes
+    """
+    directory, filename = os.path.split(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{filename}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp_path, 'xb') as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_to_csv(prices, coin_id, from_date, to_date, output_file=None, stats=None, currency='usd'):
     """
     將價格資料儲存為 CSV 檔案
     :param prices: 價格資料列表
@@ -60,47 +121,67 @@ def save_to_csv(prices, coin_id, from_date, to_date, output_file=None):
     :param from_date: 開始日期
     :param to_date: 結束日期
     :param output_file: 輸出檔案名稱（可選）
+    :param stats: 已計算好的統計資訊（可選，例如 PriceStore.range_statistics 的結果，避免重新掃描）
+    :param currency: 計價貨幣
     :return: 輸出檔案路徑
     :raises Exception: 儲存失敗
     """
     if not prices:
         raise ValueError("沒有價格資料可以輸出")
 
-    # 計算平均價格（排除 None）
-    valid_prices = [p['price'] for p in prices if p['price'] is not None]
-    if valid_prices:
-        avg_price = round(sum(valid_prices) / len(valid_prices), 8)
-    else:
-        avg_price = None
-
     # 如果沒有指定輸出檔案名稱，自動產生
     if output_file is None:
         output_file = f"{coin_id}_{from_date}_{to_date}_prices.csv"
 
     try:
-        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['Date', 'Price (USD)']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        with span('csv_write', file=output_file, rows=len(prices)):
+            atomic_write(output_file, format_csv(prices, stats, currency).encode('utf-8'))
+        return output_file
 
-            writer.writeheader()
+    except Exception as e:
+        raise Exception(f"儲存 CSV 檔案時發生錯誤：{e}")
 
-            # 寫入每日價格
-            for price_data in prices:
-                writer.writerow({
-                    'Date': price_data['date'],
-                    'Price (USD)': price_data['price'] if price_data['price'] is not None else 'N/A'
-                })
 
-            # 寫入平均價格
-            writer.writerow({
-                'Date': 'Average',
-                'Price (USD)': avg_price if avg_price is not None else 'N/A'
-            })
+def is_price_csv(path):
+    """
+    是否為 save_to_csv 輸出的價格 CSV（標題列為 Date, Price (貨幣)）
+    :param path: CSV 檔案路徑
+    :return: bool（無法讀取時為 False）
+    """
+    try:
+        with open(path, 'r', newline='', encoding='utf-8') as csvfile:
+            header = next(csv.reader(csvfile), [])
+    except (OSError, UnicodeDecodeError, csv.Error):
+        return False
+    return len(header) == 2 and header[0] == 'Date' and header[1].startswith('Price (')
 
-        return output_file
 
+def load_from_csv(input_file):
+    """
+    讀取 save_to_csv 輸出的 CSV 檔案（任一計價貨幣）
+    :param input_file: CSV 檔案路徑
+    :return: 價格資料列表（不含 Average 列，N/A 讀為 None）
+    :raises Exception: 讀取失敗
+    """
+    prices = []
+    try:
+        with open(input_file, 'r', newline='', encoding='utf-8') as csvfile:
+            reader = csv.DictReader(csvfile)
+            price_field = next((name for name in reader.fieldnames or [] if name.startswith('Price')), 'Price (USD)')
+            for row in reader:
+                date_str = (row.get('Date') or '').strip()
+                try:
+                    datetime.strptime(date_str, "%Y-%m-%d")
+                except ValueError:
+                    continue  # Average 等非日期列
+                value = (row.get(price_field) or '').strip()
+                prices.append({
+                    'date': date_str,
+                    'price': float(value) if value and value != 'N/A' else None
+                })
     except Exception as e:
-        raise Exception(f"儲存 CSV 檔案時發生錯誤：{e}")
+        raise Exception(f"讀取 CSV 檔案時發生錯誤：{e}")
+    return prices
 
 
 def calculate_statistics(prices):
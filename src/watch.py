@@ -0,0 +1,87 @@
+"""
+即時監看模組
+定期以 simple/price 批次查詢監看清單的目前價格，只回報有變動的幣種；
+輪詢之間沿用同一 fetcher（同一連線、排程器與流量控制狀態）
+"""
+
+import time
+
+from src.cancel import ensure_token
+from src.scheduler import PRIORITY_INTERACTIVE
+
+
+class PriceWatcher:
+    """監看清單輪詢器"""
+
+    def __init__(self, fetcher, coin_ids, interval=30.0, vs_currency='usd', priority=PRIORITY_INTERACTIVE):
+        """
+        初始化
+        :param fetcher: CoinGeckoPriceFetcher
+        :param coin_ids: 監看的幣種 ID 列表
+        :param interval: 輪詢間隔（秒）
+        :param vs_currency: 計價貨幣
+        :param priority: 請求優先等級
+        """
+        if interval <= 0:
+            raise ValueError("輪詢間隔必須大於 0 秒")
+        self.fetcher = fetcher
+        self.coin_ids = list(dict.fromkeys(coin_ids))
+        self.interval = interval
+        self.vs_currency = vs_currency
+        self.priority = priority
+        self.latest = {}  # coin_id -> {'price', 'updated_at'}
+        self.polls = 0
+
+    def poll(self, cancellation_check=None):
+        """
+        查詢一次並與上次結果比較
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :return: 有變動的幣種 [{coin_id, price, previous, change_pct, updated_at}, ...]
+                 （第一次輪詢回傳所有取得的幣種，previous 為 None）
+        """
+        quotes = self.fetcher.get_current_prices(
+            self.coin_ids,
+            vs_currency=self.vs_currency,
+            cancellation_check=cancellation_check,
+            priority=self.priority
+        )
+        self.polls += 1
+
+        changes = []
+        for coin_id in self.coin_ids:
+            quote = quotes.get(coin_id)
+            if quote is None:
+                continue
+            previous = self.latest.get(coin_id)
+            if previous is not None and previous['price'] == quote['price']:
+                continue
+
+            old_price = previous['price'] if previous else None
+            changes.append({
+                'coin_id': coin_id,
+                'price': quote['price'],
+                'previous': old_price,
+                'change_pct': (quote['price'] - old_price) / old_price * 100 if old_price else None,
+                'updated_at': quote['updated_at'],
+            })
+            self.latest[coin_id] = quote
+        return changes
+
+    def run(self, on_changes, cancellation_check=None, max_polls=None):
+        """
+        持續輪詢直到取消（輪詢之間以事件等待，取消時立即結束）
+        :param on_changes: 每次輪詢後的回調 callback(changes)，只在有變動時呼叫
+        :param cancellation_check: CancellationToken 或取消檢查函數
+        :param max_polls: 最多輪詢次數（None 表示不限）
+        """
+        token = ensure_token(cancellation_check)
+        while not token.cancelled:
+            started = time.monotonic()
+            changes = self.poll(token)
+            if changes and not token.cancelled:
+                on_changes(changes)
+            if max_polls is not None and self.polls >= max_polls:
+                return
+            # 以固定節奏輪詢：扣除本次查詢耗時
+            if token.wait(max(0.0, self.interval - (time.monotonic() - started))):
+                return
@@ -0,0 +1,104 @@
+"""K 線聚合與原生 OHLC 解析"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from src.bars import GRANULARITY_4H, GRANULARITY_DAILY, GRANULARITY_HOURLY, GRANULARITY_RAW, CandleSeries, \
+    aggregate_bars, bars_in_range, format_bars_csv, granularity_name, parse_ohlc
+
+
+def _ms(text):
+    return int(datetime.strptime(text, "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+PRICES = [
+    [_ms('2024-01-01 10:00'), 5.0],
+    [_ms('2024-01-01 10:20'), 7.0],
+    [_ms('2024-01-01 10:40'), 4.0],
+    [_ms('2024-01-01 10:59'), 6.0],
+    [_ms('2024-01-01 11:00'), 8.0],  # 整點屬於新的時間桶
+    [_ms('2024-01-01 11:30'), None],
+    [_ms('2024-01-01 15:59'), 9.0],
+    [_ms('2024-01-01 16:00'), 3.0],  # 日 K 的分界（UTC 16:00）
+]
+VOLUMES = [[_ms('2024-01-01 10:00'), 100.0], [_ms('2024-01-01 10:40'), 140.0], [_ms('2024-01-01 11:00'), 150.0]]
+
+
+def test_hourly_bucket_boundaries_and_ohlc():
+    bars = list(aggregate_bars(PRICES, VOLUMES, GRANULARITY_HOURLY))
+    assert [b['time'] for b in bars] == ['2024-01-01 10:00', '2024-01-01 11:00', '2024-01-01 15:00',
+                                         '2024-01-01 16:00']
+    first = bars[0]
+    assert (first['open'], first['high'], first['low'], first['close']) == (5.0, 7.0, 4.0, 6.0)
+    # 成交量為時間桶內最後一個有成交量的取樣點；沒有取樣成交量時為 None
+    assert first['volume'] == 140.0 and first['samples'] == 4
+    assert bars[1]['volume'] == 150.0 and bars[1]['samples'] == 1  # None 價格不計入
+    assert bars[2]['volume'] is None
+    assert first['timestamp'] == _ms('2024-01-01 10:00')
+
+
+def test_4h_and_daily_boundaries():
+    bars = list(aggregate_bars(PRICES, granularity=GRANULARITY_4H))
+    assert [(b['time'], b['open'], b['close']) for b in bars] == [
+        ('2024-01-01 08:00', 5.0, 8.0), ('2024-01-01 12:00', 9.0, 9.0), ('2024-01-01 16:00', 3.0, 3.0)]
+    daily = list(aggregate_bars(PRICES, granularity=GRANULARITY_DAILY))
+    assert [(b['time'], b['high'], b['low'], b['close']) for b in daily] == [
+        ('2024-01-01', 9.0, 4.0, 9.0), ('2024-01-02', 3.0, 3.0, 3.0)]
+
+
+def test_raw_keeps_every_sample():
+    bars = list(aggregate_bars(PRICES, granularity=GRANULARITY_RAW))
+    assert len(bars) == 7
+    assert bars[0]['time'] == '2024-01-01 10:00:00' and bars[0]['samples'] == 1
+
+
+def test_unknown_granularity():
+    with pytest.raises(ValueError):
+        list(aggregate_bars(PRICES, granularity='weekly'))
+
+
+def test_bars_in_range_uses_label_date():
+    daily = list(aggregate_bars(PRICES, granularity=GRANULARITY_DAILY))
+    assert [b['time'] for b in bars_in_range(daily, '2024-01-01', '2024-01-01')] == ['2024-01-01']
+    hourly = list(aggregate_bars(PRICES, granularity=GRANULARITY_HOURLY))
+    assert len(bars_in_range(hourly, '2024-01-01', '2024-01-01')) == 4
+    assert bars_in_range(hourly, '2024-01-02', '2024-01-03') == []
+
+
+def test_parse_ohlc_converts_close_time_to_start():
+    rows = [[_ms('2024-01-01 08:00'), '1', 2, 0.5, 1.5], [_ms('2024-01-01 04:00'), 1, 1, 1, 1]]
+    bars, size = parse_ohlc(rows)
+    assert size == 4 * 3600 * 1000 and granularity_name(size) == '4h'
+    assert [(b['time'], b['open'], b['close']) for b in bars] == [('2024-01-01 00:00', 1.0, 1.0),
+                                                                  ('2024-01-01 04:00', 1.0, 1.5)]
+    assert bars[0]['volume'] is None and bars[0]['samples'] is None
+    daily, size = parse_ohlc([[_ms('2024-01-02 00:00'), 1, 1, 1, 1], [_ms('2024-01-06 00:00'), 2, 2, 2, 2]])
+    assert granularity_name(size) == '4d' and daily[0]['time'] == '2023-12-29'
+    assert parse_ohlc([]) == ([], None)
+
+
+@pytest.mark.parametrize('row', [
+    [1704067200000, 1, 2, 3],
+    {'time': 1704067200000},
+    None,
+    [1704067200000, 'abc', 2, 3, 4],
+    [1704067200000, None, 2, 3, 4],
+    ['soon', 1, 2, 3, 4],
+])
+def test_parse_ohlc_rejects_malformed_rows(row):
+    with pytest.raises(ValueError):
+        parse_ohlc([[1704067200000, 1, 1, 1, 1], row])
+
+
+def test_candle_series_statistics_and_csv():
+    bars, _ = parse_ohlc([[_ms('2024-01-01 04:00'), 10, 12, 9, 11], [_ms('2024-01-01 08:00'), 11, 15, 8, 14]])
+    series = CandleSeries(bars, '4h', 'eur')
+    assert len(series) == 2
+    assert series.statistics() == {'open': 10.0, 'close': 14.0, 'high': 15.0, 'low': 8.0, 'change_pct': 40.0,
+                                   'avg_close': 12.5, 'count': 2}
+    assert CandleSeries([], 'daily').statistics()['count'] == 0
+    # 原生 K 線沒有成交量與取樣數欄位
+    assert series.to_csv().splitlines()[0] == 'Time (UTC),Open (EUR),High (EUR),Low (EUR),Close (EUR)'
+    aggregated = list(aggregate_bars(PRICES, VOLUMES, GRANULARITY_HOURLY))
+    assert format_bars_csv(aggregated).splitlines()[3].endswith(',N/A,1')
@@ -0,0 +1,40 @@
+"""取消權杖與子權杖"""
+
+from src.cancel import REASON_TIMEOUT, CancellationToken, scoped_token
+
+
+def test_parent_cancel_propagates_to_child():
+    parent = CancellationToken()
+    child = parent.child()
+    parent.cancel()
+    assert child.cancelled
+
+
+def test_closed_child_is_detached_from_parent():
+    parent = CancellationToken()
+    with parent.child(timeout=60) as child:
+        assert len(parent._callbacks) == 1
+    assert parent._callbacks == []
+    parent.cancel()
+    assert not child.cancelled
+
+
+def test_scoped_token_without_timeout_reuses_token():
+    parent = CancellationToken()
+    with scoped_token(parent) as token:
+        assert token is parent
+    assert parent._callbacks == []
+
+
+def test_scoped_token_with_timeout_detaches_on_exit():
+    parent = CancellationToken()
+    for _ in range(100):
+        with scoped_token(parent, timeout=60) as token:
+            assert token is not parent
+    assert parent._callbacks == []
+
+
+def test_child_deadline_expires():
+    with scoped_token(None, timeout=0) as token:
+        assert token.wait(1)
+        assert token.reason == REASON_TIMEOUT
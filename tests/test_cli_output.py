@@ -0,0 +1,27 @@
+"""CLI 輸出的小數位數處理"""
+
+import json
+
+from crypto_price_tool import price_statistics, round_prices, write_record
+
+
+PRICES = [{'date': '2026-09-01', 'price': 0.0531}, {'date': '2026-09-02', 'price': None}]
+
+
+def test_no_rounding_by_default():
+    assert round_prices(PRICES) is PRICES
+    assert price_statistics(PRICES)['avg'] == 0.0531
+
+
+def test_rounding_when_requested():
+    assert [p['price'] for p in round_prices(PRICES, 2)] == [0.05, None]
+    assert price_statistics(PRICES, 3)['avg'] == 0.053
+
+
+def test_write_record_applies_same_rule(capsys):
+    write_record({'ok': True, 'prices': PRICES, 'stats': price_statistics(PRICES)}, decimals=2)
+    record = json.loads(capsys.readouterr().out)
+    assert record['prices'][0]['price'] == 0.05
+    assert record['stats']['avg'] == 0.05
+    write_record({'ok': True, 'prices': PRICES})
+    assert json.loads(capsys.readouterr().out)['prices'][0]['price'] == 0.0531
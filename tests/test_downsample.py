@@ -0,0 +1,37 @@
+"""降採樣與多解析度序列"""
+
+import math
+
+from src.downsample import MultiResolutionSeries, lttb
+
+
+def _wave(n):
+    return [(i, math.sin(i / 50) + (i % 7) * 0.01) for i in range(n)]
+
+
+def test_lttb_keeps_endpoints_and_size():
+    points = _wave(1000)
+    sampled = lttb(points, 100)
+    assert len(sampled) == 100
+    assert sampled[0] == points[0] and sampled[-1] == points[-1]
+
+
+def test_incremental_extend_matches_full_build():
+    points = _wave(5000)
+    full = MultiResolutionSeries(points, min_level_size=16)
+    streamed = MultiResolutionSeries(points[:3], min_level_size=16)
+    index = 3
+    for size in [1, 2, 5, 17, 64, 250] * 30:
+        streamed.extend(points[index:index + size])
+        index += size
+    streamed.extend(points[index:])
+    assert len(streamed._levels) > 3
+    assert streamed._levels == full._levels
+    assert streamed._xs == full._xs
+
+
+def test_window_uses_coarse_level_and_target_size():
+    series = MultiResolutionSeries(_wave(20000), min_level_size=64)
+    points = series.window(0, 19999, 200)
+    assert len(points) == 200
+    assert points[0][0] == 0 and points[-1][0] == 19999
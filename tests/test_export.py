@@ -0,0 +1,80 @@
+"""匯出清單：依內容雜湊略過未變動的檔案"""
+
+import json
+import os
+
+import pytest
+
+from src.export import ExportManifest, export_result_set
+from src.storage import PriceStore
+
+
+PRICES = [{'date': '2024-01-01', 'price': 1.5}, {'date': '2024-01-02', 'price': None}]
+
+
+def test_unchanged_content_is_not_rewritten(tmp_path):
+    manifest = ExportManifest(str(tmp_path))
+    path, written = manifest.export(PRICES, 'bitcoin', '2024-01-01', '2024-01-02')
+    assert written and manifest.changed == ['bitcoin_2024-01-01_2024-01-02.csv']
+    manifest.save()
+    mtime = os.stat(path).st_mtime_ns
+    updated_at = manifest.entries()['bitcoin_2024-01-01_2024-01-02.csv']['updated_at']
+
+    again = ExportManifest(str(tmp_path))
+    assert again.export(PRICES, 'bitcoin', '2024-01-01', '2024-01-02') == (path, False)
+    assert (again.changed, again.unchanged) == ([], ['bitcoin_2024-01-01_2024-01-02.csv'])
+    assert os.stat(path).st_mtime_ns == mtime
+    assert again.entries()['bitcoin_2024-01-01_2024-01-02.csv']['updated_at'] == updated_at
+
+
+def test_changed_content_is_rewritten(tmp_path):
+    manifest = ExportManifest(str(tmp_path))
+    manifest.export(PRICES, 'bitcoin', '2024-01-01', '2024-01-02')
+    old = manifest.entries()['bitcoin_2024-01-01_2024-01-02.csv']['sha256']
+    changed = [PRICES[0], {'date': '2024-01-02', 'price': 2.5}]
+    path, written = manifest.export(changed, 'bitcoin', '2024-01-01', '2024-01-02')
+    assert written
+    assert manifest.entries()['bitcoin_2024-01-01_2024-01-02.csv']['sha256'] != old
+    assert '2.5' in open(path, encoding='utf-8').read()
+    manifest.save()
+    with open(tmp_path / 'manifest.json', encoding='utf-8') as f:
+        assert json.load(f)['files']['bitcoin_2024-01-01_2024-01-02.csv']['rows'] == 2
+
+
+def test_missing_manifest_falls_back_to_file_content(tmp_path):
+    manifest = ExportManifest(str(tmp_path))
+    manifest.export(PRICES, 'bitcoin', '2024-01-01', '2024-01-02')
+    # 未保存 manifest（如上次中途中止）或 manifest 損毀：以現有檔案內容比對
+    assert not ExportManifest(str(tmp_path)).export(PRICES, 'bitcoin', '2024-01-01', '2024-01-02')[1]
+    (tmp_path / 'manifest.json').write_text('{broken', encoding='utf-8')
+    assert not ExportManifest(str(tmp_path)).export(PRICES, 'bitcoin', '2024-01-01', '2024-01-02')[1]
+
+
+def test_failed_write_keeps_previous_file(tmp_path, monkeypatch):
+    manifest = ExportManifest(str(tmp_path))
+    path, _ = manifest.export(PRICES, 'bitcoin', '2024-01-01', '2024-01-02')
+    before = open(path, 'rb').read()
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, 'replace', fail)
+    with pytest.raises(Exception):
+        manifest.export([{'date': '2024-01-01', 'price': 9.0}], 'bitcoin', '2024-01-01', '2024-01-02')
+    assert open(path, 'rb').read() == before
+    assert sorted(os.listdir(tmp_path)) == ['bitcoin_2024-01-01_2024-01-02.csv']
+
+
+def test_export_result_set(tmp_path):
+    store = PriceStore()
+    store.update('bitcoin', PRICES)
+    store.update('ethereum@eur', [{'date': '2024-01-01', 'price': 3.0}])
+    entries = [('bitcoin', '2024-01-01', '2024-01-02'), ('ethereum@eur', '2024-01-01', '2024-01-01'),
+               ('solana', '2024-01-01', '2024-01-02')]
+    result = export_result_set(store, entries, directory=str(tmp_path))
+    assert len(result['written']) == 2 and result['skipped'] == ['solana']
+    assert 'EUR' in open(tmp_path / 'ethereum@eur_2024-01-01_2024-01-01.csv', encoding='utf-8').read()
+    again = export_result_set(store, entries, directory=str(tmp_path))
+    assert again['written'] == [] and len(again['unchanged']) == 2
+    with pytest.raises(ValueError):
+        export_result_set(store, entries, output_file=str(tmp_path / 'one.csv'))
@@ -0,0 +1,60 @@
+"""計價貨幣換算：匯率推算與序列鍵值"""
+
+import pytest
+
+from src.fx import FxCache, parse_series_key, series_key
+
+
+@pytest.mark.parametrize('coin_id, vs_currency, key', [
+    ('bitcoin', 'usd', 'bitcoin'),
+    ('bitcoin', 'EUR', 'bitcoin@eur'),
+    ('avalanche-2', 'btc', 'avalanche-2@btc'),
+])
+def test_series_key_round_trip(coin_id, vs_currency, key):
+    assert series_key(coin_id, vs_currency) == key
+    assert parse_series_key(key) == (coin_id, vs_currency.lower())
+
+
+class FakeFetcher:
+    """參考幣種（bitcoin）在各貨幣的每日結算價"""
+
+    PRICES = {
+        'usd': {'2024-01-01': 40000.0, '2024-01-02': 50000.0},
+        'eur': {'2024-01-01': 36000.0, '2024-01-02': 46000.0},
+    }
+
+    def __init__(self):
+        self.calls = []
+
+    def get_settlement_prices_api(self, coin_id, from_date, to_date, policies, vs_currency='usd', **kwargs):
+        self.calls.append((coin_id, vs_currency, from_date, to_date))
+        prices = {d: p for d, p in self.PRICES[vs_currency].items() if from_date <= d <= to_date}
+        return {policy.name: dict(prices) for policy in policies}
+
+
+def test_rate_is_quote_over_usd_price():
+    fx, fetcher = FxCache(), FakeFetcher()
+    rates = fx.rates(fetcher, 'EUR', '2024-01-01', '2024-01-02')
+    assert rates == {'2024-01-01': 0.9, '2024-01-02': 0.92}
+    # 參考幣種每種貨幣只查詢一次，之後由快取取得
+    assert sorted(call[1] for call in fetcher.calls) == ['eur', 'usd']
+    assert fx.rates(fetcher, 'eur', '2024-01-01', '2024-01-02') == rates
+    assert len(fetcher.calls) == 2
+    assert fx.rates(fetcher, 'usd', '2024-01-01', '2024-01-03') == {
+        '2024-01-01': 1.0, '2024-01-02': 1.0, '2024-01-03': 1.0}
+
+
+def test_convert_skips_days_without_rate():
+    fx = FxCache()
+    converted = fx.convert(FakeFetcher(), {'2024-01-01': 2.0, '2024-01-02': None, '2024-01-03': 5.0},
+                           'eur', '2024-01-01', '2024-01-03')
+    assert converted == {'2024-01-01': 1.8}
+
+
+def test_convert_bars_uses_settlement_date_rate():
+    fx = FxCache()
+    bars = [{'time': '2024-01-02', 'timestamp': 1704124800000, 'open': 10.0, 'high': 10.0, 'low': 10.0,
+             'close': 10.0, 'volume': None, 'samples': 1}]  # 2024-01-01 16:00 UTC 起為 01-02
+    converted = fx.convert_bars(FakeFetcher(), bars, 'eur', '2024-01-01', '2024-01-02')
+    assert converted[0]['close'] == 9.2 and converted[0]['volume'] is None
+    assert bars[0]['close'] == 10.0
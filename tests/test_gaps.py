@@ -0,0 +1,64 @@
+"""缺漏日期的區間合併與修補"""
+
+from datetime import datetime, timezone
+
+from src.gaps import find_missing_dates, group_missing_dates, repair_gaps
+
+
+def test_group_missing_dates_joins_short_gaps():
+    dates = ['2024-01-01', '2024-01-02', '2024-01-05', '2024-01-09', '2024-01-10']
+    # 01-02 與 01-05 之間只隔 2 天已知資料：合併；01-05 與 01-09 隔 3 天：分開
+    assert group_missing_dates(dates) == [('2024-01-01', '2024-01-05'), ('2024-01-09', '2024-01-10')]
+    assert group_missing_dates(dates, max_join=0) == [
+        ('2024-01-01', '2024-01-02'), ('2024-01-05', '2024-01-05'), ('2024-01-09', '2024-01-10')]
+    assert group_missing_dates(dates, max_join=3) == [('2024-01-01', '2024-01-10')]
+    assert group_missing_dates(['2024-01-03', '2024-01-03', '2024-01-01']) == [('2024-01-01', '2024-01-03')]
+    assert group_missing_dates([]) == []
+
+
+def test_find_missing_dates_skips_unsettled():
+    prices = [{'date': '2026-09-01', 'price': None}, {'date': '2026-09-02', 'price': 1.0},
+              {'date': '2026-09-03', 'price': None}]
+    now = datetime(2026, 9, 2, 0, 0, tzinfo=timezone.utc)  # 09-03 於 09-02 16:00 才結算
+    assert find_missing_dates(prices, now) == ['2026-09-01']
+
+
+class FakeFx:
+    def convert(self, fetcher, price_dict, vs_currency, from_date, to_date, **kwargs):
+        return {d: p * 2 for d, p in price_dict.items()}
+
+
+class FakeFetcher:
+    def __init__(self, prices):
+        self.prices = prices
+        self.windows = []
+        self.fx = FakeFx()
+
+    def get_range_prices_api(self, coin_id, from_date, to_date, **kwargs):
+        self.windows.append((from_date, to_date))
+        return {d: p for d, p in self.prices.items() if from_date <= d <= to_date}
+
+
+def test_repair_gaps_queries_only_missing_windows():
+    prices = [{'date': f'2024-01-{day:02d}', 'price': None if day in (2, 3, 9) else float(day)} for day in range(1, 11)]
+    fetcher = FakeFetcher({'2024-01-02': 20.0, '2024-01-03': None, '2024-01-05': 99.0, '2024-01-09': 90.0})
+    repaired, filled, windows = repair_gaps(fetcher, 'bitcoin', prices)
+    assert windows == fetcher.windows == [('2024-01-02', '2024-01-03'), ('2024-01-09', '2024-01-09')]
+    assert filled == ['2024-01-02', '2024-01-09']
+    # 已有的價格不被覆蓋，仍查不到的日期維持缺漏
+    assert [p['price'] for p in repaired] == [1.0, 20.0, None, 4.0, 5.0, 6.0, 7.0, 8.0, 90.0, 10.0]
+
+
+def test_repair_gaps_converts_currency_and_stops_when_cancelled():
+    prices = [{'date': '2024-01-01', 'price': None}, {'date': '2024-01-02', 'price': 1.0},
+              {'date': '2024-01-10', 'price': None}]
+    fetcher = FakeFetcher({'2024-01-01': 3.0, '2024-01-10': 4.0})
+    repaired, filled, _ = repair_gaps(fetcher, 'bitcoin', prices, vs_currency='eur')
+    assert [p['price'] for p in repaired] == [6.0, 1.0, 8.0]
+
+    # 第二個區間查詢前取消
+    checks = iter([False, True])
+    fetcher = FakeFetcher({'2024-01-01': 3.0, '2024-01-10': 4.0})
+    repaired, filled, windows = repair_gaps(fetcher, 'bitcoin', prices, cancellation_check=lambda: next(checks))
+    assert fetcher.windows == [('2024-01-01', '2024-01-01')]
+    assert filled == ['2024-01-01']
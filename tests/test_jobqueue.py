@@ -0,0 +1,100 @@
+"""SQLite 工作佇列：租約領取、續約、到期接手與工作行程"""
+
+import time
+
+import pytest
+
+from src.jobqueue import STATUS_FAILED, STATUS_PENDING, JobQueue, run_worker
+from src.scheduler import RequestScheduler
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / 'queue.db'), max_attempts=2)
+    queue.enqueue(['bitcoin'], '2026-01-01', '2026-01-10', window_days=5)
+    return queue
+
+
+def test_enqueue_splits_windows_and_ignores_duplicates(queue):
+    assert queue.progress()['pending'] == 2
+    assert queue.enqueue(['bitcoin', 'ethereum'], '2026-01-01', '2026-01-10', window_days=5) == 2
+
+
+def test_claim_is_exclusive(queue):
+    units = queue.claim('a', limit=5)
+    assert [(u['from_date'], u['to_date']) for u in units] == [('2026-01-01', '2026-01-05'), ('2026-01-06', '2026-01-10')]
+    assert queue.claim('b', limit=5) == []
+    assert queue.progress()['workers'] == 1
+
+
+def test_renew_only_own_leases(queue):
+    unit_ids = [u['id'] for u in queue.claim('a', limit=2)]
+    assert queue.renew('b', unit_ids) == 0
+    assert queue.renew('a', unit_ids) == 2
+
+
+def test_expired_lease_is_taken_over_and_stale_complete_rejected(queue):
+    unit = queue.claim('a', limit=1, lease_seconds=0.05)[0]
+    time.sleep(0.1)
+    taken = queue.claim('b', limit=1)[0]
+    assert taken['id'] == unit['id'] and taken['attempts'] == 2
+
+    assert queue.renew('a', [unit['id']]) == 0
+    assert not queue.complete(unit['id'], 'a', [{'date': '2026-01-01', 'price': 1.0}])
+    assert queue.fail(unit['id'], 'a', 'stale') is None
+    assert queue.complete(unit['id'], 'b', [{'date': '2026-01-01', 'price': 2.0}])
+    assert queue.results() == {('bitcoin', 'usd'): [{'date': '2026-01-01', 'price': 2.0}]}
+
+
+def test_lease_expiring_too_often_fails_unit(queue):
+    for worker in ('a', 'b'):
+        queue.claim(worker, limit=1, lease_seconds=0.01)
+        time.sleep(0.02)
+    queue.claim('c', limit=2)
+    assert [f['error'] for f in queue.failures()] == ["租約到期次數過多"]
+
+
+def test_fail_retries_until_max_attempts(queue):
+    unit = queue.claim('a', limit=1)[0]
+    assert queue.fail(unit['id'], 'a', 'boom') == STATUS_PENDING
+    unit = queue.claim('a', limit=1)[0]
+    assert queue.fail(unit['id'], 'a', 'boom') == STATUS_FAILED
+
+
+def test_fail_without_retry_and_release(queue):
+    first, second = queue.claim('a', limit=2)
+    assert queue.fail(first['id'], 'a', 'not found', retry=False) == STATUS_FAILED
+    assert queue.release('a', [second['id']]) == 1
+    assert queue.claim('b', limit=1)[0]['attempts'] == 1  # 歸還不計入嘗試次數
+
+
+class FakeFetcher:
+    """依幣種回傳固定結果的 fetcher"""
+
+    def __init__(self):
+        self.scheduler = RequestScheduler(max_concurrent=2, min_interval=0)
+        self.calls = []
+
+    def coin_not_found(self, coin_id):
+        return coin_id == 'missing'
+
+    def get_range_prices(self, coin_id, from_date, to_date, **kwargs):
+        self.calls.append(coin_id)
+        if coin_id in ('missing', 'flaky'):
+            return []
+        price = None if coin_id == 'unlisted' else 1.0
+        return [{'date': from_date, 'price': price}]
+
+
+def test_run_worker_counts_and_retry_policy(tmp_path):
+    queue = JobQueue(str(tmp_path / 'queue.db'), max_attempts=3)
+    queue.enqueue(['bitcoin', 'missing', 'unlisted', 'flaky'], '2026-01-01', '2026-01-01')
+    fetcher = FakeFetcher()
+
+    counts = run_worker(fetcher, queue, worker_id='w', poll_interval=0.01)
+
+    assert (counts['done'], counts['failed'], counts['retried'], counts['discarded']) == (2, 2, 2, 0)
+    assert fetcher.calls.count('missing') == 1  # 404 不重試
+    assert fetcher.calls.count('flaky') == 3
+    assert queue.results()[('unlisted', 'usd')] == [{'date': '2026-01-01', 'price': None}]
+    assert sorted(f['coin_id'] for f in queue.failures()) == ['flaky', 'missing']
@@ -0,0 +1,39 @@
+"""查詢工作串流：工作行解析"""
+
+import pytest
+
+from src.jobs import parse_job_line
+
+
+@pytest.mark.parametrize('line, default, expected', [
+    ('bitcoin 2024-01-01 2024-01-03', 'usd', ('bitcoin', '2024-01-01', '2024-01-03', 'usd')),
+    ('  ethereum,2024-01-01,2024-01-01,EUR \n', 'usd', ('ethereum', '2024-01-01', '2024-01-01', 'eur')),
+    ('{"coin_id": "bitcoin", "from": "2024-01-01", "to": "2024-01-03"}', 'jpy',
+     ('bitcoin', '2024-01-01', '2024-01-03', 'jpy')),
+    ('{"coin_id": "bitcoin", "from_date": "2024-01-01", "to_date": "2024-01-02", "vs_currency": "BTC"}', 'usd',
+     ('bitcoin', '2024-01-01', '2024-01-02', 'btc')),
+])
+def test_parse_valid_lines(line, default, expected):
+    assert parse_job_line(line, default) == expected
+
+
+@pytest.mark.parametrize('line', ['', '   ', '# comment', '  # bitcoin 2024-01-01 2024-01-02'])
+def test_blank_and_comment_lines_are_skipped(line):
+    assert parse_job_line(line) is None
+
+
+@pytest.mark.parametrize('line', [
+    'bitcoin 2024-01-01',
+    'bitcoin 2024-01-01 2024-01-02 usd extra',
+    'bitcoin 2024/01/01 2024-01-02',
+    'bitcoin 2024-01-03 2024-01-01',
+    'bitcoin 2023-01-01 2024-01-01',
+    '{"coin_id": "bitcoin", "from": "2024-01-01"',
+    '{"coin_id": "bitcoin", "from": "2024-01-01"}',
+    '{"coin_id": "bitcoin", "from": 20240101, "to": "2024-01-02"}',
+    '{"coin_id": 1, "from": "2024-01-01", "to": "2024-01-02"}',
+    '{"coin_id": "bitcoin", "from": "2024-01-01", "to": "2024-01-02", "vs_currency": 5}',
+])
+def test_malformed_lines_raise_value_error(line):
+    with pytest.raises(ValueError):
+        parse_job_line(line)
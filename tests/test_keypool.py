@@ -0,0 +1,115 @@
+"""API key 池：分散、配額、停用與額度歸還"""
+
+from src.core import CoinGeckoPriceFetcher
+from src.keypool import KEY_ACTIVE, KEY_EXHAUSTED, KEY_REJECTED, ApiKeyPool, is_quota_exhausted, parse_api_keys
+from src.scheduler import RequestScheduler
+
+
+def ready_now(pool):
+    """讓所有 key 立即就緒（略過每把 key 的請求間隔）"""
+    for state in pool._states:
+        state.next_ready = 0.0
+
+
+def test_parse_api_keys():
+    assert parse_api_keys('KEY1:10, KEY2;\nKEY3') == [('KEY1', 10), ('KEY2', None), ('KEY3', None)]
+    assert parse_api_keys('') == []
+
+
+def test_requests_spread_across_keys():
+    pool = ApiKeyPool(['key-aaaa-1', 'key-bbbb-2', 'key-cccc-3'])
+    picked = []
+    for _ in range(6):
+        ready_now(pool)
+        picked.append(pool.acquire().key)
+    assert sorted(picked) == sorted(['key-aaaa-1', 'key-bbbb-2', 'key-cccc-3'] * 2)
+    assert [u['used'] for u in pool.usage()] == [2, 2, 2]
+
+
+def test_quota_exhausts_key():
+    pool = ApiKeyPool([('key-aaaa-1', 1), ('key-bbbb-2', None)])
+    first = pool.acquire()
+    assert first.key == 'key-aaaa-1' and first.status == KEY_EXHAUSTED
+    ready_now(pool)
+    assert pool.acquire().key == 'key-bbbb-2'
+    ready_now(pool)
+    assert pool.acquire().key == 'key-bbbb-2'
+
+
+def test_reject_and_mark_exhausted_disable_keys():
+    pool = ApiKeyPool(['key-aaaa-1', 'key-bbbb-2'])
+    a, b = pool._states
+    pool.reject(a)
+    pool.mark_exhausted(b)
+    assert (a.status, b.status) == (KEY_REJECTED, KEY_EXHAUSTED)
+    assert not pool.has_active()
+    assert pool.acquire() is None
+
+
+def test_refund_restores_quota():
+    pool = ApiKeyPool([('key-aaaa-1', 1)])
+    state = pool.acquire()
+    assert state.status == KEY_EXHAUSTED
+    pool.refund(state)
+    assert state.status == KEY_ACTIVE and state.used == 0
+    pool.refund(state)
+    assert state.used == 0
+
+
+def test_usage_masks_keys_and_counts():
+    pool = ApiKeyPool([('key-aaaa-1', 5)])
+    state = pool.acquire()
+    pool.report_success(state, 0.1)
+    pool.report_throttle(state, retry_after=0)
+    pool.report_error(state)
+    usage, = pool.usage()
+    assert usage['key'] == 'key-...aa-1'
+    assert (usage['used'], usage['quota'], usage['succeeded'], usage['throttled'], usage['errors']) == (1, 5, 1, 1, 1)
+
+
+def test_is_quota_exhausted():
+    assert is_quota_exhausted('{"status": {"error_message": "You have exceeded your monthly API credit limit"}}')
+    assert not is_quota_exhausted('{"status": {"error_message": "Too many requests"}}')
+    assert not is_quota_exhausted(None)
+
+
+class FakeResponse:
+    def __init__(self, status_code, text='', data=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {}
+        self._data = data
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """第一把 key 回應每月額度用盡的 429，其他 key 正常回應"""
+
+    def __init__(self):
+        self.keys = []
+
+    def get(self, url, params=None, timeout=None):
+        key = params['x_cg_pro_api_key']
+        self.keys.append(key)
+        if key == 'key-aaaa-1':
+            return FakeResponse(429, 'You have exceeded your monthly API credit limit')
+        return FakeResponse(200, data={'ok': True})
+
+
+def test_credit_limit_429_marks_key_exhausted():
+    fetcher = CoinGeckoPriceFetcher(api_key=['key-aaaa-1', 'key-bbbb-2'],
+                                    scheduler=RequestScheduler(max_concurrent=4, min_interval=0))
+    fetcher.session = FakeSession()
+    ready_now(fetcher.key_pool)
+    data = fetcher._request_json('ping', f"{fetcher.BASE_URL}/ping", {}, max_retries=3)
+    assert data == {'ok': True}
+    assert fetcher.session.keys == ['key-aaaa-1', 'key-bbbb-2']
+    assert [u['status'] for u in fetcher.get_key_usage()] == [KEY_EXHAUSTED, KEY_ACTIVE]
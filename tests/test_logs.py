@@ -0,0 +1,39 @@
+"""結構化日誌：上下文欄位與重複警告限流"""
+
+import io
+import json
+
+import pytest
+
+from src.logs import configure_logging, get_logger, log_context
+
+
+@pytest.fixture
+def stream():
+    stream = io.StringIO()
+    configure_logging('warning', 'json', stream=stream, rate_limit=60)
+    yield stream
+    configure_logging()
+
+
+def _records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_context_fields_attached(stream):
+    with log_context(coin_id='bitcoin', vs_currency='usd'):
+        get_logger('test').warning("hello %s", 'world')
+    record, = _records(stream)
+    assert record['message'] == 'hello world'
+    assert (record['coin_id'], record['vs_currency']) == ('bitcoin', 'usd')
+
+
+def test_repeated_warning_suppressed_per_coin(stream):
+    log = get_logger('test')
+    for coin_id in ('bitcoin', 'bitcoin', 'ethereum', 'bitcoin'):
+        with log_context(coin_id=coin_id):
+            log.warning("API 請求過於頻繁 (429)")
+    log.error("errors are never suppressed")
+    log.error("errors are never suppressed")
+    assert [(r.get('coin_id'), r['level']) for r in _records(stream)] == [
+        ('bitcoin', 'warning'), ('ethereum', 'warning'), (None, 'error'), (None, 'error')]
@@ -0,0 +1,90 @@
+"""投資組合：持倉檔讀取與估值"""
+
+import json
+
+import pytest
+
+from src.portfolio import PortfolioValuation, load_holdings, value_portfolio
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_load_csv_with_dates(tmp_path):
+    path = write(tmp_path, 'h.csv', 'coin_id,quantity,date\nbitcoin,2,2024-01-03\nbitcoin,1,\nethereum,5,\n')
+    assert load_holdings(path) == {'bitcoin': [(None, 1.0), ('2024-01-03', 2.0)], 'ethereum': [(None, 5.0)]}
+
+
+def test_load_csv_sums_duplicate_entries(tmp_path):
+    path = write(tmp_path, 'h.csv', 'coin_id,quantity\nbitcoin,1\nbitcoin,2\n')
+    assert load_holdings(path) == {'bitcoin': [(None, 3.0)]}
+
+
+def test_load_json(tmp_path):
+    path = write(tmp_path, 'h.json', json.dumps({
+        'bitcoin': 0.5,
+        'ethereum': [{'date': '2024-01-02', 'quantity': 3}, {'date': '2024-01-02', 'quantity': 1}],
+    }))
+    assert load_holdings(path) == {'bitcoin': [(None, 0.5)], 'ethereum': [('2024-01-02', 4.0)]}
+
+
+@pytest.mark.parametrize('name, text', [
+    ('h.json', '{"bitcoin": [1, 2]}'),
+    ('h.json', '{"bitcoin": [{"date": 20240101, "quantity": 1}]}'),
+    ('h.json', '{"bitcoin": [{"date": "2024-01-01"}]}'),
+    ('h.json', '{"bitcoin": {"quantity": 1}}'),
+    ('h.json', '[1, 2]'),
+    ('h.json', '{}'),
+    ('h.json', '{bad json'),
+    ('h.csv', 'coin,amount\nbitcoin,1\n'),
+    ('h.csv', 'coin_id,quantity\nbitcoin,abc\n'),
+    ('h.csv', 'coin_id,quantity,date\nbitcoin,1,2024/01/01\n'),
+])
+def test_malformed_holdings_raise_value_error(tmp_path, name, text):
+    with pytest.raises(ValueError):
+        load_holdings(write(tmp_path, name, text))
+
+
+def test_missing_file_raises_value_error(tmp_path):
+    with pytest.raises(ValueError):
+        load_holdings(str(tmp_path / 'missing.csv'))
+
+
+def test_value_portfolio():
+    holdings = {'bitcoin': [(None, 1.0), ('2024-01-03', 2.0)], 'ethereum': [('2024-01-02', 10.0)]}
+    prices = {
+        'bitcoin': [{'date': '2024-01-01', 'price': 100.0}, {'date': '2024-01-02', 'price': None},
+                    {'date': '2024-01-03', 'price': 110.0}],
+        'ethereum': [{'date': '2024-01-02', 'price': 5.0}, {'date': '2024-01-03', 'price': 6.0}],
+    }
+    valuation = value_portfolio(holdings, prices, '2024-01-01', '2024-01-03')
+    assert valuation.coin_ids == ['bitcoin', 'ethereum']
+    assert valuation.quantities == [[1.0, 0.0], [1.0, 10.0], [2.0, 10.0]]
+    # 缺漏價格以前一日延續；期初前無價格
+    assert valuation.prices == [[100.0, None], [100.0, 5.0], [110.0, 6.0]]
+    assert valuation.totals == [100.0, 150.0, 280.0]
+    # 損益只計前一日持有部位的價格變動，不含加碼
+    assert valuation.daily_pnl == [0.0, 0.0, 20.0]
+    assert valuation.cumulative_pnl == [0.0, 0.0, 20.0]
+    assert valuation.missing == [0, 0, 0]
+
+    summary = valuation.summary()
+    assert summary['end_value'] == 280.0
+    assert summary['return_pct'] == 20.0
+    assert summary['coins']['bitcoin']['pnl'] == 10.0
+    assert summary['coins']['ethereum']['pnl_share'] == 0.5
+    assert summary['coins']['bitcoin']['weight'] == 220.0 / 280.0
+
+
+def test_valuation_counts_missing_prices():
+    valuation = PortfolioValuation(['2024-01-01', '2024-01-02'], ['bitcoin'], [[1.0], [1.0]], [[None], [50.0]])
+    assert valuation.missing == [1, 0]
+    assert valuation.totals == [0.0, 50.0]
+    assert valuation.daily_pnl == [0.0, 0.0]
+    rows = valuation.to_rows()
+    assert rows[1] == {'date': '2024-01-02', 'value': 50.0, 'pnl': 0.0, 'cumulative_pnl': 0.0,
+                       'missing': 0, 'coins': {'bitcoin': 50.0}}
+    assert valuation.summary()['return_pct'] is None
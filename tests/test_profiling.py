@@ -0,0 +1,30 @@
+"""效能分析：span 紀錄與多執行緒 cProfile"""
+
+import threading
+
+from src.profiling import Profiler, span
+
+
+def _worker_only_function():
+    return sum(range(1000))
+
+
+def test_spans_recorded_only_while_active():
+    with span('ignored'):
+        pass
+    with Profiler() as profiler:
+        with span('phase', coin_id='bitcoin'):
+            pass
+    assert [row['name'] for row in profiler.summary()] == ['phase']
+
+
+def test_cprofile_includes_worker_threads(tmp_path):
+    profiler = Profiler(use_cprofile=True).start()
+    thread = threading.Thread(target=_worker_only_function)
+    thread.start()
+    thread.join()
+    profiler.stop()
+
+    assert '_worker_only_function' in profiler.format_cprofile(limit=None)
+    assert profiler.save_cprofile(str(tmp_path / 'out.pstats'))
+    assert threading._profile_hook is None
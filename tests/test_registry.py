@@ -0,0 +1,87 @@
+"""幣種目錄：代號解析、搜尋排序與同步差異"""
+
+import json
+
+import pytest
+
+from src.registry import AmbiguousCoinError, CoinRegistry
+from src.scheduler import PRIORITY_PREFETCH
+
+
+COINS = [
+    {'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'},
+    {'id': 'bitcoin-wrapped-fake', 'symbol': 'btc', 'name': 'Bitcoin Wrapped Fake'},
+    {'id': 'ethereum', 'symbol': 'eth', 'name': 'Ethereum'},
+    {'id': 'alpha-one', 'symbol': 'dup', 'name': 'Alpha One'},
+    {'id': 'beta-two', 'symbol': 'dup', 'name': 'Beta Two'},
+    {'id': 'bitcoin-cash', 'symbol': 'bch', 'name': 'Bitcoin Cash'},
+]
+
+
+class FakeFetcher:
+    def __init__(self, coins):
+        self.coins = coins
+        self.priorities = []
+
+    def get_coin_list(self, cancellation_check=None, priority=None):
+        self.priorities.append(priority)
+        return self.coins
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = CoinRegistry(path=str(tmp_path / 'registry.json'))
+    registry.refresh(FakeFetcher(COINS))
+    return registry
+
+
+def test_resolve_prefers_builtin_coins(registry):
+    assert registry.resolve('BTC') == 'bitcoin'
+    assert registry.resolve('Ethereum') == 'ethereum'
+    assert registry.resolve('bitcoin-wrapped-fake') == 'bitcoin-wrapped-fake'
+
+
+def test_resolve_ambiguous_symbol(registry):
+    with pytest.raises(AmbiguousCoinError) as excinfo:
+        registry.resolve('dup')
+    assert [coin['id'] for coin in excinfo.value.candidates] == ['beta-two', 'alpha-one']
+
+
+def test_resolve_unknown(registry):
+    assert registry.resolve('nope-coin') == 'nope-coin'
+    with pytest.raises(ValueError):
+        registry.resolve('nope-coin', strict=True)
+
+
+def test_search_ordering(registry):
+    # 完全相符的代號優先（內建幣種在前），其次為前綴，再來是子字串
+    assert [coin['id'] for coin in registry.search('btc')][:2] == ['bitcoin', 'bitcoin-wrapped-fake']
+    ids = [coin['id'] for coin in registry.search('bitc')]
+    assert ids[0] == 'bitcoin' and set(ids) >= {'bitcoin-cash', 'bitcoin-wrapped-fake'}
+    # 名稱中的單字前綴相符者排在子字串相符（如 network）之前
+    assert [coin['id'] for coin in registry.search('two')][0] == 'beta-two'
+    assert [coin['id'] for coin in registry.search('etherium')] == ['ethereum']
+    assert registry.search('  ') == []
+
+
+def test_refresh_diff_and_cache(tmp_path):
+    path = str(tmp_path / 'registry.json')
+    registry = CoinRegistry(path=path)
+    fetcher = FakeFetcher(COINS)
+    first = registry.refresh(fetcher)
+    assert fetcher.priorities == [PRIORITY_PREFETCH]
+    assert first['added'] == ['alpha-one', 'beta-two', 'bitcoin-wrapped-fake']
+    assert first['removed'] == []
+
+    changed = [coin for coin in COINS if coin['id'] != 'alpha-one'] + [{'id': 'gamma', 'symbol': 'gam', 'name': 'Gamma'}]
+    changed[2] = {'id': 'ethereum', 'symbol': 'eth', 'name': 'Ether'}
+    diff = registry.refresh(FakeFetcher(changed))
+    # 內建幣種不會因 API 目錄缺少而移除
+    assert diff == {'added': ['gamma'], 'removed': ['alpha-one'], 'updated': ['ethereum']}
+    assert registry.refresh(FakeFetcher(changed)) == {'added': [], 'removed': [], 'updated': []}
+
+    with open(path, 'r', encoding='utf-8') as f:
+        assert 'gamma' in {coin['id'] for coin in json.load(f)['coins']}
+    reloaded = CoinRegistry(path=path)
+    assert reloaded.load() and reloaded.resolve('GAM') == 'gamma'
+    assert registry.refresh(FakeFetcher([])) is None
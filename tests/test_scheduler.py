@@ -0,0 +1,107 @@
+"""排程器的優先順序、保留名額與取消時的許可歸還"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.cancel import CancellationToken
+from src.core import CoinGeckoPriceFetcher
+from src.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, RequestScheduler
+
+
+def test_slot_releases_permit():
+    scheduler = RequestScheduler(max_concurrent=2, min_interval=0)
+    with scheduler.slot() as acquired:
+        assert acquired
+        assert scheduler._in_flight == 1
+    assert scheduler._in_flight == 0
+
+
+def test_acquire_cancelled_does_not_take_permit():
+    scheduler = RequestScheduler(max_concurrent=1, min_interval=0)
+    assert scheduler.acquire()
+    token = CancellationToken(timeout=0.2)
+    assert not scheduler.acquire(PRIORITY_INTERACTIVE, token)
+    scheduler.release()
+    assert scheduler._in_flight == 0
+
+
+def test_send_cancelled_while_queued_returns_permit_and_key():
+    fetcher = CoinGeckoPriceFetcher(api_key=[('test-key-1234', 3)],
+                                    scheduler=RequestScheduler(max_concurrent=4, min_interval=0))
+    # 唯一的工作執行緒被占住，主請求只能在執行緒池中排隊
+    fetcher._executor = ThreadPoolExecutor(max_workers=1)
+    blocker = threading.Event()
+    fetcher._executor.submit(blocker.wait)
+    try:
+        token = CancellationToken(timeout=0.3)
+        response, latency, key_state = fetcher._send(f"{fetcher.BASE_URL}/ping", {}, PRIORITY_INTERACTIVE, token)
+        assert response is None
+        assert fetcher.scheduler._in_flight == 0
+        assert [usage['used'] for usage in fetcher.get_key_usage()] == [0]
+    finally:
+        blocker.set()
+        fetcher._executor.shutdown(wait=True)
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待逾時"
+        time.sleep(0.01)
+
+
+def test_interactive_jumps_ahead_of_queued_waiters():
+    scheduler = RequestScheduler(max_concurrent=1, min_interval=0)
+    assert scheduler.acquire()
+    order = []
+
+    def worker(priority, name):
+        with scheduler.slot(priority):
+            order.append(name)
+
+    threads = []
+    for priority, name in ((PRIORITY_PREFETCH, 'prefetch'), (PRIORITY_BATCH, 'batch'),
+                           (PRIORITY_INTERACTIVE, 'interactive')):
+        thread = threading.Thread(target=worker, args=(priority, name))
+        thread.start()
+        threads.append(thread)
+        _wait_until(lambda n=name: scheduler.snapshot()['waiting'][n] == 1)
+
+    scheduler.release()
+    for thread in threads:
+        thread.join(timeout=2)
+    assert order == ['interactive', 'batch', 'prefetch']
+    assert scheduler.snapshot()['dispatched'] == {'interactive': 2, 'batch': 1, 'prefetch': 1}
+
+
+def test_reserved_interactive_slot_stays_free_under_batch_load():
+    scheduler = RequestScheduler(max_concurrent=3, min_interval=0, reserved_interactive=1)
+    stop = threading.Event()
+    acquired = []
+
+    def batch_worker():
+        if scheduler.acquire(PRIORITY_BATCH, stop.is_set):
+            acquired.append(1)
+            stop.wait()
+            scheduler.release()
+
+    threads = [threading.Thread(target=batch_worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    try:
+        _wait_until(lambda: scheduler.snapshot()['waiting']['batch'] == 3)
+        # 批量查詢最多占用 併發上限 - 保留名額
+        assert scheduler._in_flight == 2 and len(acquired) == 2
+        token = CancellationToken(timeout=1.0)
+        assert scheduler.acquire(PRIORITY_INTERACTIVE, token)
+        assert scheduler._in_flight == 3
+        scheduler.release()
+        # 歸還後保留名額仍不會被排隊中的批量請求取得
+        time.sleep(0.1)
+        assert scheduler._in_flight == 2 and len(acquired) == 2
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=2)
+    assert scheduler._in_flight == 0
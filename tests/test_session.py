@@ -0,0 +1,61 @@
+"""GUI 工作階段：存取與需重新驗證的區間"""
+
+import json
+from datetime import datetime, timezone
+
+from src.session import load_session, save_session, unsettled_window
+from src.storage import PriceStore
+
+
+def _utc(text):
+    return datetime.strptime(text, "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc)
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / 'session.json')
+    store = PriceStore()
+    store.update('bitcoin', [{'date': '2026-09-01', 'price': 1.5}, {'date': '2026-09-02', 'price': None},
+                             {'date': '2026-09-03', 'price': 2.5}])
+    store.update('ethereum@eur', [{'date': '2026-09-01', 'price': 3.0}])
+    settings = {'coin': 'bitcoin', 'from_date': '2026-09-01', 'to_date': '2026-09-02', 'vs_currency': 'usd'}
+    results = [{'key': 'bitcoin', 'from_date': '2026-09-01', 'to_date': '2026-09-02', 'fetched_at': 100.0},
+               {'key': 'ethereum@eur', 'from_date': '2026-09-01', 'to_date': '2026-09-01', 'fetched_at': 200.0}]
+    save_session(settings, results, store, current=('bitcoin', '2026-09-01', '2026-09-02'), path=path)
+
+    session = load_session(path)
+    assert session['settings'] == settings
+    assert session['current'] == ('bitcoin', '2026-09-01', '2026-09-02')
+    # 只保存結果區間內的價格
+    assert session['results'][0] == dict(results[0], prices=[{'date': '2026-09-01', 'price': 1.5},
+                                                             {'date': '2026-09-02', 'price': None}])
+    assert session['results'][1]['prices'] == [{'date': '2026-09-01', 'price': 3.0}]
+
+
+def test_load_rejects_missing_corrupt_or_old_files(tmp_path):
+    assert load_session(str(tmp_path / 'missing.json')) is None
+    corrupt = tmp_path / 'corrupt.json'
+    corrupt.write_text('{not json', encoding='utf-8')
+    assert load_session(str(corrupt)) is None
+    old = tmp_path / 'old.json'
+    old.write_text(json.dumps({'version': 0, 'results': []}), encoding='utf-8')
+    assert load_session(str(old)) is None
+    bad = tmp_path / 'bad.json'
+    bad.write_text(json.dumps({'version': 1, 'results': [{'key': 'bitcoin'}]}), encoding='utf-8')
+    assert load_session(str(bad)) is None
+
+
+def _entry(fetched_at):
+    dates = ['2026-09-01', '2026-09-02', '2026-09-03', '2026-09-04', '2026-09-05', '2026-09-06']
+    return {'from_date': dates[0], 'to_date': dates[-1], 'fetched_at': _utc(fetched_at).timestamp(),
+            'prices': [{'date': d, 'price': 1.0} for d in dates]}
+
+
+def test_unsettled_window():
+    # 取得時間往前 24 小時（09-04 12:00）仍未結算的是 09-05 起（09-05 於 09-04 16:00 結算）
+    entry = _entry('2026-09-05 12:00')
+    assert unsettled_window(entry, now=_utc('2026-09-06 00:00')) == ('2026-09-05', '2026-09-06')
+    # 這些日期目前仍未結算：不必重新查詢
+    assert unsettled_window(entry, now=_utc('2026-09-04 15:00')) is None
+    # 取得時早已結算超過一天
+    assert unsettled_window(_entry('2026-09-10 00:00'), now=_utc('2026-09-20 00:00')) is None
+    assert unsettled_window(entry, now=_utc('2026-09-06 00:00'), grace=0) == ('2026-09-06', '2026-09-06')
@@ -0,0 +1,58 @@
+"""每日結算規則的日期對應"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from src.bars import GRANULARITY_DAILY, aggregate_bars, convert_bars
+from src.settlement import (DEFAULT_POLICY, POLICY_TAIPEI_CLOSE, POLICY_UTC16, POLICY_UTC_CLOSE, get_policy,
+                            select_samples)
+
+
+def _ms(text):
+    return int(datetime.strptime(text, "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+@pytest.mark.parametrize('policy, settlement, date_str', [
+    (POLICY_UTC16, '2026-08-31 16:00', '2026-09-01'),
+    (POLICY_UTC_CLOSE, '2026-09-02 00:00', '2026-09-01'),
+    (POLICY_TAIPEI_CLOSE, '2026-09-01 16:00', '2026-09-01'),
+])
+def test_builtin_policy_day_mapping(policy, settlement, date_str):
+    assert policy.settlement_ms(date_str) == _ms(settlement)
+    # 結算時刻起屬於該日，前一分鐘仍屬於前一日
+    assert policy.settlement_date(_ms(settlement)) == date_str
+    assert policy.settlement_date(_ms(settlement) - 60000) < date_str
+    assert policy.is_settled(date_str, datetime.fromtimestamp(_ms(settlement) / 1000, tz=timezone.utc))
+
+
+def test_get_policy():
+    assert get_policy(None) is DEFAULT_POLICY is POLICY_UTC16
+    assert get_policy('taipei-close') is POLICY_TAIPEI_CLOSE
+    with pytest.raises(ValueError):
+        get_policy('nope')
+
+
+def test_select_samples_takes_first_sample_from_settlement_time():
+    prices = [[_ms('2026-09-01 16:05'), 3.0], [_ms('2026-08-31 16:05'), 1.0], [_ms('2026-08-31 17:00'), 2.0],
+              [_ms('2026-09-02 00:05'), 4.0]]
+    selected = select_samples(prices, [POLICY_UTC16, POLICY_UTC_CLOSE])
+    daily = {name: {d: p for d, (_, p) in samples.items()} for name, samples in selected.items()}
+    assert daily['utc16'] == {'2026-09-01': 1.0, '2026-09-02': 3.0}
+    assert daily['utc-close'] == {'2026-08-30': 1.0, '2026-08-31': 3.0, '2026-09-01': 4.0}
+
+
+@pytest.mark.parametrize('policy, expected', [
+    (POLICY_UTC16, [('2026-09-01', '2026-08-31 16:00', 1.0, 2.0), ('2026-09-02', '2026-09-01 16:00', 3.0, 4.0)]),
+    # 日 K 與每日價格同一日期：日期 D 的 K 線自 D 的結算時刻起算
+    (POLICY_UTC_CLOSE, [('2026-08-30', '2026-08-31 00:00', 1.0, 2.0), ('2026-08-31', '2026-09-01 00:00', 3.0, 4.0)]),
+])
+def test_daily_bars_follow_policy(policy, expected):
+    prices = [[_ms('2026-08-31 16:05'), 1.0], [_ms('2026-08-31 17:00'), 2.0], [_ms('2026-09-01 16:05'), 3.0],
+              [_ms('2026-09-01 20:00'), 4.0]]
+    bars = list(aggregate_bars(prices, granularity=GRANULARITY_DAILY, policy=policy))
+    assert [(b['time'], b['timestamp'], b['open'], b['close']) for b in bars] == [
+        (label, _ms(start), open_, close) for label, start, open_, close in expected]
+    # 匯率依同一規則的結算日期套用
+    rates = {label: 2.0 for label, *_ in expected[:1]}
+    assert [b['close'] for b in convert_bars(bars, rates, policy)] == [expected[0][3] * 2]
@@ -0,0 +1,108 @@
+"""本地價格儲存：區間統計、週期彙總與增量合併"""
+
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from src.storage import PriceSeries, PriceStore
+from src.utils import calculate_statistics
+
+
+def _dates(start, days):
+    first = date.fromisoformat(start)
+    return [(first + timedelta(days=i)).isoformat() for i in range(days)]
+
+
+def _random_prices(rng, dates):
+    return [{'date': d, 'price': None if rng.random() < 0.15 else rng.randint(1, 100000) / 100} for d in dates]
+
+
+def _assert_same_stats(actual, expected):
+    if expected['avg'] is None:
+        assert actual['avg'] is None
+    else:
+        assert actual['avg'] == pytest.approx(expected['avg'])
+    assert {k: actual[k] for k in ('max', 'min', 'valid_count', 'total_count')} == \
+        {k: expected[k] for k in ('max', 'min', 'valid_count', 'total_count')}
+
+
+def test_range_statistics_matches_full_scan():
+    rng = random.Random(7)
+    dates = _dates('2023-11-20', 300)
+    prices = _random_prices(rng, dates)
+    store = PriceStore()
+    store.update('bitcoin', prices)
+    for _ in range(200):
+        lo = rng.randrange(len(dates))
+        hi = rng.randrange(lo, len(dates))
+        window = prices[lo:hi + 1]
+        _assert_same_stats(store.range_statistics('bitcoin', dates[lo], dates[hi]), calculate_statistics(window))
+
+
+def test_incremental_merge_matches_single_build():
+    rng = random.Random(11)
+    dates = _dates('2024-12-01', 120)
+    final = {}
+    incremental = PriceSeries()
+    # 依序追加、覆蓋中段與補上缺漏，最後與一次建立的序列比較
+    for _ in range(40):
+        lo = rng.randrange(len(dates))
+        chunk = _random_prices(rng, dates[lo:lo + rng.randint(1, 10)])
+        incremental.merge(chunk)
+        for item in chunk:
+            if item['price'] is not None or item['date'] not in final:
+                final[item['date']] = item['price']
+
+    rebuilt = PriceSeries()
+    rebuilt.merge([{'date': d, 'price': p} for d, p in final.items()])
+    assert incremental.to_list() == rebuilt.to_list()
+    assert incremental._min_table == rebuilt._min_table
+    assert incremental._max_table == rebuilt._max_table
+    for period in ('weekly', 'monthly', 'yearly'):
+        assert incremental.rollup(period) == rebuilt.rollup(period)
+    for _ in range(100):
+        lo = rng.randrange(len(incremental.dates))
+        hi = rng.randrange(lo, len(incremental.dates))
+        _assert_same_stats(incremental.range_statistics(incremental.dates[lo], incremental.dates[hi]),
+                           calculate_statistics(incremental.to_list(incremental.dates[lo], incremental.dates[hi])))
+
+
+def test_none_keeps_stored_price_unless_replace():
+    store = PriceStore()
+    store.update('bitcoin', [{'date': '2024-01-01', 'price': 10.0}, {'date': '2024-01-02', 'price': 20.0}])
+    merged = store.update('bitcoin', [{'date': '2024-01-02', 'price': None}, {'date': '2024-01-03', 'price': None}])
+    # 回傳的列與統計一致
+    assert merged == [{'date': '2024-01-02', 'price': 20.0}, {'date': '2024-01-03', 'price': None}]
+    assert store.range_statistics('bitcoin', '2024-01-02', '2024-01-03') == calculate_statistics(merged)
+
+    store.update('bitcoin', [{'date': '2024-01-02', 'price': None}], replace=True)
+    assert store.to_list('bitcoin')[1] == {'date': '2024-01-02', 'price': None}
+    assert store.range_statistics('bitcoin')['avg'] == 10.0
+
+
+def test_weekly_rollup_spans_year_end():
+    series = PriceSeries()
+    # 2024-12-29 為週日（2024-W52），2024-12-30 起屬於 ISO 2025-W01（至 2025-01-05）
+    series.merge([{'date': d, 'price': float(i + 1)} for i, d in enumerate(_dates('2024-12-28', 10))])
+    weekly = series.rollup('weekly')
+    assert [(b['period'], b['from_date'], b['to_date'], b['count']) for b in weekly] == [
+        ('2024-W52', '2024-12-28', '2024-12-29', 2),
+        ('2025-W01', '2024-12-30', '2025-01-05', 7),
+        ('2025-W02', '2025-01-06', '2025-01-06', 1),
+    ]
+    assert (weekly[1]['mean'], weekly[1]['min'], weekly[1]['max'], weekly[1]['last']) == (6.0, 3.0, 9.0, 9.0)
+
+
+def test_monthly_and_yearly_rollup_boundaries():
+    series = PriceSeries()
+    series.merge([{'date': '2024-12-31', 'price': 1.0}, {'date': '2025-01-01', 'price': 3.0},
+                  {'date': '2025-01-31', 'price': None}, {'date': '2025-02-01', 'price': 5.0}])
+    monthly = series.rollup('monthly')
+    assert [(b['period'], b['count'], b['mean']) for b in monthly] == [
+        ('2024-12', 1, 1.0), ('2025-01', 1, 3.0), ('2025-02', 1, 5.0)]
+    assert monthly[1]['to_date'] == '2025-01-31'
+    assert [(b['period'], b['mean']) for b in series.rollup('yearly')] == [('2024', 1.0), ('2025', 4.0)]
+    assert [b['period'] for b in series.rollup('monthly', '2025-01-15', '2025-02-01')] == ['2025-01', '2025-02']
+    with pytest.raises(ValueError):
+        series.rollup('daily')
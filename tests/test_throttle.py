@@ -0,0 +1,29 @@
+"""自適應流量控制"""
+
+from src.throttle import AdaptiveLimiter, parse_retry_after
+
+
+def test_additive_increase_up_to_max():
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=3, initial_interval=0.5, min_interval=0.2)
+    for _ in range(50):
+        limiter.on_success(0.1)
+    assert limiter.limit == 3
+    assert abs(limiter.interval - 0.2) < 1e-9
+
+
+def test_throttle_halves_limit_and_backs_off():
+    limiter = AdaptiveLimiter(initial_limit=8, max_limit=8, initial_interval=0.5, max_interval=10.0)
+    assert limiter.on_throttle() == 2.0
+    assert limiter.on_throttle() == 4.0
+    assert limiter.limit == 2
+    assert abs(limiter.interval - 2.0) < 1e-9
+    assert limiter.on_throttle(retry_after=7) == 7
+    limiter.on_success(0.1)
+    assert limiter.on_throttle() == 2.0  # 成功後重設退避
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('5') == 5.0
+    assert parse_retry_after('') is None
+    assert parse_retry_after('garbage') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
@@ -0,0 +1,16 @@
+"""價格 CSV 的輸出與讀取"""
+
+from src.utils import is_price_csv, load_from_csv, save_to_csv
+
+def test_price_csv_round_trip(tmp_path):
+    prices = [{'date': '2026-09-01', 'price': 1.5}, {'date': '2026-09-02', 'price': None}]
+    path = save_to_csv(prices, 'bitcoin@eur', '2026-09-01', '2026-09-02', str(tmp_path / 'bitcoin@eur.csv'),
+                       currency='eur')
+    assert is_price_csv(path)
+    assert load_from_csv(path) == prices
+
+def test_other_csv_is_not_price_csv(tmp_path):
+    path = tmp_path / 'portfolio_2026-09-01_2026-09-02.csv'
+    path.write_text('Date,Value (USD),P&L (USD),Cumulative P&L (USD)\n2026-09-01,1,0,0\n', encoding='utf-8')
+    assert not is_price_csv(str(path))
+    assert not is_price_csv(str(tmp_path / 'missing.csv'))